@@ -0,0 +1,10 @@
+"""
+ASGI entry point for production deployment
+
+    uvicorn asgi:app --host 0.0.0.0 --port $PORT --workers 2
+"""
+from server.app import create_app
+# Imported after server.app, which puts server/ on the path (as the app's own modules expect)
+from routes.asgi_routes import create_asgi_app
+
+app = create_asgi_app(create_app())
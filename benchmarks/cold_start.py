@@ -0,0 +1,143 @@
+"""
+Time-to-first-request of a freshly started server.
+
+Starts the app (one worker) on a seeded catalogue several times and measures,
+from the moment the process is spawned:
+
+- ready:  the first successful /api/health
+- page:   the search page and every asset it references, fetched right after
+- detect: the first /detector/detect upload (the first call to reach OpenAI,
+          here the local stand-in with no latency)
+
+Run it with and without WARMUP=true (--warmup) to see what the background
+warm-up takes off the first detect.
+
+    python benchmarks/cold_start.py --runs 5
+    python benchmarks/cold_start.py --runs 5 --warmup --server uvicorn
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+from fake_openai import start_fake_openai
+from load_bench import free_port, server_env, server_command, canned_descriptions, git_commit
+from synthetic import seed_catalogue, sample_images
+
+READY_POLL_INTERVAL = 0.01
+READY_TIMEOUT = 60
+_ASSET_RE = re.compile(r'(?:href|src)="(/[^"]+\.(?:css|js))"')
+
+
+def one_run(args, data_dir, openai_url, image):
+    """Start a server, time its first requests, stop it; returns milliseconds per milestone"""
+    port = free_port()
+    command, cwd = server_command(args.server, port, 1, args.threads)
+    env = server_env(data_dir, openai_url)
+    if args.warmup:
+        env["WARMUP"] = "true"
+    base_url = f"http://127.0.0.1:{port}"
+    log = open(os.path.join(data_dir, "server.log"), "ab")
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+    timings = {}
+    try:
+        session = requests.Session()
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server exited with {process.returncode}; see {log.name}")
+            if time.perf_counter() - started > READY_TIMEOUT:
+                raise RuntimeError(f"Server did not become ready; see {log.name}")
+            try:
+                if session.get(f"{base_url}/api/health", timeout=1).ok:
+                    break
+            except requests.RequestException:
+                time.sleep(READY_POLL_INTERVAL)
+        timings["ready"] = (time.perf_counter() - started) * 1000
+
+        page_started = time.perf_counter()
+        page = session.get(f"{base_url}/", timeout=30)
+        page.raise_for_status()
+        for asset in _ASSET_RE.findall(page.text):
+            session.get(f"{base_url}{asset}", timeout=30).raise_for_status()
+        timings["page"] = (time.perf_counter() - page_started) * 1000
+
+        if args.warmup_wait:
+            time.sleep(args.warmup_wait)
+        with open(image, "rb") as f:
+            body = f.read()
+        detect_started = time.perf_counter()
+        response = session.post(f"{base_url}/detector/detect", data=body,
+                                headers={"Content-Type": "image/jpeg"}, timeout=120)
+        response.raise_for_status()
+        timings["detect"] = (time.perf_counter() - detect_started) * 1000
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        log.close()
+    return timings
+
+
+def summarize(values):
+    return {
+        "median": round(statistics.median(values), 1),
+        "min": round(min(values), 1),
+        "max": round(max(values), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--items", type=int, default=10000, help="size of the seeded catalogue")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--server", choices=("gunicorn", "uvicorn", "flask"), default="gunicorn")
+    parser.add_argument("--threads", type=int, default=2)
+    parser.add_argument("--warmup", action="store_true", help="start the server with WARMUP=true")
+    parser.add_argument("--warmup-wait", type=float, default=0.0,
+                        help="seconds to wait after the page loads before the first detect")
+    parser.add_argument("--output", help="write the JSON results here as well as to stdout")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="lost-and-found-cold-")
+    fake_server, _, openai_url = start_fake_openai(content=canned_descriptions(args.seed), seed=args.seed)
+    try:
+        seed_catalogue(os.path.join(data_dir, "metadata.db"), args.items, args.seed)
+        images = sample_images(os.path.join(data_dir, "images"), args.runs, args.seed)
+        runs = []
+        for i in range(args.runs):
+            print(f"[INFO] Run {i + 1}/{args.runs}", file=sys.stderr)
+            runs.append(one_run(args, data_dir, openai_url, images[i]))
+        results = {
+            "benchmark": "cold_start",
+            "commit": git_commit(),
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "config": vars(args),
+            "milliseconds": {name: summarize([run[name] for run in runs]) for name in runs[0]},
+        }
+        output = json.dumps(results, indent=2)
+        print(output)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(output + "\n")
+    finally:
+        fake_server.shutdown()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
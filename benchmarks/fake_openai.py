@@ -0,0 +1,141 @@
+"""
+Local stand-in for the OpenAI chat completions API.
+
+Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1 (any
+OPENAI_API_KEY value works) to exercise the gateway's timeouts, retries and
+circuit breaker without network access or cost.
+
+    python benchmarks/fake_openai.py --port 8099 --latency 1.5 --error-rate 0.2
+
+The canned reply can be one JSON object (--content) or a file holding a JSON
+array of them (--content-file), picked at random per request.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_CONTENT = {
+    "category": "bottle",
+    "label": "water bottle",
+    "color": "blue",
+    "condition": "good",
+    "distinctive_features": "stickers on the side",
+}
+
+
+class FakeOpenAIConfig:
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, error_status=503, content=None, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.content = content if content is not None else DEFAULT_CONTENT
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.request_bytes = 0
+        self.lock = threading.Lock()
+
+
+def make_handler(config):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, payload, headers=None):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            with config.lock:
+                config.requests += 1
+                config.request_bytes += length
+                fail = config.random.random() < config.error_rate
+                delay = max(0.0, config.latency + config.random.uniform(-config.jitter, config.jitter))
+                content = config.random.choice(config.content) if isinstance(config.content, list) else config.content
+                if fail:
+                    config.errors += 1
+            time.sleep(delay)
+
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send(404, {"error": {"message": "Not found"}})
+                return
+            if fail:
+                headers = {"Retry-After": "0"} if config.error_status == 429 else None
+                self._send(config.error_status, {"error": {"message": "Injected failure", "type": "server_error"}}, headers)
+                return
+
+            self._send(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "gpt-4o-mini"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content if isinstance(content, str) else json.dumps(content)},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 100, "completion_tokens": 50, "total_tokens": 150},
+            })
+
+    return Handler
+
+
+def start_fake_openai(port=0, **options):
+    """Start the stand-in in a background thread; returns (server, config, base_url)"""
+    config = FakeOpenAIConfig(**options)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, config, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before each response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- seconds added to the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status of injected failures")
+    parser.add_argument("--content", help="JSON object returned as the message content")
+    parser.add_argument("--content-file", help="file with a JSON array of message contents to rotate through")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    content = json.loads(args.content) if args.content else None
+    if args.content_file:
+        with open(args.content_file, "r") as f:
+            content = json.load(f)
+    server, _, base_url = start_fake_openai(
+        port=args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        content=content,
+        seed=args.seed,
+    )
+    print(f"[INFO] Fake OpenAI listening at {base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
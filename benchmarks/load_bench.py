@@ -0,0 +1,419 @@
+"""
+Load scenarios against a real server process, with OpenAI replaced by the local stand-in.
+
+Seeds a synthetic catalogue, starts the app the way it is deployed (gunicorn,
+`--workers 2 --threads 2` by default) on throwaway data directories, and runs:
+
+- detect: concurrent /detector/detect uploads of distinct sample photos
+- poll:   a fleet of /api/item pollers (conditional ?since= requests, plus a
+          share of cold clients fetching the full catalogue)
+- delete: concurrent DELETE /api/item/<filename> of seeded records
+
+Prints one JSON document with throughput, p50/p95/p99 latency, status counts and
+the server's peak RSS per scenario. Save it and pass it as --baseline on
+another commit to flag regressions.
+
+    python benchmarks/load_bench.py --items 10000 --output before.json
+    python benchmarks/load_bench.py --items 10000 --baseline before.json
+"""
+import argparse
+import json
+import os
+import platform
+import queue
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import requests
+
+from fake_openai import start_fake_openai
+from synthetic import seed_catalogue, sample_images, synthetic_records, LABELS, CATEGORIES, COLORS, CONDITIONS, FEATURES
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_DIR = os.path.join(ROOT_DIR, "server")
+SCENARIOS = ("detect", "poll", "delete")
+RSS_SAMPLE_INTERVAL = 0.1
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 2)
+
+
+def canned_descriptions(seed, count=50):
+    """Varied vision replies, so detected items spread over categories like real uploads"""
+    rng = random.Random(seed)
+    return [{
+        "category": rng.choice(CATEGORIES),
+        "label": rng.choice(LABELS).title(),
+        "color": rng.choice(COLORS),
+        "condition": rng.choice(CONDITIONS),
+        "distinctive_features": ", ".join(rng.sample(FEATURES, 2)),
+    } for _ in range(count)]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _children(pid):
+    """Direct and indirect child pids, from /proc (gunicorn workers are children of the arbiter)"""
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                # The command name may contain spaces; the ppid follows the closing parenthesis
+                parents[int(entry)] = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+    tree, frontier = [], [pid]
+    while frontier:
+        current = frontier.pop()
+        tree.append(current)
+        frontier.extend(child for child, parent in parents.items() if parent == current)
+    return tree
+
+
+def tree_rss_bytes(pid):
+    total = 0
+    for member in _children(pid):
+        try:
+            with open(f"/proc/{member}/status", "r") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            continue
+    return total
+
+
+class RssSampler:
+    """Peak resident memory of the server process tree while a scenario runs (Linux only)"""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        if os.path.isdir("/proc"):
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, tree_rss_bytes(self.pid))
+            self._stop.wait(RSS_SAMPLE_INTERVAL)
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    @property
+    def peak_mb(self):
+        return round(self.peak / 1e6, 1) if self.peak else None
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = []
+        self.statuses = Counter()
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def record(self, started, status):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self.lock:
+            self.latencies.append(elapsed_ms)
+            self.statuses[str(status)] += 1
+            if status == "exception" or status >= 500:
+                self.errors += 1
+
+    def summary(self, seconds, sampler):
+        count = len(self.latencies)
+        return {
+            "requests": count,
+            "errors": self.errors,
+            "seconds": round(seconds, 2),
+            "throughput_rps": round(count / seconds, 1) if seconds else None,
+            "latency_ms": {
+                "p50": percentile(self.latencies, 0.50),
+                "p95": percentile(self.latencies, 0.95),
+                "p99": percentile(self.latencies, 0.99),
+                "max": round(max(self.latencies), 2) if self.latencies else None,
+            },
+            "statuses": dict(sorted(self.statuses.items())),
+            "peak_rss_mb": sampler.peak_mb,
+        }
+
+
+def run_workers(count, target):
+    threads = [threading.Thread(target=target, args=(i,), daemon=True) for i in range(count)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started
+
+
+def timed(recorder, call):
+    started = time.perf_counter()
+    try:
+        response = call()
+    except requests.RequestException:
+        recorder.record(started, "exception")
+        return None
+    recorder.record(started, response.status_code)
+    return response
+
+
+def scenario_detect(base_url, args, images):
+    work = queue.Queue()
+    for path in images[:args.detect_requests]:
+        work.put(path)
+    recorder = Recorder()
+
+    def worker(_):
+        session = requests.Session()
+        while True:
+            try:
+                path = work.get_nowait()
+            except queue.Empty:
+                return
+            with open(path, "rb") as f:
+                body = f.read()
+            timed(recorder, lambda: session.post(
+                f"{base_url}/detector/detect", data=body, headers={"Content-Type": "image/jpeg"}, timeout=120
+            ))
+
+    return recorder, lambda: run_workers(args.concurrency, worker)
+
+
+def scenario_poll(base_url, args, images):
+    recorder = Recorder()
+    deadline = time.perf_counter() + args.duration
+    cold = int(round(args.pollers * args.cold_fraction))
+
+    def worker(i):
+        session = requests.Session()
+        version = None
+        while time.perf_counter() < deadline:
+            if i < cold or version is None:
+                # An old client (or a first load) fetching the whole catalogue
+                response = timed(recorder, lambda: session.get(f"{base_url}/api/item", timeout=60))
+            else:
+                response = timed(recorder, lambda: session.get(
+                    f"{base_url}/api/item", params={"since": version},
+                    headers={"If-None-Match": f'W/"catalogue-{version}"'}, timeout=60,
+                ))
+            if response is not None and response.headers.get("X-Catalogue-Version"):
+                version = response.headers["X-Catalogue-Version"]
+            time.sleep(args.poll_interval)
+
+    return recorder, lambda: run_workers(args.pollers, worker)
+
+
+def scenario_delete(base_url, args, images):
+    rng = random.Random(args.seed)
+    filenames = [record["filename"] for record in synthetic_records(args.items, args.seed)]
+    work = queue.Queue()
+    for filename in rng.sample(filenames, min(args.deletes, len(filenames))):
+        work.put(filename)
+    recorder = Recorder()
+
+    def worker(_):
+        session = requests.Session()
+        while True:
+            try:
+                filename = work.get_nowait()
+            except queue.Empty:
+                return
+            timed(recorder, lambda: session.delete(f"{base_url}/api/item/{filename}", timeout=60))
+
+    return recorder, lambda: run_workers(args.concurrency, worker)
+
+
+def server_env(data_dir, openai_url):
+    """Environment pointing the app at throwaway data directories and the OpenAI stand-in"""
+    return dict(
+        os.environ,
+        METADATA_BACKEND="sqlite",
+        METADATA_DB=os.path.join(data_dir, "metadata.db"),
+        UPLOAD_FOLDER=os.path.join(data_dir, "uploads"),
+        JOBS_DIR=os.path.join(data_dir, "jobs"),
+        DESCRIPTION_CACHE_DIR=os.path.join(data_dir, "cache", "descriptions"),
+        VECTOR_INDEX_DIR=os.path.join(data_dir, "cache", "vectors"),
+        METRICS_DIR=os.path.join(data_dir, "cache", "metrics"),
+        MAINTENANCE_STATE_FILE=os.path.join(data_dir, "cache", "maintenance.json"),
+        OPENAI_API_KEY="bench",
+        OPENAI_BASE_URL=openai_url,
+        PYTHONUNBUFFERED="1",
+    )
+
+
+def server_command(server, port, workers, threads):
+    """(command, cwd) starting the app under `server` (gunicorn, uvicorn or flask) on `port`"""
+    if server == "gunicorn":
+        return [sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{port}",
+                "--workers", str(workers), "--threads", str(threads),
+                "--timeout", "120", "app:create_app()"], SERVER_DIR
+    if server == "uvicorn":
+        # The ASGI entry point next to wsgi.py; threads do not apply
+        return [sys.executable, "-m", "uvicorn", "--host", "127.0.0.1", "--port", str(port),
+                "--workers", str(workers), "--log-level", "warning", "asgi:app"], ROOT_DIR
+    return [sys.executable, "-c",
+            f"from app import create_app; create_app().run(host='127.0.0.1', port={port}, threaded=True)"], SERVER_DIR
+
+
+def start_server(args, data_dir, openai_url):
+    port = free_port()
+    command, cwd = server_command(args.server, port, args.workers, args.threads)
+    log = open(os.path.join(data_dir, "server.log"), "wb")
+    process = subprocess.Popen(command, cwd=cwd, env=server_env(data_dir, openai_url), stdout=log, stderr=subprocess.STDOUT)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with {process.returncode}; see {log.name}")
+        try:
+            if requests.get(f"{base_url}/api/health", timeout=1).ok:
+                return process, base_url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"Server did not become ready; see {log.name}")
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=SERVER_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, results, tolerance):
+    """Scenarios whose throughput fell, or p95 latency rose, by more than `tolerance`"""
+    regressions = []
+    for name, current in results["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before:
+            continue
+        if before.get("throughput_rps") and current["throughput_rps"] is not None:
+            change = current["throughput_rps"] / before["throughput_rps"] - 1
+            if change < -tolerance:
+                regressions.append({"scenario": name, "metric": "throughput_rps", "before": before["throughput_rps"],
+                                    "after": current["throughput_rps"], "change": round(change, 3)})
+        p95_before, p95_after = before.get("latency_ms", {}).get("p95"), current["latency_ms"]["p95"]
+        if p95_before and p95_after is not None:
+            change = p95_after / p95_before - 1
+            if change > tolerance:
+                regressions.append({"scenario": name, "metric": "latency_ms.p95", "before": p95_before,
+                                    "after": p95_after, "change": round(change, 3)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--items", type=int, default=10000, help="size of the seeded catalogue (1k-1M)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--server", choices=("gunicorn", "uvicorn", "flask"), default="gunicorn")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=8, help="clients for detect and delete")
+    parser.add_argument("--detect-requests", type=int, default=100)
+    parser.add_argument("--image-dir", help="where sample photos are kept between runs (default: temporary)")
+    parser.add_argument("--pollers", type=int, default=50)
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="seconds each poller waits between requests")
+    parser.add_argument("--cold-fraction", type=float, default=0.1, help="share of pollers fetching the full catalogue")
+    parser.add_argument("--duration", type=float, default=20, help="seconds the poll scenario runs")
+    parser.add_argument("--deletes", type=int, default=500)
+    parser.add_argument("--openai-latency", type=float, default=1.0)
+    parser.add_argument("--openai-jitter", type=float, default=0.3)
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="write the JSON results here as well as to stdout")
+    parser.add_argument("--baseline", help="results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative change reported as a regression")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary data directory")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="lost-and-found-bench-")
+    fake_server, fake_config, openai_url = start_fake_openai(
+        latency=args.openai_latency, jitter=args.openai_jitter, error_rate=args.openai_error_rate,
+        content=canned_descriptions(args.seed), seed=args.seed,
+    )
+    process = None
+    try:
+        print(f"[INFO] Seeding {args.items} records", file=sys.stderr)
+        seed_seconds = seed_catalogue(os.path.join(data_dir, "metadata.db"), args.items, args.seed)
+        images = []
+        if "detect" in args.scenarios:
+            images = sample_images(args.image_dir or os.path.join(data_dir, "images"), args.detect_requests, args.seed)
+
+        process, base_url = start_server(args, data_dir, openai_url)
+        results = {
+            "benchmark": "load",
+            "commit": git_commit(),
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "config": vars(args),
+            "seed_seconds": round(seed_seconds, 2),
+            "idle_rss_mb": round(tree_rss_bytes(process.pid) / 1e6, 1) if os.path.isdir("/proc") else None,
+            "scenarios": {},
+        }
+        scenarios = {"detect": scenario_detect, "poll": scenario_poll, "delete": scenario_delete}
+        for name in args.scenarios:
+            print(f"[INFO] Running {name}", file=sys.stderr)
+            recorder, run = scenarios[name](base_url, args, images)
+            with RssSampler(process.pid) as sampler:
+                seconds = run()
+            results["scenarios"][name] = recorder.summary(seconds, sampler)
+        results["fake_openai"] = {"requests": fake_config.requests, "errors": fake_config.errors}
+
+        if args.baseline:
+            with open(args.baseline, "r") as f:
+                results["regressions"] = compare(json.load(f), results, args.tolerance)
+        output = json.dumps(results, indent=2)
+        print(output)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(output + "\n")
+        if results.get("regressions"):
+            sys.exit(1)
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        fake_server.shutdown()
+        if args.keep:
+            print(f"[INFO] Data kept in {data_dir}", file=sys.stderr)
+        else:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Seeded synthetic catalogues and sample photos for the benchmarks.
+
+The same seed always produces the same records and images, so runs on
+different commits measure the same workload.
+
+    python benchmarks/synthetic.py catalogue --items 100000 --db /tmp/bench.db
+    python benchmarks/synthetic.py images --count 200 --dir /tmp/bench-images
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server"))
+
+try:
+    from PIL import Image, ImageDraw
+except ImportError:  # Only sample_images needs Pillow
+    Image = None
+
+LABELS = ["water bottle", "notebook", "teddy bear", "backpack", "tote bag", "phone", "wrist watch",
+          "wallet", "key ring", "umbrella", "headphones", "scarf", "jacket", "lunch box", "pencil case"]
+CATEGORIES = ["bottle", "book", "toy", "backpack", "bag", "cell_phone", "watch", "wallet", "key", "other"]
+COLORS = ["black", "white", "red", "blue", "green", "yellow", "purple", "pink", "brown", "gray", "silver"]
+CONDITIONS = ["new", "good", "worn", "scratched", "damaged"]
+FEATURES = ["stickers on the side", "name tag", "cracked screen", "leather strap", "metal clip",
+            "floral pattern", "striped lining", "dented lid", "zipper pocket", "keychain attached",
+            "initials engraved", "torn corner", "logo on front", "reflective strip", "rubber grip"]
+QUERIES = ["blue water bottle with stickers", "black leather wallet", "red backpack with zipper pocket",
+           "silver watch metal strap", "phone with cracked screen", "pink teddy bear", "keys on a keychain",
+           "green notebook torn corner", "gray headphones", "striped scarf"]
+
+# Host written into the synthetic image URLs (records carry absolute URLs like real uploads)
+URL_BASE = "http://localhost:8080"
+
+
+def synthetic_records(count, seed=0):
+    """Yield `count` catalogue records shaped like the ones /detector/detect saves"""
+    rng = random.Random(seed)
+    for i in range(count):
+        filename = f"{rng.choice(CATEGORIES)}_bench_{i:07d}.jpg"
+        digest = f"{rng.getrandbits(48):012x}"
+        yield {
+            "timestamp": f"2024{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}_{i % 240000:06d}",
+            "filename": filename,
+            "image_url": f"{URL_BASE}/uploads/{filename}",
+            "thumbnail_url": f"{URL_BASE}/uploads/derived/{digest}_thumb.jpg",
+            "medium_url": f"{URL_BASE}/uploads/derived/{digest}_medium.jpg",
+            "label": rng.choice(LABELS).title(),
+            "category": filename.split("_bench_")[0],
+            "color": rng.choice(COLORS),
+            "condition": rng.choice(CONDITIONS),
+            "distinctive_features": ", ".join(rng.sample(FEATURES, 2)),
+            "image_hash": f"{rng.getrandbits(64):016x}",
+        }
+
+
+def seed_catalogue(db_path, count, seed=0, batch=10000):
+    """
+    Write a synthetic catalogue of `count` records into a fresh SQLite store.
+
+    Returns:
+        Seconds spent inserting
+    """
+    from utils.metadata_utils import SqliteMetadataStore
+
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    store = SqliteMetadataStore(db_path, import_from=None)
+    started = time.perf_counter()
+    pending = []
+    for record in synthetic_records(count, seed):
+        pending.append(record)
+        if len(pending) >= batch:
+            store.insert_many(pending)
+            pending = []
+    if pending:
+        store.insert_many(pending)
+    return time.perf_counter() - started
+
+
+def sample_image(rng, size=(1280, 960)):
+    """A JPEG of random coloured shapes; different seeds give perceptually different photos"""
+    image = Image.new("RGB", size, tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    width, height = size
+    for _ in range(12):
+        x0, y0 = rng.randrange(width), rng.randrange(height)
+        x1, y1 = x0 + rng.randrange(50, width // 2), y0 + rng.randrange(50, height // 2)
+        shape = draw.ellipse if rng.random() < 0.5 else draw.rectangle
+        shape([x0, y0, x1, y1], fill=tuple(rng.randrange(256) for _ in range(3)))
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def sample_images(directory, count, seed=0, size=(1280, 960)):
+    """
+    Write `count` distinct sample photos to `directory` (reused if already there).
+
+    Returns:
+        The image paths
+    """
+    if Image is None:
+        raise RuntimeError("Pillow is required for sample images: pip install 'lost-and-found[images]'")
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"sample_{seed}_{size[0]}x{size[1]}_{i:05d}.jpg")
+        if not os.path.exists(path):
+            rng = random.Random(f"{seed}-{i}")
+            with open(path, "wb") as f:
+                f.write(sample_image(rng, size))
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    catalogue = commands.add_parser("catalogue", help="write a synthetic SQLite catalogue")
+    catalogue.add_argument("--items", type=int, default=10000)
+    catalogue.add_argument("--db", required=True)
+    catalogue.add_argument("--seed", type=int, default=0)
+    images = commands.add_parser("images", help="write sample photos")
+    images.add_argument("--count", type=int, default=100)
+    images.add_argument("--dir", required=True)
+    images.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "catalogue":
+        seconds = seed_catalogue(args.db, args.items, args.seed)
+        print(f"[INFO] Wrote {args.items} records to {args.db} in {seconds:.1f}s")
+    else:
+        paths = sample_images(args.dir, args.count, args.seed)
+        print(f"[INFO] {len(paths)} sample images in {args.dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Query latency of the local vector index on synthetic catalogues.
+
+Builds a throwaway index of N generated item records (no metadata store or
+network involved) and times single and batched top-k queries.
+
+    python benchmarks/vector_bench.py --sizes 10000 100000 --queries 200
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server"))
+
+from utils.vector_index import VectorIndex, get_embedder, vector_search_available  # noqa: E402
+from synthetic import synthetic_records, QUERIES  # noqa: E402
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def bench(size, queries, k, batch, seed):
+    with tempfile.TemporaryDirectory() as directory:
+        index = VectorIndex(directory=directory, embedder=get_embedder())
+        started = time.perf_counter()
+        index.rebuild(list(synthetic_records(size, seed)), version=0)
+        build_seconds = time.perf_counter() - started
+
+        rng = random.Random(seed)
+        texts = [rng.choice(QUERIES) for _ in range(queries)]
+        index.search(texts[0], k)  # warm the page cache
+        latencies = []
+        for text in texts:
+            started = time.perf_counter()
+            index.search(text, k)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        for start in range(0, len(texts), batch):
+            index.search_many(texts[start:start + batch], k)
+        batched_ms = (time.perf_counter() - started) * 1000 / len(texts)
+
+        return {
+            "items": size,
+            "dim": index.embedder.dim,
+            "build_seconds": round(build_seconds, 2),
+            "matrix_mb": round(index.capacity * index.embedder.dim * 4 / 1e6, 1),
+            "query_ms_p50": round(percentile(latencies, 0.50), 2),
+            "query_ms_p95": round(percentile(latencies, 0.95), 2),
+            "query_ms_p99": round(percentile(latencies, 0.99), 2),
+            f"batched_ms_per_query_x{batch}": round(batched_ms, 2),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--batch", type=int, default=32, help="queries per search_many call")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if not vector_search_available():
+        sys.exit("NumPy is required: pip install 'lost-and-found[vectors]'")
+    for size in args.sizes:
+        print(json.dumps(bench(size, args.queries, args.k, args.batch, args.seed)))
+
+
+if __name__ == "__main__":
+    main()
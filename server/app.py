@@ -1,6 +1,11 @@
-from flask import Flask, send_from_directory, jsonify, request
+import time
+
+IMPORT_STARTED = time.perf_counter()
+
+from flask import Flask
 import os
 import sys
+import threading
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -14,91 +19,73 @@ if BASE_DIR not in sys.path:
 from routes.image_routes import image_bp
 from routes.detector_routes import detector_bp
 from routes.item_routes import item_bp
+from routes.search_routes import search_bp
+from routes.metrics_routes import metrics_bp
+from routes.ingest_routes import ingest_bp
+from utils.upload_utils import max_request_bytes
+from utils.profiling import install_profiler
+from utils.maintenance import install_scheduler
+from routes.static_routes import static_bp
+from utils.asset_utils import get_asset_manifest
+from utils.metrics import register_gauge
+
+# Preload the OpenAI SDK and client, the metadata store and the catalogue snapshot in the background at startup
+WARMUP = os.getenv("WARMUP", "false").lower() == "true"
+
+
+def warm_up():
+    """Do the one-off work of a worker's first requests before any request arrives"""
+    started = time.perf_counter()
+    try:
+        from utils.openai_gateway import warm_up as warm_up_openai
+        from utils.metadata_utils import get_store
+        from utils.catalogue_cache import get_catalogue_cache
+        warm_up_openai()
+        get_catalogue_cache().get(get_store())
+        print(f"[INFO] Warm-up finished in {(time.perf_counter() - started) * 1000:.0f} ms")
+    except Exception as e:
+        print(f"[WARNING] Warm-up failed: {e}")
+
 
 def create_app():
     app = Flask(__name__, static_folder="static", static_url_path="/static")
 
     # Base directory & folders
-    UPLOAD_FOLDER = os.path.join(BASE_DIR, "uploads")
+    UPLOAD_FOLDER = os.getenv("UPLOAD_FOLDER", os.path.join(BASE_DIR, "uploads"))
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
     app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
+    # Reject oversized uploads before they are read; imageData form fields may be that large too
+    app.config["MAX_CONTENT_LENGTH"] = max_request_bytes()
+    app.config["MAX_FORM_MEMORY_SIZE"] = max_request_bytes()
 
     # Register blueprints
     app.register_blueprint(image_bp)
     app.register_blueprint(detector_bp)
     app.register_blueprint(item_bp)
+    app.register_blueprint(search_bp)
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(ingest_bp)
+
+    # Samples PROFILE_SAMPLE_RATE of requests with cProfile (off by default)
+    install_profiler(app)
+    # Retention, orphan sweeps and compaction, run by one worker every MAINTENANCE_INTERVAL seconds
+    install_scheduler(app)
 
     @app.route("/api/health")
     def health():
         return {"status": "ok", "message": "Lost & Found AI backend running"}
 
-    client_root = os.path.join(BASE_DIR, "..", "client")
-
-    @app.route("/search")
-    def serve_search():
-        """Serve search.html"""
-        search_file = os.path.join(client_root, "search.html")
-        if os.path.exists(search_file):
-            return send_from_directory(client_root, "search.html")
-        return {"error": "Search page not found"}, 404
-
-    @app.route("/search.css")
-    def serve_search_css():
-        """Serve search.css"""
-        css_file = os.path.join(client_root, "search.css")
-        if os.path.exists(css_file):
-            return send_from_directory(client_root, "search.css")
-        return {"error": "CSS file not found"}, 404
-
-    @app.route("/camera")
-    def serve_camera():
-        """Serve camera.html"""
-        camera_file = os.path.join(client_root, "camera.html")
-        if os.path.exists(camera_file):
-            return send_from_directory(client_root, "camera.html")
-        return {"error": "Camera page not found"}, 404
-
-    @app.route("/camera.css")
-    def serve_camera_css():
-        """Serve camera.css"""
-        css_file = os.path.join(client_root, "camera.css")
-        if os.path.exists(css_file):
-            return send_from_directory(client_root, "camera.css")
-        return {"error": "CSS file not found"}, 404
-
-    @app.route("/shared.css")
-    def serve_shared_css():
-        """Serve shared.css"""
-        css_file = os.path.join(client_root, "shared.css")
-        if os.path.exists(css_file):
-            return send_from_directory(client_root, "shared.css")
-        return {"error": "CSS file not found"}, 404
-
-    @app.route("/utils.js")
-    def serve_utils_js():
-        """Serve utils.js"""
-        js_file = os.path.join(client_root, "utils.js")
-        if os.path.exists(js_file):
-            return send_from_directory(client_root, "utils.js", mimetype="application/javascript")
-        return {"error": "JS file not found"}, 404
-
-    @app.route("/")
-    def home():
-        return serve_search()
-    
-    # Catch-all route for static files (must be last, after all API routes)
-    @app.route("/<path:path>")
-    def serve_static_files(path):
-        # Skip API routes and static assets
-        if any(path.startswith(prefix) for prefix in ["api/", "detector/", "upload", "metadata", "uploads/"]):
-            return {"error": "Not found"}, 404
-
-        requested_file = os.path.join(client_root, path)
-        if os.path.exists(requested_file) and os.path.isfile(requested_file):
-            rel_dir, filename = os.path.split(requested_file)
-            return send_from_directory(rel_dir, filename)
-
-        return {"error": "Not found"}, 404
+    # Pages, CSS/JS and the catch-all for client files, served from the in-memory asset manifest
+    app.register_blueprint(static_bp)
+    get_asset_manifest()
+
+    if WARMUP:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+    startup_seconds = time.perf_counter() - IMPORT_STARTED
+    register_gauge("app_startup_seconds", "Seconds from importing the app to create_app() returning",
+                   lambda: startup_seconds)
+    print(f"[INFO] App ready in {startup_seconds * 1000:.0f} ms")
 
     return app
 
@@ -0,0 +1,67 @@
+"""
+Bulk-load a backlog of photos into the catalogue.
+
+    ingest photos/ event.zip more.tar.gz --concurrency 8
+
+Images already in the catalogue (by SHA-256 of the original file) are
+skipped, so an interrupted run can simply be started again.
+"""
+import os
+import sys
+import json
+import argparse
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from app import create_app
+from routes.ingest_routes import ingest_images, INGEST_CONCURRENCY
+
+
+def main(argv=None):
+    """Entry point for the ingest script"""
+    parser = argparse.ArgumentParser(description="Describe and catalogue every image in folders or archives")
+    parser.add_argument("paths", nargs="+", help="image folders, .zip/.tar(.gz) archives or image files")
+    parser.add_argument("--concurrency", type=int, default=INGEST_CONCURRENCY,
+                        help=f"images processed at once (default {INGEST_CONCURRENCY})")
+    parser.add_argument("--base-url", default=f"http://localhost:{os.getenv('PORT', 8080)}",
+                        help="server address used in the stored image URLs")
+    parser.add_argument("--reuse-duplicates", action="store_true",
+                        help="copy the description of an already catalogued near-duplicate instead of describing the image")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args(argv)
+
+    app = create_app()
+
+    def progress(done, total):
+        if not args.json:
+            print(f"\r  {done}/{total} images processed", end="" if done < total else "\n", file=sys.stderr, flush=True)
+
+    summary = ingest_images(args.paths, app.config["UPLOAD_FOLDER"], args.base_url.rstrip("/"),
+                            concurrency=args.concurrency, progress=progress, reuse_duplicates=args.reuse_duplicates)
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(f"Images found:        {summary['images']}")
+        print(f"Ingested:            {summary['ingested']} "
+              f"({summary['described']} described, {summary['reused_descriptions']} from near-duplicates, "
+              f"{summary['without_description']} without description)")
+        print(f"Near-duplicates:     {summary['near_duplicates']} (look like items already catalogued)")
+        print(f"Already ingested:    {summary['already_ingested']}")
+        print(f"Retried:             {summary['retried']} (stored without description before)")
+        print(f"Repeated in batch:   {summary['repeated_in_batch']}")
+        print(f"Failed:              {len(summary['failed'])}")
+        for failure in summary["failed"]:
+            print(f"  {failure['name']}: {failure['error']}")
+        print(f"Time:                {summary['seconds']} s "
+              f"(staging {summary['stage_seconds']} s, processing {summary['process_seconds']} s)")
+        if summary["images_per_second"] is not None:
+            print(f"Throughput:          {summary['images_per_second']} images/s, "
+                  f"{summary['megabytes_per_second']} MB/s read")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+import os
+import time
+import uuid
+import asyncio
+from routes.detector_routes import (
+    inspect_upload, detection_record, detection_payload, describe_item_async, reused_description,
+    duplicate_warning, join_warnings, upload_timestamp
+)
+from routes.ingest_routes import INGEST_MAX_REQUEST_BYTES
+from utils.metadata_utils import get_async_store
+from utils.event_utils import get_broadcaster, stream_changes_async, ASYNC_MAX_SUBSCRIBERS, RETRY_MS
+from utils.upload_utils import stream_to_file_async, is_raw_image_request, max_request_bytes, UploadTooLarge, MAX_UPLOAD_BYTES
+from utils.asgi_utils import (
+    WsgiBridge, ClientDisconnected, header, mimetype, query_params, body_chunks, send_json, send_stream
+)
+from utils.metrics import (
+    DETECT_STAGE_SECONDS, DETECT_REQUESTS, DETECT_WARNINGS, HTTP_REQUEST_SECONDS, HTTP_REQUESTS
+)
+
+DETECT_CORS = [
+    ("Access-Control-Allow-Origin", "*"),
+    ("Access-Control-Allow-Methods", "POST, OPTIONS"),
+    ("Access-Control-Allow-Headers", "Content-Type"),
+]
+# Status recorded for requests whose client left before a response was sent (nginx's convention)
+CLIENT_CLOSED_REQUEST = 499
+
+
+class AsgiApp:
+    """
+    ASGI front for the Flask app.
+
+    The two requests that spend most of their life waiting are served on the
+    event loop: raw-image uploads to /detector/detect (the camera page's
+    path), whose vision call goes through the AsyncOpenAI client, and the
+    /api/item/stream SSE feed. Everything else, including multipart, base64
+    and ?async=1 uploads, is handed to the Flask app unchanged on a thread
+    pool, so the blueprints behave exactly as under gunicorn.
+    """
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.upload_folder = flask_app.config["UPLOAD_FOLDER"]
+        self.wsgi = WsgiBridge(flask_app, max_body=self.max_body)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        route = self.native_route(scope)
+        if route is None:
+            await self.wsgi(scope, receive, send)
+            return
+        endpoint, handler = route
+        started = time.perf_counter()
+        status = await handler(scope, receive, send)
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+        HTTP_REQUESTS.inc(endpoint=endpoint, method=scope["method"], status=status)
+
+    @staticmethod
+    def max_body(scope):
+        """Body limit enforced before a request reaches Flask (which applies its own per route)"""
+        if scope["path"] == "/api/ingest":
+            return INGEST_MAX_REQUEST_BYTES
+        return max_request_bytes()
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def native_route(self, scope):
+        """(endpoint name, handler) for requests served on the event loop, or None for Flask"""
+        path, method = scope["path"], scope["method"]
+        if path == "/detector/detect" and method == "POST" and is_raw_image_request(mimetype(scope)):
+            if query_params(scope).get("async", "").lower() not in ("1", "true", "yes"):
+                return "detector_bp.detect_image", self.detect
+        if path == "/api/item/stream" and method == "GET":
+            return "item_bp.stream_items", self.stream
+        return None
+
+    async def detect(self, scope, receive, send):
+        """/detector/detect for a raw image body, as detect_image() but without holding a thread"""
+        mode = "sync"
+
+        async def respond(payload, status=200):
+            DETECT_REQUESTS.inc(mode=mode, status=status)
+            if payload.get("warning"):
+                DETECT_WARNINGS.inc(mode=mode)
+            return await send_json(send, payload, status, DETECT_CORS)
+
+        try:
+            ts = upload_timestamp()
+            temp_path = os.path.join(self.upload_folder, f"temp_upload_{ts}_{uuid.uuid4().hex[:8]}.jpg")
+            with DETECT_STAGE_SECONDS.time(stage="temp_write"):
+                await stream_to_file_async(body_chunks(receive), temp_path)
+
+            extension, image_hash, duplicates = await asyncio.to_thread(inspect_upload, temp_path)
+
+            reuse = query_params(scope).get("reuse_duplicate", "").lower() in ("1", "true", "yes")
+            if duplicates and reuse:
+                mode = "duplicate"
+                item_description, description_warning = reused_description(duplicates[0])
+            else:
+                print(f"[INFO] Processing image: {temp_path}")
+                with DETECT_STAGE_SECONDS.time(stage="describe"):
+                    item_description, description_warning = await describe_item_async(temp_path)
+                if duplicates:
+                    description_warning = join_warnings(duplicate_warning(duplicates[0]), description_warning)
+
+            base = f"http://{header(scope, 'host') or 'localhost'}"
+            record = await asyncio.to_thread(
+                detection_record, temp_path, ts, extension, image_hash, item_description, duplicates,
+                base, self.upload_folder,
+            )
+            with DETECT_STAGE_SECONDS.time(stage="metadata_save"):
+                await get_async_store().append(record)
+
+            return await respond(detection_payload(record, description_warning, duplicates), 200)
+
+        except ClientDisconnected:
+            return CLIENT_CLOSED_REQUEST
+        except UploadTooLarge:
+            return await respond({"error": f"Image too large (limit {MAX_UPLOAD_BYTES} bytes)"}, 413)
+        except ValueError as e:
+            return await respond({"error": str(e)}, 400)
+        except Exception as e:
+            print(f"[ERROR] Detection endpoint failed: {e}")
+            return await respond({"error": str(e)}, 500)
+
+    async def stream(self, scope, receive, send):
+        """/api/item/stream on the event loop; see item_routes.stream_items"""
+        cors = [("Access-Control-Allow-Origin", "*")]
+        broadcaster = await asyncio.to_thread(get_broadcaster)
+        last_id = header(scope, "last-event-id") or query_params(scope).get("since")
+        try:
+            last_id = int(last_id) if last_id is not None else broadcaster.version
+        except ValueError:
+            return await send_json(send, {"error": "Last-Event-ID must be an integer version"}, 400, cors)
+
+        if not broadcaster.acquire_subscriber(ASYNC_MAX_SUBSCRIBERS):
+            return await send_json(send, {"error": "Too many open streams"}, 503,
+                                   cors + [("Retry-After", str(RETRY_MS // 1000))])
+        try:
+            await send_stream(receive, send, stream_changes_async(broadcaster, last_id), [
+                ("Content-Type", "text/event-stream; charset=utf-8"),
+                ("Cache-Control", "no-cache"),
+                ("X-Accel-Buffering", "no"),
+            ] + cors)
+        finally:
+            broadcaster.release_subscriber()
+        return 200
+
+
+def create_asgi_app(flask_app=None):
+    if flask_app is None:
+        from app import create_app
+        flask_app = create_app()
+    return AsgiApp(flask_app)
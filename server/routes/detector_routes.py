@@ -2,9 +2,17 @@ from flask import Blueprint, request, jsonify, current_app
 from werkzeug.utils import secure_filename
 from datetime import datetime, timezone
 import os
-import base64
-from utils.metadata_utils import load_metadata, save_metadata
-from utils.openai_utils import generate_item_description
+import uuid
+from werkzeug.exceptions import RequestEntityTooLarge
+from utils.metadata_utils import append_metadata, update_metadata, delete_metadata
+from utils.openai_utils import generate_item_description, generate_item_description_async
+from utils.job_utils import get_job_pool, get_job, register_job_handler, QueueFullError
+from utils.image_utils import preprocess_image, create_derivatives, perceptual_hash
+from utils.image_hash_index import find_similar, DUPLICATE_MAX_DISTANCE, SIMILAR_MAX_DISTANCE
+from utils.metrics import DETECT_STAGE_SECONDS, DETECT_REQUESTS, DETECT_WARNINGS
+from utils.upload_utils import (
+    stream_to_file, decode_base64_to_file, is_raw_image_request, UploadTooLarge, MAX_UPLOAD_BYTES
+)
 
 detector_bp = Blueprint("detector_bp", __name__)
 
@@ -15,6 +23,246 @@ def to_title_case(value: str):
     return " ".join(word.capitalize() for word in value.split())
 
 
+def description_fields(item_description):
+    """Metadata fields derived from an OpenAI item description (all None without one)"""
+    raw_label = item_description.get("label") if item_description else None
+    return {
+        "label": to_title_case(raw_label) if raw_label else None,
+        "color": item_description.get("color") if item_description else None,
+        "condition": item_description.get("condition") if item_description else None,
+        "distinctive_features": item_description.get("distinctive_features") if item_description else None,
+    }
+
+
+def _description_result(item_description):
+    if item_description:
+        print(f"[DEBUG] Item description received: {item_description}")
+        return item_description, None
+    print(f"[DEBUG] Item description is None (API may not be configured or failed)")
+    return None, "AI description service returned no result. Item saved without description."
+
+
+def _description_failed(error):
+    print(f"[WARNING] Could not generate description: {error}")
+    import traceback
+    traceback.print_exc()
+    return None, "Unable to reach the AI description service. Item saved without automatic description."
+
+
+def describe_item(image_path):
+    """Call the description service; returns (description or None, warning or None)"""
+    try:
+        return _description_result(generate_item_description(image_path))
+    except Exception as e:
+        return _description_failed(e)
+
+
+async def describe_item_async(image_path):
+    """describe_item() on the async OpenAI client, for the ASGI server"""
+    try:
+        return _description_result(await generate_item_description_async(image_path))
+    except Exception as e:
+        return _description_failed(e)
+
+
+def run_description_job(filename, image_path):
+    """Background job: describe an already-saved item and fill in its metadata record"""
+    item_description, warning = describe_item(image_path)
+    fields = description_fields(item_description)
+    if item_description and item_description.get("category"):
+        fields["category"] = item_description.get("category")
+    fields["description_status"] = "done" if item_description else "failed"
+    record = update_metadata(filename, fields)
+    if record is None:
+        warning = "Item was deleted before its description arrived."
+    return {"metadata": record, "warning": warning}
+
+
+register_job_handler("describe", run_description_job)
+
+
+def duplicate_summary(record):
+    """What the client is told about a catalogued item that looks like the upload"""
+    return {
+        "filename": record.get("filename"),
+        "label": record.get("label"),
+        "timestamp": record.get("timestamp"),
+        "image_url": record.get("image_url"),
+        "thumbnail_url": record.get("thumbnail_url"),
+        "distance": record.get("distance"),
+    }
+
+
+def duplicate_warning(duplicate):
+    """Warning for an upload that looks like an already catalogued item"""
+    return (
+        f"This looks like an item that is already logged ({duplicate.get('label') or duplicate.get('filename')}, "
+        f"found {duplicate.get('timestamp')}). Check that it is not the same item."
+    )
+
+
+def reused_description(duplicate):
+    """Description of an already catalogued item, reused for a near-identical photo when the client asks"""
+    description = {field: duplicate.get(field) for field in ("category", "color", "condition", "distinctive_features")}
+    description["label"] = duplicate.get("label")
+    warning = (
+        f"This looks like an item that is already logged ({duplicate.get('label') or duplicate.get('filename')}, "
+        f"found {duplicate.get('timestamp')}). Its description was reused."
+    )
+    return description, warning
+
+
+def join_warnings(*warnings):
+    return " ".join(w for w in warnings if w) or None
+
+
+def image_urls(filename, base=None, upload_folder=None):
+    """Public URLs of a stored image and its responsive derivatives"""
+    base = base or f"http://{request.host}"
+    derivatives = create_derivatives(upload_folder or current_app.config["UPLOAD_FOLDER"], filename)
+    urls = {"image_url": f"{base}/uploads/{filename}"}
+    if "thumb" in derivatives:
+        urls["thumbnail_url"] = base + derivatives["thumb"]
+    if "medium" in derivatives:
+        urls["medium_url"] = base + derivatives["medium"]
+    return urls
+
+
+def save_upload(ts):
+    """
+    Write the uploaded image to a temporary file in the upload folder, streaming it.
+
+    Accepts, in order of preference: a raw image request body (e.g. a Blob
+    posted with Content-Type image/jpeg), a multipart `image` file, or base64
+    `imageData` (a data URL) sent either as a file part or as a form field.
+    Every path is written in chunks and capped at MAX_UPLOAD_BYTES.
+
+    Returns:
+        Path of the temporary file, or None if the request carries no image
+    """
+    upload_folder = current_app.config["UPLOAD_FOLDER"]
+    if is_raw_image_request(request.mimetype):
+        temp_path = os.path.join(upload_folder, f"temp_upload_{ts}_{uuid.uuid4().hex[:8]}.jpg")
+        with DETECT_STAGE_SECONDS.time(stage="temp_write"):
+            stream_to_file(request.stream, temp_path)
+    elif "image" in request.files:
+        file = request.files["image"]
+        temp_filename = secure_filename(f"temp_{ts}_{file.filename}")
+        temp_path = os.path.join(upload_folder, temp_filename)
+        with DETECT_STAGE_SECONDS.time(stage="temp_write"):
+            stream_to_file(file.stream, temp_path)
+    elif "imageData" in request.files or "imageData" in request.form:
+        # Base64 image data from webcam, decoded incrementally
+        source = request.files["imageData"].stream if "imageData" in request.files else request.form["imageData"]
+        temp_path = os.path.join(upload_folder, f"temp_capture_{ts}_{uuid.uuid4().hex[:8]}.jpg")
+        with DETECT_STAGE_SECONDS.time(stage="base64_decode"):
+            decode_base64_to_file(source, temp_path)
+    else:
+        return None
+    return temp_path
+
+
+def store_upload(temp_path, stem, extension, upload_folder=None):
+    """
+    Move a processed upload to its final name, never overwriting another item.
+
+    Uploads landing in the same second share a name stem, so a numeric suffix
+    is added when needed; the name is reserved with O_EXCL so concurrent
+    workers cannot pick the same one.
+
+    Returns:
+        Tuple of (filename, path)
+    """
+    upload_folder = upload_folder or current_app.config["UPLOAD_FOLDER"]
+    for attempt in range(1000):
+        suffix = f"_{attempt}" if attempt else ""
+        filename = secure_filename(f"{stem}{suffix}.{extension}")
+        file_path = os.path.join(upload_folder, filename)
+        try:
+            os.close(os.open(file_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            continue
+        os.replace(temp_path, file_path)
+        return filename, file_path
+    raise RuntimeError(f"Could not find a free filename for {stem}")
+
+
+def inspect_upload(temp_path):
+    """
+    Preprocess an upload and look for an already catalogued photo of the same item.
+
+    Returns:
+        Tuple of (file extension, perceptual hash, described near-duplicates)
+    """
+    # Orient, downscale and recompress before the image is described or stored
+    with DETECT_STAGE_SECONDS.time(stage="preprocess"):
+        extension = preprocess_image(temp_path)
+
+    # A re-photographed item is recognised before it is described again
+    with DETECT_STAGE_SECONDS.time(stage="duplicate_lookup"):
+        image_hash = perceptual_hash(temp_path)
+        # (items still waiting for their own description have nothing to reuse)
+        duplicates = [d for d in find_similar(image_hash, DUPLICATE_MAX_DISTANCE, k=3) if d.get("label")]
+    return extension, image_hash, duplicates
+
+
+def detection_record(temp_path, ts, extension, image_hash, item_description, duplicates, base=None, upload_folder=None):
+    """Store a described upload under its final name and build its metadata record"""
+    # Save the image with proper name
+    category = item_description.get("category") if item_description else "item"
+    with DETECT_STAGE_SECONDS.time(stage="rename"):
+        filename, file_path = store_upload(temp_path, f"{category}_{ts}", extension, upload_folder)
+    with DETECT_STAGE_SECONDS.time(stage="derivatives"):
+        urls = image_urls(filename, base, upload_folder)
+    
+    # Build metadata record
+    record = {
+        "timestamp": ts,
+        "filename": filename,
+        **urls,
+        "category": category,
+        **description_fields(item_description),
+        "image_hash": image_hash,
+    }
+    if duplicates:
+        record["duplicate_of"] = duplicates[0]["filename"]
+    
+    print(f"[DEBUG] Final record: category={record['category']}, color={record['color']}, condition={record['condition']}")
+    return record
+
+
+def detection_payload(record, description_warning, duplicates):
+    """The /detector/detect response for a saved record"""
+    response_payload = {
+        "success": True,
+        "metadata": record
+    }
+    if description_warning:
+        response_payload["warning"] = description_warning
+    if duplicates:
+        response_payload["duplicates"] = [duplicate_summary(d) for d in duplicates]
+    return response_payload
+
+
+def upload_timestamp():
+    # Use UTC to ensure consistency across timezones
+    return datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
+
+
+def request_flag(name):
+    value = request.args.get(name) or request.form.get(name) or ""
+    return value.lower() in ("1", "true", "yes")
+
+
+def wants_async():
+    return request_flag("async")
+
+
+def wants_duplicate_reuse():
+    """Whether the client asked to copy a near-duplicate's description instead of describing the photo"""
+    return request_flag("reuse_duplicate")
+
+
 @detector_bp.route("/detector/detect", methods=["POST", "OPTIONS"])
 def detect_image():
     """Process an image and generate item description"""
@@ -25,7 +273,12 @@ def detect_image():
         response.headers.add("Access-Control-Allow-Headers", "Content-Type")
         return response, 200
 
+    mode = "sync"
+
     def build_response(payload, status=200):
+        DETECT_REQUESTS.inc(mode=mode, status=status)
+        if payload.get("warning"):
+            DETECT_WARNINGS.inc(mode=mode)
         resp = jsonify(payload)
         resp.headers.add("Access-Control-Allow-Origin", "*")
         resp.headers.add("Access-Control-Allow-Methods", "POST, OPTIONS")
@@ -35,90 +288,160 @@ def detect_image():
     description_warning = None
 
     try:
-        if "image" not in request.files and "imageData" not in request.form:
+        ts = upload_timestamp()
+        temp_path = save_upload(ts)
+        if temp_path is None:
             return build_response({"error": "No image provided"}, 400)
-        
-        # Handle base64 image data from webcam
-        if "imageData" in request.form:
-            image_data = request.form["imageData"]
-            # Remove data URL prefix if present
-            if "," in image_data:
-                image_data = image_data.split(",")[1]
-            
-            # Decode base64 image
-            image_bytes = base64.b64decode(image_data)
-            
-            # Save temporary image (use UTC to ensure consistency across timezones)
-            ts = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
-            temp_filename = f"temp_capture_{ts}.jpg"
-            temp_path = os.path.join(current_app.config["UPLOAD_FOLDER"], temp_filename)
-            
-            with open(temp_path, "wb") as f:
-                f.write(image_bytes)
+
+        extension, image_hash, duplicates = inspect_upload(temp_path)
+
+        # A near-duplicate is only reported unless the client opts into reusing its description:
+        # two different items photographed on the same mat can hash alike
+        if duplicates and wants_duplicate_reuse():
+            mode = "duplicate"
+            item_description, description_warning = reused_description(duplicates[0])
+        elif wants_async():
+            mode = "async"
+            return detect_async(temp_path, ts, extension, image_hash, build_response, duplicates)
         else:
-            # Handle file upload (use UTC to ensure consistency across timezones)
-            file = request.files["image"]
-            ts = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
-            temp_filename = secure_filename(f"temp_{ts}_{file.filename}")
-            temp_path = os.path.join(current_app.config["UPLOAD_FOLDER"], temp_filename)
-            file.save(temp_path)
-        
-        # Generate OpenAI description if available
-        print(f"[INFO] Processing image: {temp_path}")
-        item_description = None
-        description_warning = None
-        
-        try:
-            item_description = generate_item_description(temp_path)
-            if item_description:
-                print(f"[DEBUG] Item description received: {item_description}")
-            else:
-                description_warning = "AI description service returned no result. Item saved without description."
-                print(f"[DEBUG] Item description is None (API may not be configured or failed)")
-        except Exception as e:
-            description_warning = "Unable to reach the AI description service. Item saved without automatic description."
-            print(f"[WARNING] Could not generate description: {e}")
-            import traceback
-            traceback.print_exc()
-
-        # Save the image with proper name
-        category = item_description.get("category") if item_description else "item"
-        filename = secure_filename(f"{category}_{ts}.jpg")
-        file_path = os.path.join(current_app.config["UPLOAD_FOLDER"], filename)
-        os.rename(temp_path, file_path)
-        
-        # Build metadata record
-        image_url = f"http://{request.host}/uploads/{filename}"
-        raw_label = item_description.get("label") if item_description else None
-        formatted_label = to_title_case(raw_label) if raw_label else None
-        record = {
-            "timestamp": ts,
-            "filename": filename,
-            "image_url": image_url,
-            "label": formatted_label,
-            "category": category,
-            "color": item_description.get("color") if item_description else None,
-            "condition": item_description.get("condition") if item_description else None,
-            "distinctive_features": item_description.get("distinctive_features") if item_description else None
-        }
-        
-        print(f"[DEBUG] Final record: category={record['category']}, color={record['color']}, condition={record['condition']}")
+            # Generate OpenAI description if available
+            print(f"[INFO] Processing image: {temp_path}")
+            with DETECT_STAGE_SECONDS.time(stage="describe"):
+                item_description, description_warning = describe_item(temp_path)
+            if duplicates:
+                description_warning = join_warnings(duplicate_warning(duplicates[0]), description_warning)
+
+        record = detection_record(temp_path, ts, extension, image_hash, item_description, duplicates)
         
         # Save metadata
-        data = load_metadata()
-        data.append(record)
-        save_metadata(data)
-        
-        response_payload = {
-            "success": True,
-            "metadata": record
-        }
-        if description_warning:
-            response_payload["warning"] = description_warning
-
-        return build_response(response_payload, 200)
+        with DETECT_STAGE_SECONDS.time(stage="metadata_save"):
+            append_metadata(record)
+
+        return build_response(detection_payload(record, description_warning, duplicates), 200)
         
+    except (UploadTooLarge, RequestEntityTooLarge) as e:
+        return build_response({"error": f"Image too large (limit {MAX_UPLOAD_BYTES} bytes)"}, 413)
+    except ValueError as e:
+        return build_response({"error": str(e)}, 400)
     except Exception as e:
         print(f"[ERROR] Detection endpoint failed: {e}")
         return build_response({"error": str(e)}, 500)
 
+
+
+def detect_async(temp_path, ts, extension, image_hash, build_response, duplicates=None):
+    """
+    Save the item right away and describe it on the background job pool.
+
+    The metadata record is created immediately (with `description_status`
+    "pending") and filled in when the description arrives; the response is
+    202 Accepted with the job id to poll at /detector/jobs/<id>.
+    """
+    with DETECT_STAGE_SECONDS.time(stage="rename"):
+        filename, file_path = store_upload(temp_path, f"item_{ts}", extension)
+    with DETECT_STAGE_SECONDS.time(stage="derivatives"):
+        urls = image_urls(filename)
+
+    record = {
+        "timestamp": ts,
+        "filename": filename,
+        **urls,
+        "category": "item",
+        **description_fields(None),
+        "image_hash": image_hash,
+        "description_status": "pending",
+    }
+    if duplicates:
+        record["duplicate_of"] = duplicates[0]["filename"]
+
+    # The record must exist before the job can fill it in
+    with DETECT_STAGE_SECONDS.time(stage="metadata_save"):
+        append_metadata(record)
+    try:
+        job = get_job_pool().submit("describe", {"filename": filename, "image_path": file_path})
+    except QueueFullError as e:
+        delete_metadata(filename)
+        os.remove(file_path)
+        response, status = build_response({"error": str(e)}, 503)
+        response.headers["Retry-After"] = "5"
+        return response, status
+
+    status_url = f"/detector/jobs/{job['id']}"
+    payload = {
+        "success": True,
+        "job_id": job["id"],
+        "status": job["status"],
+        "status_url": status_url,
+        "metadata": record,
+    }
+    if duplicates:
+        payload["warning"] = duplicate_warning(duplicates[0])
+        payload["duplicates"] = [duplicate_summary(d) for d in duplicates]
+    response, status = build_response(payload, 202)
+    response.headers["Location"] = status_url
+    return response, status
+
+
+@detector_bp.route("/detector/similar", methods=["POST", "OPTIONS"])
+def similar_items():
+    """
+    "Have you seen this item?": catalogued items whose photo looks like the uploaded one.
+
+    Accepts the image like /detector/detect; nothing is stored. `k` and
+    `max_distance` (Hamming bits out of 64) tune the answer.
+    """
+    if request.method == "OPTIONS":
+        response = jsonify({})
+        response.headers.add("Access-Control-Allow-Origin", "*")
+        response.headers.add("Access-Control-Allow-Methods", "POST, OPTIONS")
+        response.headers.add("Access-Control-Allow-Headers", "Content-Type")
+        return response, 200
+
+    def build_response(payload, status=200):
+        resp = jsonify(payload)
+        resp.headers.add("Access-Control-Allow-Origin", "*")
+        return resp, status
+
+    try:
+        k = max(1, min(int(request.args.get("k", 10)), 50))
+        max_distance = max(0, min(int(request.args.get("max_distance", SIMILAR_MAX_DISTANCE)), 32))
+    except ValueError:
+        return build_response({"error": "k and max_distance must be integers"}, 400)
+
+    temp_path = None
+    try:
+        ts = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
+        temp_path = save_upload(ts)
+        if temp_path is None:
+            return build_response({"error": "No image provided"}, 400)
+        image_hash = perceptual_hash(temp_path)
+        if image_hash is None:
+            return build_response({"error": "Image could not be read"}, 400)
+        results = find_similar(image_hash, max_distance, k)
+        return build_response({"image_hash": image_hash, "results": results}, 200)
+    except (UploadTooLarge, RequestEntityTooLarge):
+        return build_response({"error": f"Image too large (limit {MAX_UPLOAD_BYTES} bytes)"}, 413)
+    except ValueError as e:
+        return build_response({"error": str(e)}, 400)
+    except Exception as e:
+        print(f"[ERROR] Similar items endpoint failed: {e}")
+        return build_response({"error": str(e)}, 500)
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+@detector_bp.route("/detector/jobs/<job_id>")
+def job_status(job_id):
+    """Status and, once finished, the result of an asynchronous detection job"""
+    job = get_job(job_id)
+    if job is None:
+        response = jsonify({"error": "Job not found"})
+        response.headers.add("Access-Control-Allow-Origin", "*")
+        return response, 404
+    job.pop("payload", None)
+    job.pop("pid", None)
+    job.pop("pid_started", None)
+    response = jsonify(job)
+    response.headers.add("Access-Control-Allow-Origin", "*")
+    return response, 200
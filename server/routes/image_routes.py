@@ -1,10 +1,31 @@
-from flask import Blueprint, send_from_directory, current_app
+from flask import Blueprint, send_from_directory, send_file, current_app, jsonify
+from utils.image_utils import ensure_derivative
 
 image_bp = Blueprint("image_bp", __name__)
 
+# Originals keep their name for life but can be deleted, so revalidate daily
+UPLOAD_MAX_AGE = 24 * 3600
+# Derivative URLs embed the content digest and never change meaning
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
 
 @image_bp.route("/uploads/<path:filename>")
 def uploaded_file(filename):
     """Serve uploaded images"""
-    return send_from_directory(current_app.config["UPLOAD_FOLDER"], filename)
+    response = send_from_directory(
+        current_app.config["UPLOAD_FOLDER"], filename, max_age=UPLOAD_MAX_AGE
+    )
+    response.headers.add("Access-Control-Allow-Origin", "*")
+    return response
+
 
+@image_bp.route("/derived/<variant>/<digest>/<path:filename>")
+def derived_file(variant, digest, filename):
+    """Serve a thumbnail/medium derivative, generating it on first request"""
+    path = ensure_derivative(current_app.config["UPLOAD_FOLDER"], filename, variant, digest)
+    if path is None:
+        return jsonify({"error": "Not found"}), 404
+    response = send_file(path, mimetype="image/jpeg", max_age=IMMUTABLE_MAX_AGE, conditional=True, etag=True)
+    response.headers["Cache-Control"] = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+    response.headers.add("Access-Control-Allow-Origin", "*")
+    return response
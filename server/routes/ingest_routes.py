@@ -0,0 +1,339 @@
+from flask import Blueprint, request, jsonify, current_app
+from werkzeug.utils import secure_filename
+import os
+import time
+import uuid
+import shutil
+import hashlib
+import tarfile
+import zipfile
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from routes.detector_routes import (
+    inspect_upload, detection_record, describe_item, reused_description, upload_timestamp
+)
+from utils.metadata_utils import get_store, append_many_metadata, delete_many_metadata, is_described
+from utils.image_utils import remove_image_files
+from utils.job_utils import get_job_pool, register_job_handler, QueueFullError
+from utils.metrics import DETECT_STAGE_SECONDS
+from utils.upload_utils import MAX_UPLOAD_BYTES, CHUNK_SIZE, working_in
+
+ingest_bp = Blueprint("ingest_bp", __name__)
+
+# Images described and stored at once by one ingest run (the OpenAI gateway still rate-limits the calls)
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "4"))
+# Largest multipart body accepted by /api/ingest
+INGEST_MAX_REQUEST_BYTES = int(os.getenv("INGEST_MAX_REQUEST_BYTES", str(1024 * 1024 * 1024)))
+# Finished records are written to the catalogue this many at a time, so an interrupted run keeps its progress
+INGEST_COMMIT_BATCH = int(os.getenv("INGEST_COMMIT_BATCH", "25"))
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp", ".tif", ".tiff"}
+# Staged batches from /api/ingest live here until their job finishes
+INGEST_DIRNAME = "ingest"
+
+
+def _is_image_name(name):
+    base = os.path.basename(name)
+    if not base or base.startswith(".") or "__MACOSX" in name:
+        return False
+    return os.path.splitext(base)[1].lower() in IMAGE_EXTENSIONS
+
+
+def iter_source_images(source):
+    """
+    Yield (name, open_function) for every image in a directory, archive or single file.
+
+    Directories are walked recursively; .zip and .tar(.gz/.bz2/.xz) archives are
+    read member by member without being extracted.
+    """
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                if _is_image_name(path):
+                    yield os.path.relpath(path, source), (lambda path=path: open(path, "rb"))
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and _is_image_name(info.filename):
+                    yield info.filename, (lambda info=info: archive.open(info))
+    elif tarfile.is_tarfile(source):
+        with tarfile.open(source) as archive:
+            for member in archive:
+                if member.isfile() and _is_image_name(member.name):
+                    yield member.name, (lambda member=member: archive.extractfile(member))
+    elif os.path.isfile(source) and _is_image_name(source):
+        yield os.path.basename(source), (lambda: open(source, "rb"))
+    else:
+        raise ValueError(f"Not an image, directory or archive: {source}")
+
+
+def stage_image(opener, work_dir):
+    """
+    Copy one image into `work_dir`, hashing it on the way.
+
+    Returns:
+        Tuple of (staged path, SHA-256 hex digest, size in bytes)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fd, path = tempfile.mkstemp(prefix="temp_ingest_", suffix=".jpg", dir=work_dir)
+    try:
+        with os.fdopen(fd, "wb") as out, opener() as src:
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise ValueError(f"Image exceeds the {MAX_UPLOAD_BYTES} byte upload limit")
+                digest.update(chunk)
+                out.write(chunk)
+        if size == 0:
+            raise ValueError("Image is empty")
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, digest.hexdigest(), size
+
+
+def ingest_one(item, base, upload_folder, reuse_duplicates=False):
+    """Describe and store one staged image; returns (record, reused description?)"""
+    extension, image_hash, duplicates = inspect_upload(item["path"])
+    reuse = bool(duplicates) and reuse_duplicates
+    if reuse:
+        item_description, _ = reused_description(duplicates[0])
+    else:
+        with DETECT_STAGE_SECONDS.time(stage="describe"):
+            item_description, _ = describe_item(item["path"])
+    record = detection_record(
+        item["path"], upload_timestamp(), extension, image_hash, item_description, duplicates, base, upload_folder
+    )
+    record["content_hash"] = item["content_hash"]
+    record["source_name"] = item["name"]
+    # Undescribed images do not count as ingested, so the next run tries them again
+    record["description_status"] = "done" if item_description else "failed"
+    return record, reuse
+
+
+def ingest_images(sources, upload_folder, base, concurrency=INGEST_CONCURRENCY, progress=None, reuse_duplicates=False):
+    """
+    Load every image found in `sources` (directories, archives or image files) into the catalogue.
+
+    Images are staged and hashed first; any whose SHA-256 is already in the
+    catalogue with a description (or repeats within the batch) is skipped, so
+    re-running an interrupted ingest only does the remaining work, and
+    descriptions fetched before the interruption come from the description
+    cache. Images stored without a description by an earlier run are ingested
+    again and their old records and files removed. The rest are
+    preprocessed, described and stored by `concurrency` threads, and their
+    records are written INGEST_COMMIT_BATCH at a time as they finish, each
+    batch in one metadata transaction, so a run that dies part way leaves at
+    most one batch of stored images unrecorded.
+
+    Args:
+        progress: Optional callback(done, total) called as images finish
+        reuse_duplicates: Copy the description of an already catalogued
+            near-duplicate instead of describing the image (off by default, as
+            different items photographed alike can match)
+
+    Returns:
+        Summary dict with counts, failures and throughput
+    """
+    started = time.perf_counter()
+    work_dir = tempfile.mkdtemp(prefix=".ingest_", dir=upload_folder)
+    summary = {"images": 0, "ingested": 0, "already_ingested": 0, "repeated_in_batch": 0,
+               "retried": 0, "described": 0, "reused_descriptions": 0, "without_description": 0, "near_duplicates": 0,
+               "failed": [], "bytes": 0}
+    try:
+        # Long runs outlast TEMP_MAX_AGE; the maintenance sweep leaves claimed directories alone
+        with working_in(work_dir):
+            staged, seen = [], set()
+            for source in sources:
+                # Archive members can only be read while the archive is open, so stage them as they come
+                try:
+                    for name, opener in iter_source_images(source):
+                        summary["images"] += 1
+                        try:
+                            path, content_hash, size = stage_image(opener, work_dir)
+                        except Exception as e:
+                            summary["failed"].append({"name": name, "error": str(e)})
+                            continue
+                        if content_hash in seen:
+                            summary["repeated_in_batch"] += 1
+                            os.remove(path)
+                            continue
+                        seen.add(content_hash)
+                        summary["bytes"] += size
+                        staged.append({"name": name, "path": path, "content_hash": content_hash})
+                except (ValueError, OSError, zipfile.BadZipFile, tarfile.TarError) as e:
+                    print(f"[WARNING] Could not read {source}: {e}")
+                    summary["failed"].append({"name": source, "error": str(e)})
+            staged_seconds = time.perf_counter() - started
+
+            store = get_store()
+            hashes = [item["content_hash"] for item in staged]
+            existing = store.existing_content_hashes(hashes)
+            undescribed = store.undescribed_content_hashes(hashes)
+            summary["already_ingested"] = len(existing)
+            pending = [item for item in staged if item["content_hash"] not in existing]
+            summary["retried"] = sum(1 for item in pending if item["content_hash"] in undescribed)
+
+            records, unsaved = [], []
+
+            def commit():
+                # One transaction per batch, in upload order
+                batch = sorted(unsaved, key=lambda r: r["filename"])
+                unsaved.clear()
+                append_many_metadata(batch)
+                records.extend(batch)
+                # Replaced by the records just stored for the same originals
+                superseded = [name for r in batch for name in undescribed.get(r["content_hash"], [])]
+                if superseded:
+                    for removed in delete_many_metadata(superseded):
+                        remove_image_files(upload_folder, removed["filename"])
+
+            try:
+                with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="ingest") as executor:
+                    futures = {executor.submit(ingest_one, item, base, upload_folder, reuse_duplicates): item for item in pending}
+                    consumed = set()
+                    try:
+                        for done, future in enumerate(as_completed(futures), start=1):
+                            consumed.add(future)
+                            item = futures[future]
+                            try:
+                                record, reused = future.result()
+                            except Exception as e:
+                                print(f"[WARNING] Could not ingest {item['name']}: {e}")
+                                summary["failed"].append({"name": item["name"], "error": str(e)})
+                            else:
+                                unsaved.append(record)
+                                if record.get("duplicate_of"):
+                                    summary["near_duplicates"] += 1
+                                if reused:
+                                    summary["reused_descriptions"] += 1
+                                elif is_described(record):
+                                    summary["described"] += 1
+                                else:
+                                    summary["without_description"] += 1
+                                if len(unsaved) >= INGEST_COMMIT_BATCH:
+                                    commit()
+                            if progress:
+                                progress(done, len(pending))
+                    except BaseException:
+                        # Start no more images, but record the ones in flight: their files are already stored
+                        executor.shutdown(wait=True, cancel_futures=True)
+                        for future in futures:
+                            if future not in consumed and not future.cancelled() and future.exception() is None:
+                                unsaved.append(future.result()[0])
+                        raise
+            finally:
+                # Images already stored are recorded even if the run is being aborted
+                if unsaved:
+                    commit()
+            processed_seconds = time.perf_counter() - started - staged_seconds
+
+            summary["ingested"] = len(records)
+            summary["filenames"] = [r["filename"] for r in records]
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    seconds = time.perf_counter() - started
+    summary["seconds"] = round(seconds, 2)
+    summary["stage_seconds"] = round(staged_seconds, 2)
+    summary["process_seconds"] = round(processed_seconds, 2)
+    summary["images_per_second"] = round(summary["ingested"] / processed_seconds, 2) if processed_seconds > 0 else None
+    summary["megabytes_per_second"] = round(summary["bytes"] / 1e6 / seconds, 2) if seconds > 0 else None
+    return summary
+
+
+def run_ingest_job(batch_dir, upload_folder, base, reuse_duplicates=False):
+    """Background job: ingest a batch staged by /api/ingest, then remove it"""
+    # Each staged file is an image or an archive of them
+    sources = [os.path.join(batch_dir, name) for name in sorted(os.listdir(batch_dir))]
+    with working_in(batch_dir):
+        summary = ingest_images(sources, upload_folder, base, reuse_duplicates=reuse_duplicates)
+    shutil.rmtree(batch_dir, ignore_errors=True)
+    return summary
+
+
+register_job_handler("ingest", run_ingest_job)
+
+
+def stage_request_files(batch_dir):
+    """Save the request's `images` and `archive` parts into `batch_dir`; returns how many were saved"""
+    saved = 0
+    for field in ("images", "archive"):
+        for upload in request.files.getlist(field):
+            # Folder uploads send relative paths; keep them apart without trusting them
+            name = secure_filename(upload.filename or "") or f"upload_{saved}"
+            upload.save(os.path.join(batch_dir, f"{saved:05d}_{name}"))
+            saved += 1
+    return saved
+
+
+@ingest_bp.route("/api/ingest", methods=["POST", "OPTIONS"])
+def ingest():
+    """
+    Bulk-load photos.
+
+    Multipart body with any number of `images` file parts (e.g. a folder picked
+    with <input webkitdirectory>) and/or `archive` parts (.zip or .tar[.gz]).
+    The batch is staged on disk and ingested by a background job: the response
+    is 202 with the job id to poll at /detector/jobs/<id>, whose result is the
+    ingest summary. With ?wait=1 the batch is ingested within the request and
+    the summary returned directly. With ?reuse_duplicate=1, images that look
+    like an already catalogued item copy its description instead of being
+    described.
+    """
+    if request.method == "OPTIONS":
+        response = jsonify({})
+        response.headers.add("Access-Control-Allow-Origin", "*")
+        response.headers.add("Access-Control-Allow-Methods", "POST, OPTIONS")
+        response.headers.add("Access-Control-Allow-Headers", "Content-Type")
+        return response, 200
+
+    def build_response(payload, status=200):
+        resp = jsonify(payload)
+        resp.headers.add("Access-Control-Allow-Origin", "*")
+        return resp, status
+
+    batch_dir = None
+    try:
+        # A whole event's photos are far larger than a single detect upload
+        request.max_content_length = INGEST_MAX_REQUEST_BYTES
+        request.max_form_memory_size = INGEST_MAX_REQUEST_BYTES
+        upload_folder = current_app.config["UPLOAD_FOLDER"]
+        batch_dir = os.path.join(upload_folder, INGEST_DIRNAME, uuid.uuid4().hex)
+        os.makedirs(batch_dir)
+        if stage_request_files(batch_dir) == 0:
+            shutil.rmtree(batch_dir, ignore_errors=True)
+            return build_response({"error": "No images or archive provided"}, 400)
+
+        base = f"http://{request.host}"
+        reuse_duplicates = (request.args.get("reuse_duplicate") or "").lower() in ("1", "true", "yes")
+        if (request.args.get("wait") or "").lower() in ("1", "true", "yes"):
+            return build_response(run_ingest_job(batch_dir, upload_folder, base, reuse_duplicates), 200)
+
+        try:
+            job = get_job_pool().submit("ingest", {"batch_dir": batch_dir, "upload_folder": upload_folder,
+                                                   "base": base, "reuse_duplicates": reuse_duplicates})
+        except QueueFullError as e:
+            shutil.rmtree(batch_dir, ignore_errors=True)
+            response, status = build_response({"error": str(e)}, 503)
+            response.headers["Retry-After"] = "5"
+            return response, status
+
+        status_url = f"/detector/jobs/{job['id']}"
+        response, status = build_response({
+            "success": True,
+            "job_id": job["id"],
+            "status": job["status"],
+            "status_url": status_url,
+        }, 202)
+        response.headers["Location"] = status_url
+        return response, status
+
+    except Exception as e:
+        print(f"[ERROR] Ingest endpoint failed: {e}")
+        if batch_dir:
+            shutil.rmtree(batch_dir, ignore_errors=True)
+        status = getattr(e, "code", 500) if isinstance(getattr(e, "code", None), int) else 500
+        return build_response({"error": str(e)}, status)
@@ -1,22 +1,299 @@
 from flask import Blueprint, request, jsonify, current_app
-import os
-from utils.metadata_utils import load_metadata, save_metadata
+import re
+import json
+import base64
+from utils.metadata_utils import get_store, delete_metadata, delete_many_metadata
+from utils.event_utils import get_broadcaster, stream_changes, RETRY_MS, MAX_SUBSCRIBERS
+from utils.image_utils import remove_image_files
+from utils.catalogue_cache import get_catalogue_cache, negotiate_encoding, compress, GZIP_MIN_BYTES
 
 item_bp = Blueprint("item_bp", __name__)
 
 
+def catalogue_etag(version: int) -> str:
+    return f"catalogue-{version}"
+
+
+# Query parameters that switch /api/item from the full array to a paged listing
+LISTING_PARAMS = ("limit", "cursor", "fields", "category", "from", "to")
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Filenames accepted by one /api/item/bulk-delete request
+MAX_BULK_DELETE = 10000
+
+_TIMESTAMP_BOUND_RE = re.compile(r"^\d{4,8}(_\d{0,6})?$")
+
+
+def encode_listing_cursor(record) -> str:
+    raw = json.dumps([record.get("timestamp") or "", record.get("filename") or ""]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_listing_cursor(cursor: str):
+    try:
+        timestamp, filename = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return str(timestamp), str(filename)
+    except Exception:
+        return None
+
+
+def timestamp_bound(value: str) -> str:
+    """Accept 20240105, 2024-01-05 or 2024-01-05T14:30 and return the stored timestamp form"""
+    bound = value.strip().replace("-", "").replace(":", "").replace("T", "_").replace(" ", "_")
+    if not _TIMESTAMP_BOUND_RE.match(bound):
+        raise ValueError(f"Invalid date: {value}")
+    return bound
+
+
+def encoded_response(body: bytes, encode=None):
+    """
+    JSON response compressed with the best encoding the client accepts (br or gzip).
+
+    `encode(encoding)` may supply pre-compressed bytes; by default bodies of at
+    least GZIP_MIN_BYTES are compressed on the fly.
+    """
+    encoding = negotiate_encoding(request.accept_encodings)
+    data = None
+    if encoding:
+        if encode is not None:
+            data = encode(encoding)
+        elif len(body) >= GZIP_MIN_BYTES:
+            data = compress(body, encoding)
+    response = current_app.response_class(data or body, mimetype="application/json")
+    if data:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def listing_response(store, version):
+    """
+    One page of the catalogue, newest first.
+
+    Query options: `limit` (default 50, at most 200), `cursor` (the previous
+    page's `next_cursor`), `fields` (comma-separated projection; `filename` is
+    always included), `category`, and `from`/`to` dates (inclusive).
+    """
+    try:
+        limit = max(1, min(int(request.args.get("limit", DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    try:
+        since = timestamp_bound(request.args["from"]) if request.args.get("from") else None
+        # "~" sorts after every timestamp character, so `to` includes the whole day or minute
+        until = timestamp_bound(request.args["to"]) + "~" if request.args.get("to") else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    after = None
+    if request.args.get("cursor"):
+        after = decode_listing_cursor(request.args["cursor"])
+        if after is None:
+            return jsonify({"error": "Invalid cursor"}), 400
+    category = request.args.get("category") or None
+
+    items, has_more = store.page(limit, after=after, category=category, since=since, until=until)
+    payload = {
+        "version": version,
+        "next_cursor": encode_listing_cursor(items[-1]) if has_more and items else None,
+    }
+    if after is None:
+        if since is None and until is None:
+            # Read from the facet counters instead of counting rows
+            categories = store.facets().get("category", {})
+            payload["total"] = categories.get(category, 0) if category else sum(categories.values())
+        else:
+            payload["total"] = store.count_matching(category=category, since=since, until=until)
+    fields = [f.strip() for f in request.args.get("fields", "").split(",") if f.strip()]
+    if fields:
+        wanted = set(fields) | {"filename"}
+        items = [{k: v for k, v in item.items() if k in wanted} for item in items]
+    payload["items"] = items
+    return encoded_response(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+
+
 @item_bp.route("/api/item")
 def get_metadata():
-    """Serve metadata.json"""
+    """
+    Serve the catalogue.
+
+    Responses carry the catalogue version as an ETag, so pollers can send
+    If-None-Match and get a 304 while nothing has changed. With ?since=<version>
+    only the additions and deletions (as tombstones) after that version are
+    returned; `reset: true` means the history is unavailable and `items` holds
+    the full catalogue instead. The full catalogue is served from a per-process
+    snapshot that is only rebuilt when the catalogue version changes.
+
+    Any of `limit`, `cursor`, `fields`, `category`, `from` or `to` switches to a
+    paged listing (see `listing_response`). Bodies are br/gzip compressed when
+    the client accepts it.
+    """
     try:
-        metadata = load_metadata()
-        response = jsonify(metadata)
+        store = get_store()
+        version = store.version()
+        etag = catalogue_etag(version)
+
+        if request.if_none_match.contains_weak(etag):
+            response = current_app.response_class(status=304)
+        elif request.args.get("since") is not None:
+            try:
+                since = int(request.args["since"])
+            except ValueError:
+                return jsonify({"error": "since must be an integer version"}), 400
+            changes = store.changes_since(since)
+            if changes is None:
+                snapshot = get_catalogue_cache().get(store)
+                version, etag = snapshot.version, catalogue_etag(snapshot.version)
+                response = jsonify({"version": version, "reset": True, "items": snapshot.items})
+            else:
+                response = jsonify({"version": version, "reset": False, "changes": changes})
+        elif any(param in request.args for param in LISTING_PARAMS):
+            response = listing_response(store, version)
+            if isinstance(response, tuple):
+                return response
+        else:
+            snapshot = get_catalogue_cache().get(store)
+            version, etag = snapshot.version, catalogue_etag(snapshot.version)
+            response = encoded_response(snapshot.body, snapshot.encoded)
+
+        # Weak, because the gzipped and plain bodies of one version share the tag
+        response.set_etag(etag, weak=True)
+        response.headers["X-Catalogue-Version"] = str(version)
+        response.headers["Cache-Control"] = "no-cache"
         response.headers.add('Access-Control-Allow-Origin', '*')
-        return response, 200
+        response.headers.add('Access-Control-Expose-Headers', 'ETag, X-Catalogue-Version')
+        return response
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@item_bp.route("/api/item/stream")
+def stream_items():
+    """
+    Server-Sent Events feed of added and deleted items.
+
+    Event ids are catalogue versions, so a reconnecting EventSource resumes from
+    its Last-Event-ID. A first connection can pass ?since=<version> (from the
+    X-Catalogue-Version of its last /api/item load).
+
+    Every open stream pins a sync worker thread, so unless SSE_MAX_SUBSCRIBERS
+    allows some (e.g. under gevent workers) the answer is an immediate 204,
+    which tells EventSource not to reconnect; the search page polls instead.
+    The ASGI server serves this route itself without holding a thread.
+    """
+    if MAX_SUBSCRIBERS <= 0:
+        response = current_app.response_class(status=204)
+        response.headers["Cache-Control"] = "no-store"
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+
+    broadcaster = get_broadcaster()
+    last_id = request.headers.get("Last-Event-ID") or request.args.get("since")
+    try:
+        last_id = int(last_id) if last_id is not None else broadcaster.version
+    except ValueError:
+        return jsonify({"error": "Last-Event-ID must be an integer version"}), 400
+
+    if not broadcaster.acquire_subscriber():
+        # All stream slots in this worker are busy; the client keeps polling instead
+        response = jsonify({"error": "Too many open streams"})
+        response.headers["Retry-After"] = str(RETRY_MS // 1000)
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, 503
+
+    response = current_app.response_class(
+        stream_changes(broadcaster, last_id), mimetype="text/event-stream"
+    )
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    # Frees the slot even if the client disconnects before the stream starts
+    response.call_on_close(broadcaster.release_subscriber)
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response
+
+
+def facet_entries(dimension, counts):
+    """[{"value", "count"}] for one facet: days in date order, anything else most common first"""
+    if dimension == "day":
+        return [{"value": f"{day[:4]}-{day[4:6]}-{day[6:8]}" if day else None, "count": count}
+                for day, count in sorted(counts.items())]
+    ranked = sorted(counts.items(), key=lambda entry: (-entry[1], entry[0]))
+    return [{"value": value or None, "count": count} for value, count in ranked]
+
+
+@item_bp.route("/api/item/facets")
+def get_facets():
+    """
+    Item counts per category, color and day (YYYY-MM-DD), plus the total.
+
+    Counts are kept up to date as items are added and removed, so this costs
+    the same whatever the catalogue size. A null value counts items without
+    one. Carries the catalogue version as its ETag, like /api/item.
+    """
+    try:
+        store = get_store()
+        version = store.version()
+        etag = f"facets-{version}"
+        if request.if_none_match.contains_weak(etag):
+            response = current_app.response_class(status=304)
+        else:
+            facets = store.facets()
+            payload = {"version": version, "total": sum(facets.get("category", {}).values())}
+            for dimension, counts in facets.items():
+                payload[dimension] = facet_entries(dimension, counts)
+            response = jsonify(payload)
+        response.set_etag(etag, weak=True)
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Expose-Headers', 'ETag')
+        return response
     except Exception as e:
+        print(f"[ERROR] Facets endpoint failed: {e}")
         return jsonify({"error": str(e)}), 500
 
 
+@item_bp.route("/api/item/bulk-delete", methods=["POST", "OPTIONS"])
+def bulk_delete_items():
+    """
+    Delete many items at once.
+
+    Body: {"filenames": [...]} (at most MAX_BULK_DELETE). All records are
+    removed in a single metadata write, then their images and derivatives.
+    Returns the filenames that were deleted and those that were not found.
+    """
+    if request.method == "OPTIONS":
+        response = jsonify({})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
+        return response, 200
+
+    def build_response(payload, status=200):
+        response = jsonify(payload)
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, status
+
+    try:
+        body = request.get_json(silent=True) or {}
+        filenames = body.get("filenames")
+        if not isinstance(filenames, list) or not all(isinstance(name, str) for name in filenames):
+            return build_response({"error": "filenames must be a list of strings"}, 400)
+        if len(filenames) > MAX_BULK_DELETE:
+            return build_response({"error": f"At most {MAX_BULK_DELETE} filenames per request"}, 400)
+
+        # Records first, as in delete_item, so a failure never leaves a dangling entry
+        removed = delete_many_metadata(list(dict.fromkeys(filenames)))
+        upload_folder = current_app.config["UPLOAD_FOLDER"]
+        deleted = [record["filename"] for record in removed]
+        for filename in deleted:
+            remove_image_files(upload_folder, filename)
+        missing = sorted(set(filenames) - set(deleted))
+        return build_response({"success": True, "deleted": deleted, "missing": missing})
+
+    except Exception as e:
+        print(f"[ERROR] Bulk delete endpoint failed: {e}")
+        return build_response({"error": str(e)}, 500)
+
+
 @item_bp.route("/api/item/<path:filename>", methods=["DELETE", "OPTIONS"])
 def delete_item(filename):
     """Delete an item from metadata and remove the image file"""
@@ -28,35 +305,16 @@ def delete_item(filename):
         return response, 200
     
     try:
-        # Load metadata
-        metadata = load_metadata()
-        
-        # Find and remove the item
-        item_found = False
-        updated_metadata = []
-        upload_folder = current_app.config["UPLOAD_FOLDER"]
-        
-        for item in metadata:
-            if item.get('filename') == filename:
-                item_found = True
-                # Delete the image file
-                image_path = os.path.join(upload_folder, filename)
-                if os.path.exists(image_path):
-                    try:
-                        os.remove(image_path)
-                        print(f"[INFO] Deleted image file: {image_path}")
-                    except Exception as e:
-                        print(f"[WARNING] Could not delete image file: {e}")
-            else:
-                updated_metadata.append(item)
+        # Remove the record first so a failed delete never leaves a dangling entry
+        removed = delete_metadata(filename)
         
-        if not item_found:
+        if removed is None:
             response = jsonify({"error": "Item not found"})
             response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 404
         
-        # Save updated metadata
-        save_metadata(updated_metadata)
+        # Delete the image file and its derivatives
+        remove_image_files(current_app.config["UPLOAD_FOLDER"], filename)
         
         response = jsonify({"success": True, "message": "Item deleted successfully"})
         response.headers.add('Access-Control-Allow-Origin', '*')
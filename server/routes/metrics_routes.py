@@ -0,0 +1,45 @@
+from flask import Blueprint, request, current_app, g
+import time
+from utils.metadata_utils import get_store
+from utils.metrics import render_metrics, register_gauge, HTTP_REQUEST_SECONDS, HTTP_REQUESTS
+
+metrics_bp = Blueprint("metrics_bp", __name__)
+
+# Shared by every worker, so read from the store at scrape time rather than summed
+register_gauge("catalogue_items", "Items in the catalogue", lambda: get_store().count())
+register_gauge("catalogue_version", "Current catalogue version", lambda: get_store().version())
+
+
+@metrics_bp.before_app_request
+def start_request_timer():
+    g._request_started = time.perf_counter()
+
+
+@metrics_bp.after_app_request
+def record_request(response):
+    started = g.pop("_request_started", None)
+    if started is not None and request.endpoint != "metrics_bp.metrics":
+        # Label by endpoint rather than path, so item filenames do not explode the series
+        endpoint = request.endpoint or "unmatched"
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+        HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    return response
+
+
+@metrics_bp.route("/api/metrics")
+def metrics():
+    """
+    Prometheus metrics summed across all worker processes.
+
+    Covers per-stage detect timings, OpenAI latency and outcomes, cache hit
+    rates and per-endpoint request latency. Streaming responses are timed
+    until their headers are sent.
+    """
+    try:
+        response = current_app.response_class(render_metrics(), mimetype="text/plain; version=0.0.4")
+        response.headers["Cache-Control"] = "no-store"
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+    except Exception as e:
+        print(f"[ERROR] Metrics endpoint failed: {e}")
+        return {"error": str(e)}, 500
@@ -0,0 +1,94 @@
+from flask import Blueprint, request, jsonify
+from utils.search_index import get_index
+from utils.openai_utils import assisted_search, RERANK_TOP_K
+from utils.vector_index import semantic_search
+
+search_bp = Blueprint("search_bp", __name__)
+
+MAX_PAGE_SIZE = 100
+
+
+@search_bp.route("/api/search")
+def search():
+    """Ranked full-text search over found items"""
+    try:
+        query = request.args.get("q", "")
+        try:
+            limit = int(request.args.get("limit", 20))
+        except ValueError:
+            return jsonify({"error": "limit must be an integer"}), 400
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+        result = get_index().search(
+            query,
+            category=request.args.get("category"),
+            color=request.args.get("color"),
+            limit=limit,
+            cursor=request.args.get("cursor"),
+        )
+        result["query"] = query
+        response = jsonify(result)
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, 200
+    except Exception as e:
+        print(f"[ERROR] Search endpoint failed: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@search_bp.route("/api/search/semantic")
+def search_semantic():
+    """
+    Similarity search over item descriptions with the local vector index.
+
+    Falls back to keyword search (`semantic: false`) when NumPy is not installed.
+    """
+    try:
+        query = request.args.get("q", "")
+        try:
+            k = int(request.args.get("k", 20))
+        except ValueError:
+            return jsonify({"error": "k must be an integer"}), 400
+        k = max(1, min(k, MAX_PAGE_SIZE))
+
+        results = semantic_search(query, k)
+        semantic = results is not None
+        if not semantic:
+            results = get_index().search(query, limit=k, match_all=False)["results"]
+        response = jsonify({"query": query, "results": results, "semantic": semantic})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, 200
+    except Exception as e:
+        print(f"[ERROR] Semantic search endpoint failed: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@search_bp.route("/api/search/assist")
+def search_assist():
+    """
+    Natural language search: local candidate retrieval, then an optional LLM rerank.
+
+    `rerank=0` skips the LLM; without an API key the local ranking is returned.
+    """
+    try:
+        query = request.args.get("q", "")
+        try:
+            k = int(request.args.get("k", RERANK_TOP_K))
+        except ValueError:
+            return jsonify({"error": "k must be an integer"}), 400
+        k = max(1, min(k, MAX_PAGE_SIZE))
+        rerank = request.args.get("rerank", "1").lower() not in ("0", "false", "no")
+
+        result = assisted_search(
+            query,
+            k=k,
+            category=request.args.get("category"),
+            color=request.args.get("color"),
+            rerank=rerank,
+        )
+        result["query"] = query
+        response = jsonify(result)
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, 200
+    except Exception as e:
+        print(f"[ERROR] Assisted search endpoint failed: {e}")
+        return jsonify({"error": str(e)}), 500
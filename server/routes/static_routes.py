@@ -0,0 +1,85 @@
+from flask import Blueprint, request, jsonify, current_app, send_file
+from utils.asset_utils import get_asset_manifest, ASSET_URL_PREFIX
+from utils.catalogue_cache import negotiate_encoding
+
+static_bp = Blueprint("static_bp", __name__)
+
+# Hashed URLs never change content, so browsers and CDNs may keep them for a year
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+# Pages and unhashed URLs are revalidated with their ETag on every use
+REVALIDATE_CACHE = "no-cache"
+# Paths the catch-all never serves from the client folder
+RESERVED_PREFIXES = ("api/", "detector/", "upload", "metadata", "uploads/", "derived/")
+
+
+def manifest():
+    return get_asset_manifest(reload=current_app.debug)
+
+
+def asset_response(asset, cache_control):
+    """Serve an asset from memory (pre-compressed when the client accepts it), with ETag revalidation"""
+    if request.if_none_match.contains_weak(asset.digest):
+        response = current_app.response_class(status=304)
+    elif asset.body is None:
+        response = send_file(asset.disk_path, mimetype=asset.mimetype, etag=False, conditional=True)
+    else:
+        encoding = negotiate_encoding(request.accept_encodings)
+        data = asset.encoded.get(encoding) if encoding else None
+        response = current_app.response_class(data or asset.body, mimetype=asset.mimetype)
+        if data:
+            response.headers["Content-Encoding"] = encoding
+        if asset.encoded:
+            response.vary.add("Accept-Encoding")
+    # Weak, because the compressed and plain bodies share the tag
+    response.set_etag(asset.digest, weak=True)
+    response.headers["Cache-Control"] = cache_control
+    return response
+
+
+def page_response(path, missing_message):
+    asset = manifest().get(path)
+    if asset is None:
+        return {"error": missing_message}, 404
+    return asset_response(asset, REVALIDATE_CACHE)
+
+
+@static_bp.route("/")
+@static_bp.route("/search")
+def serve_search():
+    """Serve search.html"""
+    return page_response("search.html", "Search page not found")
+
+
+@static_bp.route("/camera")
+def serve_camera():
+    """Serve camera.html"""
+    return page_response("camera.html", "Camera page not found")
+
+
+@static_bp.route("/asset-manifest.json")
+def asset_manifest():
+    """Logical asset paths mapped to their content-hashed URLs"""
+    response = jsonify(manifest().manifest())
+    response.headers["Cache-Control"] = REVALIDATE_CACHE
+    return response
+
+
+@static_bp.route(f"{ASSET_URL_PREFIX}<path:path>")
+def serve_hashed_asset(path):
+    """Serve a content-hashed asset URL from the manifest"""
+    asset = manifest().get_url(ASSET_URL_PREFIX + path)
+    if asset is None:
+        return {"error": "Not found"}, 404
+    return asset_response(asset, IMMUTABLE_CACHE)
+
+
+# Catch-all route for static files (routes with fixed segments always match first)
+@static_bp.route("/<path:path>")
+def serve_static_files(path):
+    """Serve any other client file (e.g. /shared.css) under its plain URL"""
+    if path.startswith(RESERVED_PREFIXES):
+        return {"error": "Not found"}, 404
+    asset = manifest().get(path)
+    if asset is None:
+        return {"error": "Not found"}, 404
+    return asset_response(asset, REVALIDATE_CACHE)
@@ -0,0 +1,210 @@
+import os
+import sys
+import json
+import asyncio
+import tempfile
+from urllib.parse import parse_qsl
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Tuple, Callable, Union
+
+# Threads serving requests handed to Flask under the ASGI server
+ASGI_WSGI_THREADS = int(os.getenv("ASGI_WSGI_THREADS", "16"))
+# Request bodies larger than this are spooled to disk before Flask reads them
+SPOOL_MEMORY_BYTES = 1024 * 1024
+
+Headers = List[Tuple[str, str]]
+
+
+class ClientDisconnected(Exception):
+    """Raised when the client goes away before its request body was read"""
+
+
+def header(scope, name: str) -> Optional[str]:
+    """First value of a request header (case-insensitive), or None"""
+    wanted = name.lower().encode("latin1")
+    for key, value in scope.get("headers", []):
+        if key.lower() == wanted:
+            return value.decode("latin1")
+    return None
+
+
+def mimetype(scope) -> str:
+    return (header(scope, "content-type") or "").split(";", 1)[0].strip().lower()
+
+
+def query_params(scope) -> Dict[str, str]:
+    """Query string arguments (first value of each)"""
+    params: Dict[str, str] = {}
+    for key, value in parse_qsl(scope.get("query_string", b"").decode("latin1"), keep_blank_values=True):
+        params.setdefault(key, value)
+    return params
+
+
+async def body_chunks(receive):
+    """Yield the request body as it arrives"""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise ClientDisconnected()
+        if message.get("body"):
+            yield message["body"]
+        if not message.get("more_body"):
+            return
+
+
+def _encode_headers(headers: Headers) -> List[Tuple[bytes, bytes]]:
+    return [(key.lower().encode("latin1"), value.encode("latin1")) for key, value in headers]
+
+
+async def send_json(send, payload: Dict[str, Any], status: int = 200, headers: Optional[Headers] = None) -> int:
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": _encode_headers([("Content-Type", "application/json"), ("Content-Length", str(len(body)))] + (headers or [])),
+    })
+    await send({"type": "http.response.body", "body": body})
+    return status
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def send_stream(receive, send, frames, headers: Headers, status: int = 200):
+    """
+    Send an async iterator of text frames as a streaming response.
+
+    The stream is cancelled as soon as the client disconnects, so an idle
+    subscriber waiting for its next frame is not left behind.
+    """
+    await send({"type": "http.response.start", "status": status, "headers": _encode_headers(headers)})
+
+    async def pump():
+        async for frame in frames:
+            await send({"type": "http.response.body", "body": frame.encode("utf-8"), "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+    pumping = asyncio.ensure_future(pump())
+    watching = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        await asyncio.wait({pumping, watching}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in (pumping, watching):
+            task.cancel()
+    if pumping.done() and not pumping.cancelled() and pumping.exception():
+        raise pumping.exception()
+
+
+def build_environ(scope, body, length: int) -> Dict[str, Any]:
+    """WSGI environ for an ASGI HTTP scope whose body has been read into `body`"""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    script_name = scope.get("root_path", "").encode("utf-8").decode("latin1")
+    path_info = scope["path"].encode("utf-8").decode("latin1")
+    if script_name and path_info.startswith(script_name):
+        path_info = path_info[len(script_name):]
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": script_name,
+        "PATH_INFO": path_info,
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin1"),
+        "SERVER_NAME": str(server[0]),
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "CONTENT_LENGTH": str(length),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for key, value in scope.get("headers", []):
+        name = key.decode("latin1").upper().replace("-", "_")
+        value = value.decode("latin1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name != "CONTENT_LENGTH":
+            name = "HTTP_" + name
+            environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+class WsgiBridge:
+    """
+    Serve a WSGI app (the Flask app) from the ASGI server.
+
+    The body is read on the event loop (spooled to disk past
+    SPOOL_MEMORY_BYTES), then the app runs on a pool of ASGI_WSGI_THREADS
+    threads and its output is sent back chunk by chunk. Unlike asgiref's
+    WsgiToAsgi, requests are not serialized onto a single thread.
+
+    `max_body` is a byte limit, or a callable returning the limit for a scope.
+    """
+
+    def __init__(self, wsgi_app, threads: int = ASGI_WSGI_THREADS,
+                 max_body: Union[None, int, Callable[[Dict[str, Any]], Optional[int]]] = None):
+        self.wsgi_app = wsgi_app
+        self.max_body = max_body
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="wsgi")
+
+    async def __call__(self, scope, receive, send):
+        max_body = self.max_body(scope) if callable(self.max_body) else self.max_body
+        body = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+        try:
+            length = 0
+            try:
+                async for chunk in body_chunks(receive):
+                    length += len(chunk)
+                    if max_body is not None and length > max_body:
+                        await send_json(send, {"error": "Request body too large"}, 413)
+                        return
+                    if length > SPOOL_MEMORY_BYTES:
+                        await asyncio.to_thread(body.write, chunk)
+                    else:
+                        body.write(chunk)
+            except ClientDisconnected:
+                return
+            body.seek(0)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self._executor, self._run, build_environ(scope, body, length), send, loop)
+        finally:
+            body.close()
+
+    def _run(self, environ, send, loop):
+        def emit(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response.get("sent"):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response["start"] = {
+                "type": "http.response.start",
+                "status": int(status.split(" ", 1)[0]),
+                "headers": _encode_headers(headers),
+            }
+            return lambda data: write(data)
+
+        def write(data):
+            if not response.get("sent"):
+                emit(response["start"])
+                response["sent"] = True
+            if data:
+                emit({"type": "http.response.body", "body": data, "more_body": True})
+
+        result = self.wsgi_app(environ, start_response)
+        try:
+            for data in result:
+                write(data)
+            write(b"")
+            emit({"type": "http.response.body", "body": b""})
+        finally:
+            if hasattr(result, "close"):
+                result.close()
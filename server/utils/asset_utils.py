@@ -0,0 +1,145 @@
+import os
+import re
+import hashlib
+import mimetypes
+import threading
+from typing import Optional, Dict, List
+
+from utils.catalogue_cache import supported_encodings, compress, GZIP_MIN_BYTES
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ASSET_ROOT = os.getenv("ASSET_ROOT", os.path.join(BASE_DIR, "..", "client"))
+# URL prefix of content-hashed (immutable) asset URLs
+ASSET_URL_PREFIX = "/assets/"
+HASH_LENGTH = 10
+# Larger files are listed in the manifest but read from disk per request
+ASSET_MEMORY_MAX_BYTES = int(os.getenv("ASSET_MEMORY_MAX_BYTES", str(1024 * 1024)))
+COMPRESSIBLE_TYPES = {"application/javascript", "application/json", "image/svg+xml"}
+# href="/shared.css", src="/utils.js": root-relative references rewritten to hashed URLs in HTML pages
+_REFERENCE_RE = re.compile(r'((?:href|src)=")(/[^"?#]+)(")')
+
+
+def _is_compressible(mimetype: str) -> bool:
+    return mimetype.startswith("text/") or mimetype in COMPRESSIBLE_TYPES
+
+
+class Asset:
+    """One client file: its hashed URL and, for small files, the ready-to-send bodies"""
+
+    __slots__ = ("path", "disk_path", "mimetype", "digest", "url", "body", "encoded", "mtime")
+
+    def __init__(self, path: str, disk_path: str, body: bytes, mtime: float):
+        self.path = path
+        self.disk_path = disk_path
+        self.mtime = mtime
+        self.mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if self.mimetype == "text/javascript":
+            self.mimetype = "application/javascript"
+        self.set_body(body)
+
+    def set_body(self, body: bytes):
+        self.digest = hashlib.sha256(body).hexdigest()[:HASH_LENGTH]
+        stem, ext = os.path.splitext(self.path)
+        self.url = f"{ASSET_URL_PREFIX}{stem}.{self.digest}{ext}"
+        in_memory = len(body) <= ASSET_MEMORY_MAX_BYTES
+        self.body: Optional[bytes] = body if in_memory else None
+        self.encoded: Dict[str, bytes] = {}
+        if in_memory and _is_compressible(self.mimetype) and len(body) >= GZIP_MIN_BYTES:
+            for encoding in supported_encodings():
+                self.encoded[encoding] = compress(body, encoding)
+
+
+class AssetManifest:
+    """
+    Every file under the client folder, read once at startup.
+
+    Each asset gets a content-hashed URL (/assets/shared.<hash>.css) that can
+    be cached forever, and small files are held in memory with their gzip (and
+    Brotli, if installed) bodies compressed ahead of time. HTML pages have
+    their root-relative href/src references rewritten to the hashed URLs, so a
+    deploy that changes a stylesheet changes the URL the pages ask for.
+    """
+
+    def __init__(self, root: str = ASSET_ROOT):
+        self.root = os.path.abspath(root)
+        self.by_path: Dict[str, Asset] = {}
+        self.by_url: Dict[str, Asset] = {}
+        self.build()
+
+    def _files(self) -> List[str]:
+        paths = []
+        for directory, dirs, files in os.walk(self.root):
+            dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+            for name in sorted(files):
+                if not name.startswith("."):
+                    paths.append(os.path.relpath(os.path.join(directory, name), self.root).replace(os.sep, "/"))
+        return paths
+
+    def build(self):
+        by_path = {}
+        for path in self._files():
+            disk_path = os.path.join(self.root, path)
+            try:
+                mtime = os.path.getmtime(disk_path)
+                with open(disk_path, "rb") as f:
+                    body = f.read()
+            except OSError as e:
+                print(f"[WARNING] Could not read asset {path}: {e}")
+                continue
+            by_path[path] = Asset(path, disk_path, body, mtime)
+        # Pages last, once every URL they may reference is known
+        for asset in by_path.values():
+            if asset.mimetype == "text/html" and asset.body is not None:
+                asset.set_body(self._rewrite(asset.body, by_path))
+        self.by_path = by_path
+        self.by_url = {asset.url: asset for asset in by_path.values()}
+
+    @staticmethod
+    def _rewrite(html: bytes, by_path: Dict[str, Asset]) -> bytes:
+        def replace(match):
+            asset = by_path.get(match.group(2).lstrip("/"))
+            return match.group(1) + asset.url + match.group(3) if asset is not None else match.group(0)
+        return _REFERENCE_RE.sub(replace, html.decode("utf-8")).encode("utf-8")
+
+    def stale(self) -> bool:
+        """Whether any file was added, removed or modified since the manifest was built"""
+        files = self._files()
+        if set(files) != set(self.by_path):
+            return True
+        for path in files:
+            try:
+                if os.path.getmtime(os.path.join(self.root, path)) != self.by_path[path].mtime:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def get(self, path: str) -> Optional[Asset]:
+        return self.by_path.get(path)
+
+    def get_url(self, url: str) -> Optional[Asset]:
+        return self.by_url.get(url)
+
+    def manifest(self) -> Dict[str, str]:
+        """Logical path -> hashed URL"""
+        return {path: asset.url for path, asset in sorted(self.by_path.items())}
+
+
+_manifest: Optional[AssetManifest] = None
+_manifest_lock = threading.Lock()
+
+
+def get_asset_manifest(reload: bool = False) -> AssetManifest:
+    """
+    Return the process-wide manifest, building it on first use.
+
+    With `reload` (the app's debug mode) it is rebuilt whenever a client file
+    changes, so edits show up without a restart.
+    """
+    global _manifest
+    with _manifest_lock:
+        if _manifest is None:
+            _manifest = AssetManifest()
+        elif reload and _manifest.stale():
+            _manifest.build()
+    return _manifest
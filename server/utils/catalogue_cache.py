@@ -0,0 +1,123 @@
+import json
+import gzip
+import threading
+from typing import Optional, Dict, Any, List, Callable
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip is always available
+    brotli = None
+
+from utils.metadata_utils import get_store
+from utils.metrics import CATALOGUE_CACHE_LOOKUPS
+
+
+# Bodies smaller than this are not worth compressing
+GZIP_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def supported_encodings() -> List[str]:
+    """Content encodings the server can produce, most preferred first"""
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def negotiate_encoding(accept_encodings) -> Optional[str]:
+    """Pick "br" or "gzip" from a werkzeug Accept-Encoding header, or None for identity"""
+    best, best_quality = None, 0
+    for encoding in supported_encodings():
+        quality = accept_encodings.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, GZIP_LEVEL, mtime=0)
+
+
+def serialize_catalogue(items: List[Dict[str, Any]]) -> bytes:
+    return json.dumps(items, separators=(",", ":")).encode("utf-8")
+
+
+class CatalogueSnapshot:
+    """The catalogue at one version: parsed records plus the ready-to-send response bodies"""
+
+    __slots__ = ("version", "items", "body", "_encoded", "_lock")
+
+    def __init__(self, version: int, items: List[Dict[str, Any]], body: bytes):
+        self.version = version
+        self.items = items
+        self.body = body
+        self._encoded: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def encoded(self, encoding: Optional[str]) -> Optional[bytes]:
+        """
+        The body compressed with `encoding`, compressed once per snapshot on first use.
+
+        Returns None for identity or when the body is too small to be worth compressing.
+        """
+        if encoding is None or len(self.body) < GZIP_MIN_BYTES:
+            return None
+        with self._lock:
+            if encoding not in self._encoded:
+                self._encoded[encoding] = compress(self.body, encoding)
+            return self._encoded[encoding]
+
+
+class CatalogueCache:
+    """
+    Per-process cache of the full catalogue response.
+
+    The snapshot is keyed by the store's catalogue version, which every worker
+    bumps on write (a MAX() over the SQLite change journal, or the stat-cached
+    JSON journal), so a hit costs one version lookup regardless of catalogue
+    size, and a write from any worker invalidates it on the next request. Only
+    one thread rebuilds a stale snapshot; the others wait for it.
+    """
+
+    def __init__(self, serialize: Callable[[List[Dict[str, Any]]], bytes] = serialize_catalogue):
+        self.serialize = serialize
+        self._snapshot: Optional[CatalogueSnapshot] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.rebuilds = 0
+
+    def get(self, store=None) -> CatalogueSnapshot:
+        store = store or get_store()
+        version = store.version()
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == version:
+            self.hits += 1
+            CATALOGUE_CACHE_LOOKUPS.inc(result="hit")
+            return snapshot
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.version != store.version():
+                # Read the version first: a write landing during the load only makes the
+                # snapshot newer than its version, and the next request rebuilds it
+                version = store.version()
+                items = store.all()
+                snapshot = CatalogueSnapshot(version, items, self.serialize(items))
+                # Most clients accept gzip; compress it now rather than on a request
+                snapshot.encoded("gzip")
+                self._snapshot = snapshot
+                self.rebuilds += 1
+                CATALOGUE_CACHE_LOOKUPS.inc(result="rebuild")
+            else:
+                CATALOGUE_CACHE_LOOKUPS.inc(result="hit")
+            return snapshot
+
+
+_cache: Optional[CatalogueCache] = None
+
+
+def get_catalogue_cache() -> CatalogueCache:
+    global _cache
+    if _cache is None:
+        _cache = CatalogueCache()
+    return _cache
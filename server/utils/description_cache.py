@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import fcntl
+import hashlib
+import tempfile
+import threading
+from typing import Optional, Dict, Any
+
+from utils.metrics import DESCRIPTION_CACHE_LOOKUPS
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.getenv("DESCRIPTION_CACHE_DIR", os.path.join(BASE_DIR, "cache", "descriptions"))
+CACHE_MAX_BYTES = int(os.getenv("DESCRIPTION_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+CACHE_MAX_AGE = float(os.getenv("DESCRIPTION_CACHE_MAX_AGE", str(30 * 24 * 3600)))
+# Run an eviction pass after this many writes from one process
+EVICT_EVERY = 50
+
+
+def cache_key(image_bytes: bytes, model: str, prompt_version: str) -> str:
+    """Content address for a description: image bytes plus everything that shapes the answer"""
+    digest = hashlib.sha256(image_bytes)
+    digest.update(f"\0{model}\0{prompt_version}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class DescriptionCache:
+    """
+    On-disk cache of parsed item descriptions, shared by all worker processes.
+
+    Entries are small JSON files named by content hash and fanned out over
+    256 subdirectories. A hit bumps the file's mtime, so eviction (oldest mtime
+    first once the cache exceeds `max_bytes`, plus anything older than
+    `max_age`) approximates LRU. Only one process evicts at a time.
+    """
+
+    def __init__(self, directory: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES, max_age: float = CACHE_MAX_AGE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age:
+                os.remove(path)
+                raise FileNotFoundError(path)
+            with open(path, "r") as f:
+                value = json.load(f)
+            os.utime(path)
+        except (OSError, json.JSONDecodeError):
+            with self._lock:
+                self.misses += 1
+            DESCRIPTION_CACHE_LOOKUPS.inc(result="miss")
+            return None
+        with self._lock:
+            self.hits += 1
+        DESCRIPTION_CACHE_LOOKUPS.inc(result="hit")
+        return value
+
+    def put(self, key: str, value: Dict[str, Any]):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = tempfile.NamedTemporaryFile("w", delete=False, dir=os.path.dirname(path), suffix=".tmp")
+        json.dump(value, tmp)
+        tmp.close()
+        os.replace(tmp.name, path)
+        with self._lock:
+            self.writes += 1
+            due = self.writes % EVICT_EVERY == 0
+        if due:
+            self.evict()
+
+    def evict(self) -> int:
+        """Drop expired entries, then least recently used ones until under max_bytes"""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, ".evict.lock"), "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0  # another worker is already evicting
+            entries = []
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    if name.endswith(".json"):
+                        path = os.path.join(root, name)
+                        try:
+                            st = os.stat(path)
+                        except OSError:
+                            continue
+                        entries.append((st.st_mtime, st.st_size, path))
+            entries.sort()
+            total = sum(size for _, size, _ in entries)
+            cutoff = time.time() - self.max_age
+            removed = 0
+            for mtime, size, path in entries:
+                if mtime >= cutoff and total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+        with self._lock:
+            self.evictions += removed
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "writes": self.writes, "evictions": self.evictions}
+
+
+_cache: Optional[DescriptionCache] = None
+
+
+def get_description_cache() -> DescriptionCache:
+    global _cache
+    if _cache is None:
+        _cache = DescriptionCache()
+    return _cache
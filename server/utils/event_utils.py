@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import asyncio
+import threading
+from typing import Optional, Dict, Any, List
+
+from utils.metadata_utils import get_store, add_change_listener
+
+# How often each worker checks the store's catalogue version for changes
+POLL_INTERVAL = float(os.getenv("SSE_POLL_INTERVAL", "0.5"))
+# Number of recent events kept in memory for Last-Event-ID replay
+REPLAY_BUFFER_SIZE = int(os.getenv("SSE_REPLAY_BUFFER", "500"))
+# Streams are closed after this long; EventSource reconnects with Last-Event-ID
+MAX_STREAM_SECONDS = float(os.getenv("SSE_MAX_STREAM_SECONDS", "30"))
+# Concurrent streams allowed per sync worker process before clients fall back to polling. Each open
+# stream pins a worker thread, so the default (0) serves streams only through the ASGI server; raise
+# it when gunicorn runs gevent workers
+MAX_SUBSCRIBERS = int(os.getenv("SSE_MAX_SUBSCRIBERS", "0"))
+# Under the ASGI server a stream holds no thread, so many more may stay open for longer
+ASYNC_MAX_SUBSCRIBERS = int(os.getenv("SSE_ASYNC_MAX_SUBSCRIBERS", "1000"))
+ASYNC_MAX_STREAM_SECONDS = float(os.getenv("SSE_ASYNC_MAX_STREAM_SECONDS", "300"))
+HEARTBEAT_SECONDS = 15.0
+RETRY_MS = 3000
+
+
+class ChangeBroadcaster:
+    """
+    Per-process fan-out of catalogue changes to SSE subscribers.
+
+    The store is the pub/sub channel: a single background thread per worker
+    watches the catalogue version (writes from any gunicorn worker bump it) and
+    turns new journal entries into events. Subscribers never query the store
+    themselves; they wait on a condition and read from the replay buffer, so the
+    store sees one cheap version check per poll interval regardless of how many
+    tabs are connected.
+    """
+
+    def __init__(self, poll_interval: float = POLL_INTERVAL, buffer_size: int = REPLAY_BUFFER_SIZE):
+        self.poll_interval = poll_interval
+        self.buffer_size = buffer_size
+        self._cond = threading.Condition()
+        self._wakeup = threading.Event()
+        self._events: List[Dict[str, Any]] = []
+        # Version the buffer starts after; events in (floor, version] are all buffered
+        self._floor = 0
+        self.version: Optional[int] = None
+        self._thread = None
+        self._thread_pid = None
+        # (event loop, future) pairs of async subscribers waiting for a change
+        self._async_waiters = set()
+        self.subscribers = 0
+
+    def start(self):
+        with self._cond:
+            if self._thread is not None and self._thread_pid == os.getpid():
+                return
+            self.version = get_store().version()
+            self._floor = self.version
+            self._events = []
+            self._thread = threading.Thread(target=self._run, name="sse-broadcaster", daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def wake(self, *_):
+        """Check for changes now instead of at the next poll"""
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            try:
+                self._poll()
+            except Exception as e:
+                print(f"[WARNING] SSE broadcaster poll failed: {e}")
+
+    def _poll(self):
+        store = get_store()
+        version = store.version()
+        if version == self.version:
+            return
+        changes = store.changes_since(self.version)
+        with self._cond:
+            if changes is None:
+                changes = [{"version": version, "op": "reset"}]
+            self._events.extend(changes)
+            overflow = len(self._events) - self.buffer_size
+            if overflow > 0:
+                self._floor = self._events[overflow - 1]["version"]
+                del self._events[:overflow]
+            self.version = version
+            self._cond.notify_all()
+            for loop, future in self._async_waiters:
+                loop.call_soon_threadsafe(_resolve, future)
+
+    def events_after(self, last_id: int) -> List[Dict[str, Any]]:
+        """Events newer than `last_id`, replayed from the buffer or, if older, from the store"""
+        with self._cond:
+            if self._floor <= last_id <= self.version:
+                return [event for event in self._events if event["version"] > last_id]
+            current = self.version
+        if last_id > current:
+            # A version seen through another worker, ahead of this watcher's last poll: nothing
+            # to send yet. Only one the store has never reached (e.g. a replaced database) resets
+            current = get_store().version()
+            if last_id <= current:
+                return []
+            return [{"version": current, "op": "reset"}]
+        changes = get_store().changes_since(last_id)
+        if changes is None:
+            return [{"version": current, "op": "reset"}]
+        return changes
+
+    def wait(self, last_id: int, timeout: float) -> bool:
+        """Block until the catalogue moves past `last_id` or the timeout expires"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.version > last_id, timeout)
+
+    async def wait_async(self, last_id: int, timeout: float) -> bool:
+        """wait() for event-loop callers; the watcher thread resolves a future instead of a condition"""
+        loop = asyncio.get_running_loop()
+        waiter = (loop, loop.create_future())
+        with self._cond:
+            if self.version > last_id:
+                return True
+            self._async_waiters.add(waiter)
+        try:
+            await asyncio.wait_for(waiter[1], timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._cond:
+                self._async_waiters.discard(waiter)
+
+    def acquire_subscriber(self, limit: int = MAX_SUBSCRIBERS) -> bool:
+        with self._cond:
+            if self.subscribers >= limit:
+                return False
+            self.subscribers += 1
+            return True
+
+    def release_subscriber(self):
+        with self._cond:
+            self.subscribers -= 1
+
+
+def format_event(event: Dict[str, Any]) -> str:
+    """Serialize one change as an SSE frame whose id is the catalogue version"""
+    return f"id: {event['version']}\nevent: {event['op']}\ndata: {json.dumps(event)}\n\n"
+
+
+def stream_changes(broadcaster: ChangeBroadcaster, last_id: int, max_seconds: float = MAX_STREAM_SECONDS):
+    """
+    Generate SSE frames from `last_id` onwards for at most `max_seconds`.
+
+    Streams are deliberately short-lived so a sync worker thread is only lent
+    to a subscriber briefly; the `retry` hint makes EventSource reconnect with
+    Last-Event-ID and the replay buffer fills in anything missed in between.
+    """
+    deadline = time.monotonic() + max_seconds
+    last_heartbeat = time.monotonic()
+    yield f"retry: {RETRY_MS}\n\n"
+    while True:
+        events = broadcaster.events_after(last_id)
+        for event in events:
+            yield format_event(event)
+            last_id = event["version"]
+        if events and events[-1]["op"] == "reset":
+            return
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        if not broadcaster.wait(last_id, min(remaining, HEARTBEAT_SECONDS)):
+            if time.monotonic() - last_heartbeat >= HEARTBEAT_SECONDS:
+                yield ": ping\n\n"
+                last_heartbeat = time.monotonic()
+
+
+async def stream_changes_async(broadcaster: ChangeBroadcaster, last_id: int, max_seconds: float = ASYNC_MAX_STREAM_SECONDS):
+    """stream_changes() as an async generator, for the ASGI server"""
+    deadline = time.monotonic() + max_seconds
+    last_heartbeat = time.monotonic()
+    yield f"retry: {RETRY_MS}\n\n"
+    while True:
+        # Usually served from memory, but an old Last-Event-ID reads the store
+        events = await asyncio.to_thread(broadcaster.events_after, last_id)
+        for event in events:
+            yield format_event(event)
+            last_id = event["version"]
+        if events and events[-1]["op"] == "reset":
+            return
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        if not await broadcaster.wait_async(last_id, min(remaining, HEARTBEAT_SECONDS)):
+            if time.monotonic() - last_heartbeat >= HEARTBEAT_SECONDS:
+                yield ": ping\n\n"
+                last_heartbeat = time.monotonic()
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(True)
+
+
+_broadcaster: Optional[ChangeBroadcaster] = None
+_broadcaster_lock = threading.Lock()
+
+
+def get_broadcaster() -> ChangeBroadcaster:
+    """Return this process's broadcaster, starting its watcher thread on first use"""
+    global _broadcaster
+    with _broadcaster_lock:
+        if _broadcaster is None:
+            _broadcaster = ChangeBroadcaster()
+            # Writes made by this worker are pushed without waiting for the next poll
+            add_change_listener(_broadcaster.wake)
+        _broadcaster.start()
+    return _broadcaster
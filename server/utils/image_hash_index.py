@@ -0,0 +1,219 @@
+import os
+import sys
+from array import array
+from itertools import combinations
+from threading import RLock
+from collections import defaultdict
+from typing import Optional, Dict, Any, List, Tuple
+
+from utils.metadata_utils import get_store, update_metadata, BASE_DIR
+from utils.image_utils import perceptual_hash
+
+
+# 64-bit hashes are split into BANDS chunks for multi-index hashing
+HASH_BITS = 64
+BANDS = 4
+BAND_BITS = HASH_BITS // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+
+# Largest Hamming distance reported as "similar" by photo lookup
+SIMILAR_MAX_DISTANCE = int(os.getenv("SIMILAR_MAX_DISTANCE", "12"))
+# Largest distance treated as a re-photographed, already catalogued item (-1 disables)
+DUPLICATE_MAX_DISTANCE = int(os.getenv("DUPLICATE_MAX_DISTANCE", "4"))
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+_flip_masks: Dict[int, List[int]] = {}
+
+
+def _flip_masks_within(radius: int) -> List[int]:
+    """Every BAND_BITS-bit mask with at most `radius` bits set"""
+    if radius not in _flip_masks:
+        masks = []
+        for r in range(radius + 1):
+            for bits in combinations(range(BAND_BITS), r):
+                mask = 0
+                for bit in bits:
+                    mask |= 1 << bit
+                masks.append(mask)
+        _flip_masks[radius] = masks
+    return _flip_masks[radius]
+
+
+def _bands(value: int) -> List[int]:
+    return [(value >> (i * BAND_BITS)) & BAND_MASK for i in range(BANDS)]
+
+
+class ImageHashIndex:
+    """
+    Hamming-distance index over 64-bit perceptual hashes (multi-index hashing).
+
+    Hashes are kept in a flat `array('Q')` indexed by slot, with one table per
+    16-bit band mapping band value -> slots. Two hashes within distance d agree
+    to within d // 4 bits on at least one band (pigeonhole), so a search only
+    probes band values within that radius and verifies the few candidates
+    against the full hash.
+    """
+
+    def __init__(self):
+        self._lock = RLock()
+        self.hashes = array("Q")
+        self.filenames: List[Optional[str]] = []
+        self.slots: Dict[str, int] = {}
+        self._free: List[int] = []
+        self.tables: List[Dict[int, List[int]]] = [defaultdict(list) for _ in range(BANDS)]
+        # Catalogue version the index reflects
+        self.version = 0
+
+    def __len__(self):
+        return len(self.slots)
+
+    def add(self, filename: str, image_hash: str):
+        try:
+            value = int(image_hash, 16)
+        except (TypeError, ValueError):
+            return
+        with self._lock:
+            self.remove(filename)
+            if self._free:
+                slot = self._free.pop()
+                self.hashes[slot] = value
+                self.filenames[slot] = filename
+            else:
+                slot = len(self.hashes)
+                self.hashes.append(value)
+                self.filenames.append(filename)
+            self.slots[filename] = slot
+            for table, band in zip(self.tables, _bands(value)):
+                table[band].append(slot)
+
+    def remove(self, filename: str):
+        with self._lock:
+            slot = self.slots.pop(filename, None)
+            if slot is None:
+                return
+            for table, band in zip(self.tables, _bands(self.hashes[slot])):
+                bucket = table[band]
+                bucket.remove(slot)
+                if not bucket:
+                    del table[band]
+            self.filenames[slot] = None
+            self._free.append(slot)
+
+    def search(self, image_hash: str, max_distance: int = SIMILAR_MAX_DISTANCE, k: int = 10) -> List[Tuple[str, int]]:
+        """
+        Catalogued images within `max_distance` bits of `image_hash`.
+
+        Returns:
+            Up to `k` (filename, distance) pairs, closest first
+        """
+        if max_distance < 0:
+            return []
+        value = int(image_hash, 16)
+        masks = _flip_masks_within(min(max_distance // BANDS, BAND_BITS))
+        with self._lock:
+            candidates = set()
+            for table, band in zip(self.tables, _bands(value)):
+                for mask in masks:
+                    bucket = table.get(band ^ mask)
+                    if bucket:
+                        candidates.update(bucket)
+            hits = []
+            for slot in candidates:
+                distance = hamming(value, self.hashes[slot])
+                if distance <= max_distance:
+                    hits.append((distance, self.filenames[slot]))
+        hits.sort()
+        return [(filename, distance) for distance, filename in hits[:k]]
+
+
+_index: Optional[ImageHashIndex] = None
+_index_lock = RLock()
+
+
+def _build_index() -> ImageHashIndex:
+    store = get_store()
+    index = ImageHashIndex()
+    # Read the version first so changes landing during the load are replayed
+    index.version = store.version()
+    for record in store.all():
+        if record.get("image_hash"):
+            index.add(record["filename"], record["image_hash"])
+    return index
+
+
+def get_image_hash_index() -> ImageHashIndex:
+    """Return the process-wide image hash index, kept current from the store's change feed"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = _build_index()
+            return _index
+        store = get_store()
+        if store.version() != _index.version:
+            changes = store.changes_since(_index.version)
+            if changes is None:
+                _index = _build_index()
+            else:
+                apply_changes(_index, changes)
+        return _index
+
+
+def apply_changes(index: ImageHashIndex, changes: List[Dict[str, Any]]):
+    with index._lock:
+        for change in changes:
+            if change["op"] == "delete":
+                index.remove(change["filename"])
+            elif change["item"].get("image_hash"):
+                index.add(change["filename"], change["item"]["image_hash"])
+            else:
+                index.remove(change["filename"])
+            index.version = change["version"]
+
+
+def find_similar(image_hash: Optional[str], max_distance: int = SIMILAR_MAX_DISTANCE, k: int = 10) -> List[Dict[str, Any]]:
+    """
+    Catalogued items whose photo is perceptually close to `image_hash`.
+
+    Returns:
+        Up to `k` records, closest first, each with its Hamming `distance`
+    """
+    if not image_hash:
+        return []
+    store = get_store()
+    results = []
+    for filename, distance in get_image_hash_index().search(image_hash, max_distance, k):
+        record = store.get(filename)
+        if record is not None:
+            results.append(dict(record, distance=distance))
+    return results
+
+
+def backfill_image_hashes(upload_folder: str) -> int:
+    """Hash stored images whose records predate perceptual hashing; returns how many were updated"""
+    updated = 0
+    for record in get_store().all():
+        if record.get("image_hash"):
+            continue
+        path = os.path.join(upload_folder, os.path.basename(record.get("filename") or ""))
+        if not os.path.isfile(path):
+            continue
+        image_hash = perceptual_hash(path)
+        if image_hash and update_metadata(record["filename"], {"image_hash": image_hash}):
+            updated += 1
+    return updated
+
+
+def main(argv=None):
+    """Backfill, run from server/: python -m utils.image_hash_index [uploads folder]"""
+    argv = sys.argv[1:] if argv is None else argv
+    upload_folder = argv[0] if argv else os.path.join(BASE_DIR, "uploads")
+    count = backfill_image_hashes(upload_folder)
+    print(f"[INFO] Added image hashes to {count} records")
+
+
+if __name__ == "__main__":
+    main()
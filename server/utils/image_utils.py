@@ -0,0 +1,239 @@
+import io
+import os
+import glob
+import hashlib
+import tempfile
+from typing import Tuple, Optional, Dict
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it images are stored and sent as uploaded
+    Image = None
+    ImageOps = None
+
+
+# Images at rest: longest side, encoder quality and format ("JPEG" or "WEBP")
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "1600"))
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "82"))
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "JPEG").upper()
+# Already-small JPEGs below this size are kept byte-for-byte to avoid re-encoding loss
+IMAGE_RECOMPRESS_MIN_BYTES = int(os.getenv("IMAGE_RECOMPRESS_MIN_BYTES", str(300 * 1024)))
+
+# Variant sent to the vision API; "low" detail is billed as a single 512px tile
+VISION_MAX_DIMENSION = int(os.getenv("VISION_MAX_DIMENSION", "512"))
+VISION_QUALITY = int(os.getenv("VISION_QUALITY", "70"))
+VISION_DETAIL = os.getenv("VISION_DETAIL", "low")
+
+FORMAT_EXTENSIONS = {"JPEG": "jpg", "WEBP": "webp"}
+
+
+def _load_upright(image_path: str):
+    """Open an image with its EXIF orientation applied, in RGB"""
+    image = Image.open(image_path)
+    original_format = image.format
+    rotated = _has_orientation(image)
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    return image, original_format, rotated
+
+
+def _has_orientation(image) -> bool:
+    try:
+        return image.getexif().get(0x0112, 1) != 1
+    except Exception:
+        return False
+
+
+def _encode(image, fmt: str, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    options = {"quality": quality}
+    if fmt == "JPEG":
+        options.update(optimize=True, progressive=True)
+    else:
+        options.update(method=4)
+    image.save(buffer, format=fmt, **options)
+    return buffer.getvalue()
+
+
+def preprocess_image(image_path: str) -> str:
+    """
+    Normalize an uploaded image in place before it is described and stored.
+
+    Applies the EXIF orientation, downscales so the longest side is at most
+    IMAGE_MAX_DIMENSION and re-encodes as IMAGE_FORMAT at IMAGE_QUALITY. This
+    also strips EXIF metadata such as GPS position. Small, upright JPEGs are
+    left untouched.
+
+    Args:
+        image_path: Path of the uploaded image; overwritten with the result
+
+    Returns:
+        File extension matching the stored format ("jpg" or "webp")
+    """
+    if Image is None:
+        return "jpg"
+    try:
+        image, original_format, rotated = _load_upright(image_path)
+        fmt = IMAGE_FORMAT if IMAGE_FORMAT in FORMAT_EXTENSIONS else "JPEG"
+        oversized = max(image.size) > IMAGE_MAX_DIMENSION
+        original_size = os.path.getsize(image_path)
+        if (not oversized and not rotated and original_format == fmt
+                and original_size < IMAGE_RECOMPRESS_MIN_BYTES):
+            return FORMAT_EXTENSIONS[fmt]
+        if oversized:
+            image.thumbnail((IMAGE_MAX_DIMENSION, IMAGE_MAX_DIMENSION), Image.LANCZOS)
+        data = _encode(image, fmt, IMAGE_QUALITY)
+        with open(image_path, "wb") as f:
+            f.write(data)
+        print(f"[DEBUG] Preprocessed image {original_size} -> {len(data)} bytes, {image.size[0]}x{image.size[1]} {fmt}")
+        return FORMAT_EXTENSIONS[fmt]
+    except Exception as e:
+        print(f"[WARNING] Image preprocessing failed, keeping original: {e}")
+        return "jpg"
+
+
+def vision_payload(image_path: str) -> Tuple[bytes, str]:
+    """
+    Small JPEG variant of an image for the vision API.
+
+    Returns:
+        Tuple of (image bytes, mimetype); the original bytes if Pillow is unavailable
+    """
+    if Image is not None:
+        try:
+            image, _, _ = _load_upright(image_path)
+            image.thumbnail((VISION_MAX_DIMENSION, VISION_MAX_DIMENSION), Image.LANCZOS)
+            return _encode(image, "JPEG", VISION_QUALITY), "image/jpeg"
+        except Exception as e:
+            print(f"[WARNING] Could not build vision variant, sending original: {e}")
+    with open(image_path, "rb") as f:
+        return f.read(), "image/jpeg"
+
+
+def perceptual_hash(image_path: str) -> Optional[str]:
+    """
+    64-bit difference hash (dHash) of an image, as 16 hex digits.
+
+    The image is reduced to 9x8 grayscale and each bit records whether a pixel
+    is brighter than its right-hand neighbour, so re-encoding, rescaling and
+    small exposure changes flip few bits. Returns None without Pillow.
+    """
+    if Image is None:
+        return None
+    try:
+        image = Image.open(image_path)
+        image.draft("L", (64, 64))  # let the JPEG decoder downscale cheaply
+        image = ImageOps.exif_transpose(image).convert("L").resize((9, 8), Image.LANCZOS)
+        pixels = list(image.getdata())
+    except Exception as e:
+        print(f"[WARNING] Could not hash image {image_path}: {e}")
+        return None
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = bits << 1 | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f"{bits:016x}"
+
+
+# Responsive derivatives: variant name -> longest side in pixels
+DERIVATIVE_SIZES = {"thumb": 320, "medium": 800}
+DERIVATIVE_QUALITY = int(os.getenv("DERIVATIVE_QUALITY", "75"))
+DERIVED_DIRNAME = "derived"
+
+
+def content_digest(image_path: str) -> str:
+    """Short content hash used to version derivative URLs"""
+    digest = hashlib.sha256()
+    with open(image_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def derivative_path(upload_folder: str, filename: str, variant: str, digest: str) -> str:
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    return os.path.join(upload_folder, DERIVED_DIRNAME, f"{stem}.{variant}.{digest}.jpg")
+
+
+def ensure_derivative(upload_folder: str, filename: str, variant: str, digest: str) -> Optional[str]:
+    """
+    Return the path of a derivative, generating it on first use.
+
+    Derivatives are memoized on disk under uploads/derived/ and named by the
+    source's content digest, so a URL that embeds the digest never changes
+    meaning and can be cached forever. Returns None if the variant is unknown,
+    the source is missing or no longer matches `digest`, or Pillow is missing.
+    """
+    if Image is None or variant not in DERIVATIVE_SIZES:
+        return None
+    path = derivative_path(upload_folder, filename, variant, digest)
+    if os.path.exists(path):
+        return path
+    source = os.path.join(upload_folder, os.path.basename(filename))
+    if not os.path.isfile(source) or content_digest(source) != digest:
+        return None
+    try:
+        image, _, _ = _load_upright(source)
+        size = DERIVATIVE_SIZES[variant]
+        image.thumbnail((size, size), Image.LANCZOS)
+        data = _encode(image, "JPEG", DERIVATIVE_QUALITY)
+    except Exception as e:
+        print(f"[WARNING] Could not create {variant} derivative for {filename}: {e}")
+        return None
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = tempfile.NamedTemporaryFile("wb", delete=False, dir=os.path.dirname(path), suffix=".tmp")
+    tmp.write(data)
+    tmp.close()
+    os.replace(tmp.name, path)
+    return path
+
+
+def create_derivatives(upload_folder: str, filename: str) -> Dict[str, str]:
+    """
+    Generate every derivative for a stored upload.
+
+    Returns:
+        Mapping of variant name to its URL path (/derived/<variant>/<digest>/<filename>);
+        empty if Pillow is unavailable
+    """
+    if Image is None:
+        return {}
+    digest = content_digest(os.path.join(upload_folder, filename))
+    urls = {}
+    for variant in DERIVATIVE_SIZES:
+        if ensure_derivative(upload_folder, filename, variant, digest):
+            urls[variant] = f"/derived/{variant}/{digest}/{filename}"
+    return urls
+
+
+def remove_derivatives(upload_folder: str, filename: str) -> int:
+    """Delete every derivative of `filename`; returns how many files were removed"""
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    removed = 0
+    for path in glob.glob(os.path.join(upload_folder, DERIVED_DIRNAME, f"{glob.escape(stem)}.*.jpg")):
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError as e:
+            print(f"[WARNING] Could not delete derivative {path}: {e}")
+    return removed
+
+
+def remove_image_files(upload_folder: str, filename: str) -> int:
+    """Delete a catalogued image and its derivatives; returns how many files were removed"""
+    removed = 0
+    image_path = os.path.join(upload_folder, os.path.basename(filename))
+    if os.path.exists(image_path):
+        try:
+            os.remove(image_path)
+            removed += 1
+            print(f"[INFO] Deleted image file: {image_path}")
+        except OSError as e:
+            print(f"[WARNING] Could not delete image file: {e}")
+    return removed + remove_derivatives(upload_folder, filename)
+
+
+def derivative_stem(derived_name: str) -> str:
+    """Stem of the image a derivative file (<stem>.<variant>.<digest>.jpg) belongs to"""
+    return derived_name.rsplit(".", 3)[0]
@@ -0,0 +1,235 @@
+import os
+import json
+import fcntl
+import time
+import uuid
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, Callable, List
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+JOBS_DIR = os.getenv("JOBS_DIR", os.path.join(BASE_DIR, "jobs"))
+# Description calls running at once in each worker process
+JOB_WORKERS = int(os.getenv("DETECT_JOB_WORKERS", "4"))
+# Jobs allowed to wait in each worker process before new ones are refused
+JOB_QUEUE_LIMIT = int(os.getenv("DETECT_JOB_QUEUE_LIMIT", "32"))
+
+PENDING_STATUSES = ("queued", "running")
+# Held while a pool claims orphaned jobs, so two new workers never take the same one
+RESUME_LOCK_FILE = ".resume.lock"
+
+
+class QueueFullError(Exception):
+    """Raised when the job pool has no room for another job"""
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
+
+
+def _job_path(job_id: str) -> str:
+    return os.path.join(JOBS_DIR, f"{os.path.basename(job_id)}.json")
+
+
+def _write_job(job: Dict[str, Any]):
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    tmp = tempfile.NamedTemporaryFile("w", delete=False, dir=JOBS_DIR, suffix=".tmp")
+    json.dump(job, tmp)
+    tmp.close()
+    os.replace(tmp.name, _job_path(job["id"]))
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """Read a job's status file; works from any worker process"""
+    try:
+        with open(_job_path(job_id), "r") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def update_job(job_id: str, **fields) -> Optional[Dict[str, Any]]:
+    job = get_job(job_id)
+    if job is None:
+        return None
+    job.update(fields, updated=_now())
+    _write_job(job)
+    return job
+
+
+def process_start_time(pid: int) -> Optional[int]:
+    """When a process started, in clock ticks since boot (/proc/<pid>/stat field 22); None where unavailable"""
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            stat = f.read()
+        # The command name (field 2) may contain spaces, so count fields from its closing parenthesis
+        return int(stat.rsplit(")", 1)[1].split()[19])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def pid_alive(pid: Optional[int], started: Optional[int] = None) -> bool:
+    """
+    Whether a process with this pid is running on this host.
+
+    With `started` (its process_start_time), a different process that has
+    since been given the same pid, e.g. after a container restart, does not
+    count.
+    """
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    if started is not None:
+        current = process_start_time(pid)
+        if current is not None and current != started:
+            return False
+    return True
+
+
+def _owner() -> Dict[str, Any]:
+    """Job fields naming this process as the owner"""
+    pid = os.getpid()
+    return {"pid": pid, "pid_started": process_start_time(pid)}
+
+
+def pending_jobs() -> List[Dict[str, Any]]:
+    """Jobs that are queued or running (or were, in a worker that has since died)"""
+    if not os.path.isdir(JOBS_DIR):
+        return []
+    jobs = []
+    for name in os.listdir(JOBS_DIR):
+        if name.endswith(".json"):
+            job = get_job(name[:-len(".json")])
+            if job and job.get("status") in PENDING_STATUSES:
+                jobs.append(job)
+    return jobs
+
+
+def remove_finished_jobs(max_age: float) -> int:
+    """Delete status files of jobs that finished more than `max_age` seconds ago"""
+    if not os.path.isdir(JOBS_DIR):
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for name in os.listdir(JOBS_DIR):
+        if name == RESUME_LOCK_FILE:
+            continue
+        path = os.path.join(JOBS_DIR, name)
+        try:
+            if os.path.getmtime(path) >= cutoff:
+                continue
+            if name.endswith(".json"):
+                job = get_job(name[:-len(".json")])
+                if job is not None and job.get("status") in PENDING_STATUSES:
+                    continue
+            # Leftover .tmp files from an interrupted write go too
+            os.remove(path)
+            removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+class JobPool:
+    """
+    Bounded per-process pool for background jobs.
+
+    Job state lives in small JSON files under JOBS_DIR so that any gunicorn
+    worker can answer a status request, and so that jobs left behind by a worker
+    that died are picked up again by the next pool to start.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, queue_limit: int = JOB_QUEUE_LIMIT):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="detect-job")
+        self.queue_limit = queue_limit
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            if self._pending >= self.queue_limit:
+                raise QueueFullError("Detection queue is full, try again shortly")
+            self._pending += 1
+        job = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "status": "queued",
+            "payload": payload,
+            **_owner(),
+            "created": _now(),
+            "updated": _now(),
+        }
+        _write_job(job)
+        self.executor.submit(self._run, job["id"])
+        return job
+
+    def _run(self, job_id: str):
+        try:
+            job = update_job(job_id, status="running", **_owner())
+            if job is None:
+                return
+            try:
+                result = _handlers[job["kind"]](**job["payload"])
+                update_job(job_id, status="done", result=result)
+            except Exception as e:
+                print(f"[ERROR] Job {job_id} failed: {e}")
+                update_job(job_id, status="failed", error=str(e))
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def resume_orphaned(self):
+        """Re-run queued/running jobs whose owning process is gone"""
+        if not os.path.isdir(JOBS_DIR):
+            return
+        claimed = []
+        # Workers restarted together all scan at once; each job is claimed (its pid
+        # set to ours) under the lock, so the others see a live owner and skip it
+        with open(os.path.join(JOBS_DIR, RESUME_LOCK_FILE), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                for name in os.listdir(JOBS_DIR):
+                    if not name.endswith(".json"):
+                        continue
+                    job = get_job(name[:-len(".json")])
+                    if not job or job.get("status") not in PENDING_STATUSES:
+                        continue
+                    if pid_alive(job.get("pid"), job.get("pid_started")) or job.get("kind") not in _handlers:
+                        continue
+                    if update_job(job["id"], status="queued", **_owner()) is not None:
+                        claimed.append(job["id"])
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        for job_id in claimed:
+            print(f"[INFO] Resuming orphaned job {job_id}")
+            with self._lock:
+                self._pending += 1
+            self.executor.submit(self._run, job_id)
+
+_pool: Optional[JobPool] = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_handlers: Dict[str, Callable[..., Dict[str, Any]]] = {}
+
+
+def register_job_handler(kind: str, handler: Callable[..., Dict[str, Any]]):
+    """Register the function run for jobs of `kind`; its return value becomes the job result"""
+    _handlers[kind] = handler
+
+
+def get_job_pool() -> JobPool:
+    """Return this process's job pool, creating it (and resuming orphans) on first use"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = JobPool()
+            _pool_pid = os.getpid()
+            _pool.resume_orphaned()
+    return _pool
@@ -0,0 +1,342 @@
+import io
+import os
+import sys
+import json
+import time
+import fcntl
+import random
+import shutil
+import tarfile
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, Any, List
+
+from utils.metadata_utils import get_store, delete_many_metadata
+from utils.image_utils import remove_image_files, derivative_stem, DERIVED_DIRNAME
+from utils.job_utils import pending_jobs, remove_finished_jobs, pid_alive
+from utils.description_cache import get_description_cache
+from utils.profiling import PROFILE_DIR
+from utils.upload_utils import dir_in_use
+from utils.metrics import REGISTRY, MAINTENANCE_REMOVED
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Seconds between maintenance passes across the deployment (0 disables the scheduler)
+MAINTENANCE_INTERVAL = float(os.getenv("MAINTENANCE_INTERVAL", "3600"))
+# Items older than this many days are archived or deleted (0 keeps them forever)
+RETENTION_DAYS = float(os.getenv("RETENTION_DAYS", "0"))
+# "archive" writes expired items to a .tar.gz bundle before removing them; "delete" just removes them
+RETENTION_MODE = os.getenv("RETENTION_MODE", "archive").lower()
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join(BASE_DIR, "archive"))
+# Items per archive bundle (and per metadata write)
+ARCHIVE_BATCH_SIZE = 500
+# Temporary upload files older than this are left over from failed requests
+TEMP_MAX_AGE = float(os.getenv("TEMP_MAX_AGE", "3600"))
+# Removing images that no record refers to is opt-in: a store that comes back empty (a wrong
+# METADATA_DB, a switched backend) would otherwise make every photo look orphaned
+ORPHAN_SWEEP = os.getenv("ORPHAN_SWEEP", "false").lower() == "true"
+# Images without a record are only removed once this old, so in-flight uploads and ingests are safe
+ORPHAN_MIN_AGE = float(os.getenv("ORPHAN_MIN_AGE", str(24 * 3600)))
+# A pass that would remove more orphaned files than this removes none and warns instead
+ORPHAN_MAX_REMOVALS = int(os.getenv("ORPHAN_MAX_REMOVALS", "500"))
+# Finished job status files and request profiles are kept this long
+JOB_MAX_AGE = float(os.getenv("JOB_MAX_AGE", str(7 * 24 * 3600)))
+PROFILE_MAX_AGE = float(os.getenv("PROFILE_MAX_AGE", str(7 * 24 * 3600)))
+STATE_FILE = os.getenv("MAINTENANCE_STATE_FILE", os.path.join(BASE_DIR, "cache", "maintenance.json"))
+# How often each worker checks whether a pass is due
+CHECK_INTERVAL = 60.0
+
+
+def _older_than(path: str, max_age: float) -> bool:
+    try:
+        return time.time() - os.path.getmtime(path) > max_age
+    except OSError:
+        return False
+
+
+def _remove(path: str) -> bool:
+    try:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+        return True
+    except OSError as e:
+        print(f"[WARNING] Could not remove {path}: {e}")
+        return False
+
+
+def write_bundle(records: List[Dict[str, Any]], upload_folder: str, directory: str = ARCHIVE_DIR) -> str:
+    """
+    Write items and their original images to a .tar.gz bundle.
+
+    The bundle holds manifest.json (archive time and the full metadata
+    records) and images/<filename> for every image still on disk. It is
+    written under a temporary name and renamed when complete.
+
+    Returns:
+        Path of the bundle
+    """
+    os.makedirs(directory, exist_ok=True)
+    first, last = records[0].get("timestamp") or "unknown", records[-1].get("timestamp") or "unknown"
+    name = f"items_{first}_{last}_{os.urandom(3).hex()}.tar.gz"
+    manifest = {
+        "archived_at": datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S"),
+        "count": len(records),
+        "items": records,
+    }
+    fd, tmp_path = tempfile.mkstemp(prefix=".bundle_", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f, tarfile.open(fileobj=f, mode="w:gz") as bundle:
+            data = json.dumps(manifest, indent=2).encode("utf-8")
+            info = tarfile.TarInfo("manifest.json")
+            info.size = len(data)
+            info.mtime = int(time.time())
+            bundle.addfile(info, fileobj=io.BytesIO(data))
+            for record in records:
+                image_path = os.path.join(upload_folder, os.path.basename(record["filename"]))
+                if os.path.exists(image_path):
+                    bundle.add(image_path, arcname=f"images/{os.path.basename(record['filename'])}")
+        os.replace(tmp_path, os.path.join(directory, name))
+    except BaseException:
+        _remove(tmp_path)
+        raise
+    return os.path.join(directory, name)
+
+
+def expire_items(upload_folder: str, days: float = RETENTION_DAYS, mode: str = RETENTION_MODE) -> Dict[str, Any]:
+    """Archive (or delete) items older than `days`, oldest first, ARCHIVE_BATCH_SIZE at a time"""
+    if days <= 0:
+        return {"skipped": "RETENTION_DAYS is 0"}
+    if mode not in ("archive", "delete"):
+        raise ValueError(f"RETENTION_MODE must be archive or delete, not {mode}")
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y%m%d_%H%M%S")
+    store = get_store()
+    expired, bundles = 0, []
+    while True:
+        records = store.older_than(cutoff, ARCHIVE_BATCH_SIZE)
+        if not records:
+            break
+        if mode == "archive":
+            bundles.append(os.path.basename(write_bundle(records, upload_folder)))
+        # Records go first, so an item is never listed without its image
+        removed = delete_many_metadata([r["filename"] for r in records])
+        for record in removed:
+            remove_image_files(upload_folder, record["filename"])
+        expired += len(removed)
+        if not removed:
+            break
+    MAINTENANCE_REMOVED.inc(expired, task="expire")
+    return {"expired": expired, "cutoff": cutoff, "mode": mode, "bundles": bundles}
+
+
+def sweep_temp_files(upload_folder: str, max_age: float = TEMP_MAX_AGE) -> Dict[str, Any]:
+    """
+    Remove leftovers of interrupted requests: temp_* upload files, .ingest_*
+    work directories and /api/ingest batches that no pending job refers to.
+    Directories a running ingest has claimed (see working_in) are kept.
+    """
+    removed = 0
+    for name in os.listdir(upload_folder):
+        path = os.path.join(upload_folder, name)
+        if (name.startswith("temp_") or name.startswith(".ingest_")) and _older_than(path, max_age):
+            if not dir_in_use(path):
+                removed += _remove(path)
+    batches_dir = os.path.join(upload_folder, "ingest")
+    if os.path.isdir(batches_dir):
+        in_use = {job["payload"].get("batch_dir") for job in pending_jobs() if job.get("kind") == "ingest"}
+        for name in os.listdir(batches_dir):
+            path = os.path.join(batches_dir, name)
+            if path not in in_use and _older_than(path, max_age) and not dir_in_use(path):
+                removed += _remove(path)
+    MAINTENANCE_REMOVED.inc(removed, task="temp_files")
+    return {"removed": removed}
+
+
+def sweep_orphans(upload_folder: str, min_age: float = ORPHAN_MIN_AGE,
+                  max_removals: int = ORPHAN_MAX_REMOVALS) -> Dict[str, Any]:
+    """
+    Remove images and derivatives that no metadata record refers to.
+
+    Only runs with ORPHAN_SWEEP=true, and never against an empty or unreadable
+    store. Everything to remove is listed first; if that is more than
+    `max_removals` files, nothing is removed, as so many orphans more likely
+    mean the store is not the one the photos belong to.
+    """
+    if not ORPHAN_SWEEP:
+        return {"skipped": "ORPHAN_SWEEP is off"}
+    store = get_store()
+    count = store.count()
+    if store.read_error:
+        print(f"[WARNING] Orphan sweep skipped, metadata could not be read: {store.read_error}")
+        return {"skipped": "metadata unreadable"}
+    if count == 0:
+        return {"skipped": "metadata store is empty"}
+    filenames = store.filenames()
+    stems = {os.path.splitext(name)[0] for name in filenames}
+    images, derivatives = [], []
+    for name in os.listdir(upload_folder):
+        path = os.path.join(upload_folder, name)
+        if name.startswith((".", "temp_")) or not os.path.isfile(path) or name in filenames:
+            continue
+        if _older_than(path, min_age):
+            images.append(path)
+    derived_dir = os.path.join(upload_folder, DERIVED_DIRNAME)
+    if os.path.isdir(derived_dir):
+        for name in os.listdir(derived_dir):
+            path = os.path.join(derived_dir, name)
+            if derivative_stem(name) not in stems and _older_than(path, min_age):
+                derivatives.append(path)
+    if len(images) + len(derivatives) > max_removals:
+        print(f"[WARNING] Orphan sweep skipped: {len(images)} images and {len(derivatives)} derivatives "
+              f"have no record, more than ORPHAN_MAX_REMOVALS ({max_removals})")
+        return {"skipped": "too many orphans", "images": len(images), "derivatives": len(derivatives)}
+    removed_images = sum(_remove(path) for path in images)
+    removed_derivatives = sum(_remove(path) for path in derivatives)
+    MAINTENANCE_REMOVED.inc(removed_images, task="orphan_images")
+    MAINTENANCE_REMOVED.inc(removed_derivatives, task="orphan_derivatives")
+    return {"images": removed_images, "derivatives": removed_derivatives}
+
+
+def sweep_runtime_files(upload_folder: str) -> Dict[str, Any]:
+    """Trim job status files, metrics files of exited workers, old profiles and the description cache"""
+    jobs = remove_finished_jobs(JOB_MAX_AGE)
+    metrics = REGISTRY.retire_dead_workers(pid_alive)
+    profiles = 0
+    if os.path.isdir(PROFILE_DIR):
+        for name in os.listdir(PROFILE_DIR):
+            path = os.path.join(PROFILE_DIR, name)
+            if _older_than(path, PROFILE_MAX_AGE):
+                profiles += _remove(path)
+    descriptions = get_description_cache().evict()
+    MAINTENANCE_REMOVED.inc(jobs, task="jobs")
+    MAINTENANCE_REMOVED.inc(profiles, task="profiles")
+    return {"jobs": jobs, "metrics_files_retired": metrics, "profiles": profiles, "descriptions_evicted": descriptions}
+
+
+def rebuild_facets(upload_folder: str) -> Dict[str, Any]:
+    """Recount the facet counters from the records, repairing any drift"""
+    facets = get_store().rebuild_facets()
+    return {dimension: len(values) for dimension, values in facets.items()}
+
+
+def compact_store(upload_folder: str) -> Dict[str, Any]:
+    """Trim the change journal and reclaim free space in the metadata store"""
+    return get_store().compact()
+
+
+# Run in this order; compaction comes last so it reclaims what the other tasks freed
+TASKS = {
+    "expire": expire_items,
+    "temp_files": sweep_temp_files,
+    "orphans": sweep_orphans,
+    "runtime_files": sweep_runtime_files,
+    "facets": rebuild_facets,
+    "compact": compact_store,
+}
+
+
+def run_maintenance(upload_folder: str, tasks: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Run the given maintenance tasks (all by default) and return each one's report"""
+    report: Dict[str, Any] = {"started": datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")}
+    started = time.perf_counter()
+    for name in tasks or TASKS:
+        try:
+            report[name] = TASKS[name](upload_folder)
+        except Exception as e:
+            print(f"[WARNING] Maintenance task {name} failed: {e}")
+            report[name] = {"error": str(e)}
+    report["seconds"] = round(time.perf_counter() - started, 2)
+    return report
+
+
+def _read_state() -> Dict[str, Any]:
+    try:
+        with open(STATE_FILE, "r") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def run_if_due(upload_folder: str, interval: float = MAINTENANCE_INTERVAL) -> Optional[Dict[str, Any]]:
+    """
+    Run a maintenance pass if none has run anywhere in the last `interval` seconds.
+
+    Every worker calls this, but the pass is guarded by an flock and a shared
+    state file holding the last run time, so exactly one worker does the work.
+    """
+    os.makedirs(os.path.dirname(STATE_FILE), exist_ok=True)
+    with open(STATE_FILE + ".lock", "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None  # another worker is running the pass
+        if time.time() - _read_state().get("last_run", 0) < interval:
+            return None
+        report = run_maintenance(upload_folder)
+        print(f"[INFO] Maintenance pass finished in {report['seconds']}s")
+        tmp = tempfile.NamedTemporaryFile("w", delete=False, dir=os.path.dirname(STATE_FILE), suffix=".tmp")
+        json.dump({"last_run": time.time(), "report": report}, tmp)
+        tmp.close()
+        os.replace(tmp.name, STATE_FILE)
+        return report
+
+
+def _scheduler_loop(upload_folder: str, interval: float):
+    pid = os.getpid()
+    while _scheduler_pid == pid:
+        # Jittered so workers started together do not all contend for the lock at once
+        time.sleep(CHECK_INTERVAL * random.uniform(0.5, 1.5))
+        try:
+            run_if_due(upload_folder, interval)
+        except Exception as e:
+            print(f"[WARNING] Maintenance pass failed: {e}")
+
+
+_scheduler_pid = None
+_scheduler_lock = threading.Lock()
+
+
+def start_scheduler(upload_folder: str, interval: float = MAINTENANCE_INTERVAL):
+    """Start this process's maintenance thread (once per process; forks start their own)"""
+    global _scheduler_pid
+    if interval <= 0 or _scheduler_pid == os.getpid():
+        return
+    with _scheduler_lock:
+        if _scheduler_pid == os.getpid():
+            return
+        _scheduler_pid = os.getpid()
+        threading.Thread(
+            target=_scheduler_loop, args=(upload_folder, interval), name="maintenance", daemon=True
+        ).start()
+
+
+def install_scheduler(app):
+    """
+    Run maintenance in the background of the app's worker processes.
+
+    The thread is started by the first request each process serves, so
+    gunicorn workers forked from a preloaded app each get one, and command
+    line tools that only build the app get none.
+    """
+    if MAINTENANCE_INTERVAL <= 0:
+        return
+    upload_folder = app.config["UPLOAD_FOLDER"]
+    app.before_request(lambda: start_scheduler(upload_folder))
+
+
+def main(argv=None):
+    """Run a pass now, from server/: python -m utils.maintenance [uploads folder] [task ...]"""
+    argv = sys.argv[1:] if argv is None else argv
+    upload_folder = os.getenv("UPLOAD_FOLDER", os.path.join(BASE_DIR, "uploads"))
+    if argv and argv[0] not in TASKS:
+        upload_folder, argv = argv[0], argv[1:]
+    unknown = [task for task in argv if task not in TASKS]
+    if unknown:
+        print(f"[ERROR] Unknown task(s) {', '.join(unknown)}; choose from {', '.join(TASKS)}")
+        sys.exit(2)
+    print(json.dumps(run_maintenance(upload_folder, argv or None), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,883 @@
-import os, json, tempfile, shutil
+import os, json, tempfile, shutil, sqlite3, sys
+import fcntl
+import asyncio
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from threading import Lock
+from typing import Optional, Dict, Any, List
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 METADATA_FILE = os.path.join(BASE_DIR, "metadata.json")
+METADATA_DB = os.getenv("METADATA_DB", os.path.join(BASE_DIR, "metadata.db"))
+# "sqlite" (default) or "json" for small installs that prefer a single flat file
+METADATA_BACKEND = os.getenv("METADATA_BACKEND", "sqlite").lower()
 metadata_lock = Lock()
+# Maximum number of changes served by a ?since= delta before clients are told to reload
+CHANGES_LIMIT = 1000
+# SQLite compaction only rewrites the database once this share of its pages is free
+VACUUM_FREE_RATIO = 0.2
+# Threads (and so SQLite connections) behind the ASGI server's awaitable store
+ASYNC_STORE_THREADS = int(os.getenv("ASYNC_STORE_THREADS", "4"))
 
 
-def load_metadata():
-    if not os.path.exists(METADATA_FILE):
-        return []
-    with open(METADATA_FILE, "r") as f:
+def _in_range(record: Dict[str, Any], category: Optional[str], since: Optional[str], until: Optional[str]) -> bool:
+    """Filter used by page(): exact category, and timestamps within [since, until)"""
+    timestamp = record.get("timestamp") or ""
+    if category and record.get("category") != category:
+        return False
+    if since and timestamp < since:
+        return False
+    if until and timestamp >= until:
+        return False
+    return True
+
+
+# Facets counted per catalogue: SQL expression over a records row (OLD, NEW or records).
+# The SQLite triggers are generated from this, so changing it needs a migration that recreates them.
+FACET_DIMENSIONS = {
+    "category": "{row}.category",
+    "color": "{row}.color",
+    "day": "substr({row}.timestamp, 1, 8)",
+}
+
+
+def _facet_value(record: Dict[str, Any], dimension: str) -> str:
+    """A record's value for a facet, as the SQLite triggers compute it ('' when missing)"""
+    if dimension == "day":
+        return (record.get("timestamp") or "")[:8]
+    return record.get(dimension) or ""
+
+
+def _count_facets(records: List[Dict[str, Any]]) -> Dict[str, Dict[str, int]]:
+    counts: Dict[str, Dict[str, int]] = {dimension: {} for dimension in FACET_DIMENSIONS}
+    for record in records:
+        for dimension, values in counts.items():
+            value = _facet_value(record, dimension)
+            values[value] = values.get(value, 0) + 1
+    return counts
+
+
+def _split_statements(script: str) -> List[str]:
+    """Split a migration script into statements (trigger bodies contain semicolons of their own)"""
+    statements, pending = [], ""
+    for part in script.split(";"):
+        pending += part + ";"
+        if sqlite3.complete_statement(pending):
+            if pending.strip(" \n;"):
+                statements.append(pending.strip())
+            pending = ""
+    return statements
+
+
+def _page_key(record: Dict[str, Any]) -> tuple:
+    """Listing order key: newest timestamp first, then filename (missing timestamps last)"""
+    return (record.get("timestamp") or "", record.get("filename") or "")
+
+
+def is_described(record: Dict[str, Any]) -> bool:
+    """Whether a record's description arrived (`description_status` "done")"""
+    status = record.get("description_status")
+    if status is None:
+        # Written before the status was tracked
+        return bool(record.get("label"))
+    return status == "done"
+
+
+class JsonMetadataStore:
+    """
+    Metadata kept as a single JSON array; every write rewrites the whole file.
+
+    A small sidecar journal (metadata.journal.json) records the catalogue
+    version and the most recent changes so pollers can fetch deltas.
+
+    Parsed files are cached per process and reused until the file's inode,
+    mtime or size changes; every write replaces the file, so a write from any
+    worker is seen on the next read. Writers hold an flock on
+    metadata.json.lock as well as the thread lock, so concurrent workers
+    cannot interleave read-modify-write cycles.
+    """
+
+    def __init__(self, path: str = METADATA_FILE):
+        self.path = path
+        self.journal_path = os.path.splitext(path)[0] + ".journal.json"
+        self.lock_path = path + ".lock"
+        self._parsed: Dict[str, tuple] = {}
+        self._facets: Optional[tuple] = None
+        # Set while the metadata file exists but cannot be parsed (reads then see no records)
+        self.read_error: Optional[str] = None
+
+    @contextmanager
+    def _locked(self):
+        with metadata_lock, open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load_cached(self, path: str, default):
+        """Parsed contents of `path`, re-read only when the file has been replaced or modified"""
         try:
-            return json.load(f)
-        except json.JSONDecodeError:
-            return []
+            st = os.stat(path)
+        except FileNotFoundError:
+            return default
+        key = (st.st_ino, st.st_mtime_ns, st.st_ctime_ns, st.st_size)
+        cached = self._parsed.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            if path == self.path:
+                self.read_error = f"{path}: {e}"
+            return default
+        if path == self.path:
+            self.read_error = None
+        self._parsed[path] = (key, data)
+        return data
 
+    def _read(self) -> List[Dict[str, Any]]:
+        # A copy of the list, so callers can extend or filter it without touching the cache
+        return list(self._load_cached(self.path, []))
 
-def save_metadata(data):
-    with metadata_lock:
-        tmp = tempfile.NamedTemporaryFile("w", delete=False, dir=os.path.dirname(METADATA_FILE))
+    def _write_file(self, path: str, data):
+        tmp = tempfile.NamedTemporaryFile("w", delete=False, dir=os.path.dirname(path))
         json.dump(data, tmp, indent=2)
         tmp.close()
-        shutil.move(tmp.name, METADATA_FILE)
+        shutil.move(tmp.name, path)
+
+    def _write(self, data: List[Dict[str, Any]], changes: List[tuple]):
+        self._write_file(self.path, data)
+        journal = self._read_journal()
+        for op, filename in changes:
+            journal["version"] += 1
+            journal["changes"].append([journal["version"], op, filename])
+        journal["changes"] = journal["changes"][-CHANGES_LIMIT:]
+        self._write_file(self.journal_path, journal)
+
+    def _read_journal(self) -> Dict[str, Any]:
+        journal = self._load_cached(self.journal_path, {"version": 0, "changes": []})
+        return {"version": journal["version"], "changes": list(journal["changes"])}
+
+    def all(self) -> List[Dict[str, Any]]:
+        return self._read()
+
+    def get(self, filename: str) -> Optional[Dict[str, Any]]:
+        for item in self._read():
+            if item.get("filename") == filename:
+                return item
+        return None
+
+    def count(self) -> int:
+        return len(self._read())
+
+    def filenames(self) -> set:
+        return {item.get("filename") for item in self._read() if item.get("filename")}
+
+    def existing_content_hashes(self, hashes: List[str]) -> set:
+        wanted = set(hashes)
+        return {item["content_hash"] for item in self._read()
+                if item.get("content_hash") in wanted and is_described(item)}
+
+    def undescribed_content_hashes(self, hashes: List[str]) -> Dict[str, List[str]]:
+        wanted = set(hashes)
+        found: Dict[str, List[str]] = {}
+        for item in self._read():
+            if item.get("content_hash") in wanted and not is_described(item):
+                found.setdefault(item["content_hash"], []).append(item.get("filename"))
+        return found
+
+    def insert(self, record: Dict[str, Any]):
+        self.insert_many([record])
+
+    def insert_many(self, records: List[Dict[str, Any]]):
+        with self._locked():
+            data = self._read()
+            data.extend(records)
+            self._write(data, [("add", record.get("filename")) for record in records])
+
+    def delete(self, filename: str) -> Optional[Dict[str, Any]]:
+        with self._locked():
+            data = self._read()
+            removed = None
+            remaining = []
+            for item in data:
+                if removed is None and item.get("filename") == filename:
+                    removed = item
+                else:
+                    remaining.append(item)
+            if removed is not None:
+                self._write(remaining, [("delete", filename)])
+            return removed
+
+    def delete_many(self, filenames: List[str]) -> List[Dict[str, Any]]:
+        wanted = set(filenames)
+        with self._locked():
+            data = self._read()
+            removed = [item for item in data if item.get("filename") in wanted]
+            if removed:
+                remaining = [item for item in data if item.get("filename") not in wanted]
+                self._write(remaining, [("delete", item.get("filename")) for item in removed])
+            return removed
+
+    def update(self, filename: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        with self._locked():
+            data = self._read()
+            for i, item in enumerate(data):
+                if item.get("filename") == filename:
+                    data[i] = item = dict(item, **fields)
+                    self._write(data, [("update", filename)])
+                    return item
+            return None
+
+    def replace_all(self, data: List[Dict[str, Any]]):
+        with self._locked():
+            self._write(data, [("reset", None)])
+
+    def page(
+        self,
+        limit: int,
+        after: Optional[tuple] = None,
+        category: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+    ) -> tuple:
+        matching = [r for r in self._read() if _in_range(r, category, since, until)]
+        matching.sort(key=_page_key, reverse=True)
+        if after is not None:
+            matching = [r for r in matching if _page_key(r) < tuple(after)]
+        return matching[:limit], len(matching) > limit
+
+    def count_matching(self, category: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None) -> int:
+        return sum(1 for r in self._read() if _in_range(r, category, since, until))
+
+    def facets(self) -> Dict[str, Dict[str, int]]:
+        # Counted once per version of the file, like the parsed records themselves
+        data = self._load_cached(self.path, [])
+        if self._facets is None or self._facets[0] is not data:
+            self._facets = (data, _count_facets(data))
+        return self._facets[1]
+
+    def rebuild_facets(self) -> Dict[str, Dict[str, int]]:
+        self._facets = None
+        return self.facets()
+
+    def older_than(self, timestamp: str, limit: int) -> List[Dict[str, Any]]:
+        # Records without a timestamp never expire (SQLite's comparison skips NULL too)
+        matching = [r for r in self._read() if r.get("timestamp") and r["timestamp"] < timestamp]
+        matching.sort(key=_page_key)
+        return matching[:limit]
+
+    def compact(self, keep_changes: int = CHANGES_LIMIT) -> Dict[str, Any]:
+        # Every write already rewrites the file and trims the journal
+        return {}
+
+    def version(self) -> int:
+        return self._read_journal()["version"]
+
+    def changes_since(self, version: int, limit: int = CHANGES_LIMIT) -> Optional[List[Dict[str, Any]]]:
+        journal = self._read_journal()
+        current = journal["version"]
+        if version == current:
+            return []
+        entries = journal["changes"]
+        if version > current or not entries or version < entries[0][0] - 1:
+            return None
+        pending = [entry for entry in entries if entry[0] > version]
+        if len(pending) > limit:
+            return None
+        records = {item.get("filename"): item for item in self._read()}
+        return _build_changes(
+            (v, op, filename, records.get(filename) if op != "delete" else None)
+            for v, op, filename in pending
+        )
+
+
+def _facet_sql(row: str, delta: int) -> str:
+    """Trigger statements adding `delta` to the facet counters of the NEW or OLD record"""
+    statements = []
+    for dimension, expression in FACET_DIMENSIONS.items():
+        value = f"COALESCE({expression.format(row=row)}, '')"
+        if delta > 0:
+            statements.append(
+                f"INSERT INTO facets (dimension, value, count) VALUES ('{dimension}', {value}, {delta}) "
+                f"ON CONFLICT (dimension, value) DO UPDATE SET count = count + {delta};"
+            )
+        else:
+            statements.append(f"UPDATE facets SET count = count - {-delta} WHERE dimension = '{dimension}' AND value = {value};")
+            statements.append(f"DELETE FROM facets WHERE dimension = '{dimension}' AND value = {value} AND count <= 0;")
+    return "\n            ".join(statements)
+
+
+# Recount every facet from the records table
+FACETS_REBUILD_SQL = "DELETE FROM facets;\n" + "".join(
+    f"INSERT INTO facets (dimension, value, count) "
+    f"SELECT '{dimension}', COALESCE({expression.format(row='records')}, ''), COUNT(*) FROM records GROUP BY 2;\n"
+    for dimension, expression in FACET_DIMENSIONS.items()
+)
+
+
+class SqliteMetadataStore:
+    """
+    Metadata kept in SQLite (WAL mode) with one row per item.
+
+    Inserts and deletes touch a single row, so ingest cost no longer grows with
+    the catalogue, and SQLite's file locking serializes writers across gunicorn
+    worker processes. The full record is stored as JSON in `data`; the indexed
+    columns are copies used for lookups and ordering.
+    """
+
+    # Ordered schema migrations, applied according to PRAGMA user_version
+    MIGRATIONS = [
+        """
+        CREATE TABLE IF NOT EXISTS records (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            filename TEXT NOT NULL UNIQUE,
+            timestamp TEXT,
+            category TEXT,
+            color TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_records_timestamp ON records(timestamp);
+        CREATE INDEX IF NOT EXISTS idx_records_category ON records(category);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS changes (
+            version INTEGER PRIMARY KEY AUTOINCREMENT,
+            op TEXT NOT NULL,
+            filename TEXT
+        );
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_records_listing ON records(timestamp, filename);
+        CREATE INDEX IF NOT EXISTS idx_records_category_listing ON records(category, timestamp, filename);
+        """,
+        """
+        ALTER TABLE records ADD COLUMN content_hash TEXT;
+        CREATE INDEX IF NOT EXISTS idx_records_content_hash ON records(content_hash);
+        """,
+        # Facet counters, kept exact by triggers in the same transaction as every write
+        f"""
+        CREATE TABLE IF NOT EXISTS facets (
+            dimension TEXT NOT NULL,
+            value TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (dimension, value)
+        ) WITHOUT ROWID;
+        CREATE TRIGGER IF NOT EXISTS facets_after_insert AFTER INSERT ON records BEGIN
+            {_facet_sql("NEW", +1)}
+        END;
+        CREATE TRIGGER IF NOT EXISTS facets_after_delete AFTER DELETE ON records BEGIN
+            {_facet_sql("OLD", -1)}
+        END;
+        CREATE TRIGGER IF NOT EXISTS facets_after_update AFTER UPDATE OF category, color, timestamp ON records BEGIN
+            {_facet_sql("OLD", -1)}
+            {_facet_sql("NEW", +1)}
+        END;
+        {FACETS_REBUILD_SQL}
+        """,
+    ]
+
+    def __init__(self, path: str = METADATA_DB, import_from: Optional[str] = METADATA_FILE):
+        self.path = path
+        self.import_from = import_from
+        self._local = threading.local()
+        self._init_lock = Lock()
+        self._initialized_pid = None
+        # Errors surface as exceptions here; kept for parity with JsonMetadataStore
+        self.read_error: Optional[str] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # Connections are per thread and per process (gunicorn forks workers)
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and getattr(self._local, "pid", None) == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        self._ensure_schema(conn)
+        return conn
+
+    def _ensure_schema(self, conn: sqlite3.Connection):
+        with self._init_lock:
+            if self._initialized_pid == os.getpid():
+                return
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+                for step, script in enumerate(self.MIGRATIONS[version:], start=version + 1):
+                    for statement in _split_statements(script):
+                        conn.execute(statement)
+                    conn.execute(f"PRAGMA user_version = {step}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            self._initialized_pid = os.getpid()
+        if self.import_from:
+            self._import_once(conn)
+
+    def _import_once(self, conn: sqlite3.Connection):
+        """Import an existing metadata.json the first time the database is used"""
+        done = conn.execute("SELECT value FROM meta WHERE key = 'json_imported'").fetchone()
+        if done or not os.path.exists(self.import_from):
+            return
+        imported = import_json_metadata(self.import_from, self)
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('json_imported', ?)",
+            (self.import_from,),
+        )
+        print(f"[INFO] Imported {imported} records from {self.import_from} into {self.path}")
+
+    @staticmethod
+    def _row_values(record: Dict[str, Any]):
+        return (
+            record.get("filename"),
+            record.get("timestamp"),
+            record.get("category"),
+            record.get("color"),
+            record.get("content_hash"),
+            json.dumps(record),
+        )
+
+    def _upsert(self, conn: sqlite3.Connection, record: Dict[str, Any]):
+        conn.execute(
+            """
+            INSERT INTO records (filename, timestamp, category, color, content_hash, data)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(filename) DO UPDATE SET
+                timestamp = excluded.timestamp,
+                category = excluded.category,
+                color = excluded.color,
+                content_hash = excluded.content_hash,
+                data = excluded.data
+            """,
+            self._row_values(record),
+        )
+
+    def all(self) -> List[Dict[str, Any]]:
+        rows = self._connect().execute("SELECT data FROM records ORDER BY id").fetchall()
+        return [json.loads(row["data"]) for row in rows]
+
+    def get(self, filename: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            "SELECT data FROM records WHERE filename = ?", (filename,)
+        ).fetchone()
+        return json.loads(row["data"]) if row else None
+
+    def count(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def filenames(self) -> set:
+        return {row[0] for row in self._connect().execute("SELECT filename FROM records")}
+
+    def _content_hash_records(self, hashes: List[str]):
+        conn = self._connect()
+        for start in range(0, len(hashes), 500):
+            chunk = hashes[start:start + 500]
+            rows = conn.execute(
+                f"SELECT content_hash, data FROM records WHERE content_hash IN ({','.join('?' * len(chunk))})", chunk
+            )
+            for row in rows:
+                yield row["content_hash"], json.loads(row["data"])
+
+    def existing_content_hashes(self, hashes: List[str]) -> set:
+        """Which of `hashes` (SHA-256 of ingested originals) are already in the catalogue with a description"""
+        return {content_hash for content_hash, record in self._content_hash_records(hashes) if is_described(record)}
+
+    def undescribed_content_hashes(self, hashes: List[str]) -> Dict[str, List[str]]:
+        """Filenames of records ingested from `hashes` whose description failed, by hash"""
+        found: Dict[str, List[str]] = {}
+        for content_hash, record in self._content_hash_records(hashes):
+            if not is_described(record):
+                found.setdefault(content_hash, []).append(record.get("filename"))
+        return found
+
+    @staticmethod
+    def _listing_filters(category, since, until):
+        clauses, params = [], []
+        if category:
+            clauses.append("category = ?")
+            params.append(category)
+        if since:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until:
+            clauses.append("(timestamp < ? OR timestamp IS NULL)")
+            params.append(until)
+        return clauses, params
+
+    def page(
+        self,
+        limit: int,
+        after: Optional[tuple] = None,
+        category: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+    ) -> tuple:
+        """
+        One page of the listing, newest first, using keyset pagination on (timestamp, filename).
+
+        Args:
+            limit: Page size
+            after: (timestamp, filename) of the last record of the previous page
+            category: Exact category filter
+            since: Smallest timestamp included
+            until: Timestamps from this value on are excluded
+
+        Returns:
+            Tuple of (records, whether more records follow)
+        """
+        conn = self._connect()
+        clauses, params = self._listing_filters(category, since, until)
+
+        def fetch(extra_clause, extra_params, count):
+            where = " AND ".join(clauses + [extra_clause]) if extra_clause else " AND ".join(clauses)
+            return conn.execute(
+                f"SELECT data FROM records {'WHERE ' + where if where else ''} "
+                "ORDER BY timestamp DESC, filename DESC LIMIT ?",
+                (*params, *extra_params, count),
+            ).fetchall()
+
+        if after is None:
+            rows = fetch(None, (), limit + 1)
+        elif after[0]:
+            # A row-value comparison lets SQLite seek in the listing index instead of scanning
+            rows = fetch("(timestamp, filename) < (?, ?)", tuple(after), limit + 1)
+            if len(rows) <= limit and not since:
+                # Records without a timestamp sort after all others
+                rows += fetch("timestamp IS NULL", (), limit + 1 - len(rows))
+        else:
+            rows = fetch("(timestamp IS NULL OR timestamp = '') AND filename < ?", (after[1],), limit + 1)
+        return [json.loads(row["data"]) for row in rows[:limit]], len(rows) > limit
+
+    def count_matching(self, category: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None) -> int:
+        clauses, params = self._listing_filters(category, since, until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._connect().execute(f"SELECT COUNT(*) FROM records {where}", params).fetchone()[0]
+
+    def facets(self) -> Dict[str, Dict[str, int]]:
+        """Item counts per category, color and day ('' for a missing value), read from the trigger-maintained table"""
+        counts: Dict[str, Dict[str, int]] = {dimension: {} for dimension in FACET_DIMENSIONS}
+        for row in self._connect().execute("SELECT dimension, value, count FROM facets"):
+            counts.setdefault(row["dimension"], {})[row["value"]] = row["count"]
+        return counts
+
+    def rebuild_facets(self) -> Dict[str, Dict[str, int]]:
+        """Recount the facets from the records table (they only drift if the triggers were bypassed)"""
+        with self._transaction() as conn:
+            for statement in _split_statements(FACETS_REBUILD_SQL):
+                conn.execute(statement)
+        return self.facets()
+
+    def older_than(self, timestamp: str, limit: int) -> List[Dict[str, Any]]:
+        """Oldest records with a timestamp before `timestamp`, at most `limit`"""
+        rows = self._connect().execute(
+            "SELECT data FROM records WHERE timestamp < ? AND timestamp <> '' ORDER BY timestamp, filename LIMIT ?",
+            (timestamp, limit),
+        )
+        return [json.loads(row["data"]) for row in rows]
+
+    def compact(self, keep_changes: int = CHANGES_LIMIT) -> Dict[str, Any]:
+        """
+        Trim the change journal, checkpoint the WAL and VACUUM when worthwhile.
+
+        Only the last `keep_changes` journal entries can ever be served as a
+        delta (a client further behind is sent a reset), so older ones are
+        dropped. VACUUM rewrites the whole file, so it only runs once at least
+        VACUUM_FREE_RATIO of the pages are free.
+        """
+        conn = self._connect()
+        with self._transaction() as tx:
+            trimmed = tx.execute(
+                "DELETE FROM changes WHERE version <= (SELECT MAX(version) FROM changes) - ?", (keep_changes,)
+            ).rowcount
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        vacuumed = bool(page_count) and free_pages / page_count >= VACUUM_FREE_RATIO
+        if vacuumed:
+            conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("PRAGMA optimize")
+        return {"changes_trimmed": trimmed, "free_pages": free_pages, "pages": page_count, "vacuumed": vacuumed}
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _log_change(conn: sqlite3.Connection, op: str, filename: Optional[str] = None):
+        conn.execute("INSERT INTO changes (op, filename) VALUES (?, ?)", (op, filename))
+
+    def insert(self, record: Dict[str, Any]):
+        with self._transaction() as conn:
+            self._upsert(conn, record)
+            self._log_change(conn, "add", record.get("filename"))
+
+    def insert_many(self, records: List[Dict[str, Any]]):
+        with self._transaction() as conn:
+            for record in records:
+                self._upsert(conn, record)
+                self._log_change(conn, "add", record.get("filename"))
+
+    def delete(self, filename: str) -> Optional[Dict[str, Any]]:
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT data FROM records WHERE filename = ?", (filename,)
+            ).fetchone()
+            if row:
+                conn.execute("DELETE FROM records WHERE filename = ?", (filename,))
+                self._log_change(conn, "delete", filename)
+        return json.loads(row["data"]) if row else None
+
+    def delete_many(self, filenames: List[str]) -> List[Dict[str, Any]]:
+        removed = []
+        with self._transaction() as conn:
+            for start in range(0, len(filenames), 500):
+                chunk = filenames[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT filename, data FROM records WHERE filename IN ({placeholders})", chunk
+                ).fetchall()
+                conn.execute(f"DELETE FROM records WHERE filename IN ({placeholders})", chunk)
+                for row in rows:
+                    self._log_change(conn, "delete", row["filename"])
+                    removed.append(json.loads(row["data"]))
+        return removed
+
+    def update(self, filename: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT data FROM records WHERE filename = ?", (filename,)
+            ).fetchone()
+            if not row:
+                return None
+            record = json.loads(row["data"])
+            record.update(fields)
+            self._upsert(conn, record)
+            self._log_change(conn, "update", filename)
+        return record
+
+    def replace_all(self, data: List[Dict[str, Any]]):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM records")
+            for record in data:
+                self._upsert(conn, record)
+            self._log_change(conn, "reset")
+
+    def version(self) -> int:
+        row = self._connect().execute("SELECT MAX(version) FROM changes").fetchone()
+        return row[0] or 0
+
+    def changes_since(self, version: int, limit: int = CHANGES_LIMIT) -> Optional[List[Dict[str, Any]]]:
+        conn = self._connect()
+        current = self.version()
+        if version == current:
+            return []
+        oldest = conn.execute("SELECT MIN(version) FROM changes").fetchone()[0]
+        if version > current or oldest is None or version < oldest - 1:
+            return None
+        rows = conn.execute(
+            """
+            SELECT c.version, c.op, c.filename, r.data
+            FROM changes c LEFT JOIN records r ON c.op != 'delete' AND r.filename = c.filename
+            WHERE c.version > ? ORDER BY c.version LIMIT ?
+            """,
+            (version, limit + 1),
+        ).fetchall()
+        if len(rows) > limit:
+            return None
+        return _build_changes(
+            (row["version"], row["op"], row["filename"], json.loads(row["data"]) if row["data"] else None)
+            for row in rows
+        )
+
+
+def _build_changes(entries) -> Optional[List[Dict[str, Any]]]:
+    """
+    Turn (version, op, filename, current record) journal entries into the delta feed.
+
+    Additions and updates carry the record as it is now; one whose record has
+    since been removed is skipped because its delete tombstone follows later in
+    the feed. Returns None when the feed contains a full reset.
+    """
+    changes = []
+    for version, op, filename, record in entries:
+        if op == "reset":
+            return None
+        if op == "delete":
+            changes.append({"version": version, "op": "delete", "filename": filename, "deleted": True})
+        elif record is not None:
+            changes.append({"version": version, "op": op, "filename": filename, "item": record})
+    return changes
+
+
+def import_json_metadata(json_path: str, store) -> int:
+    """
+    Copy every record from a metadata.json file into `store` in one transaction.
+
+    Args:
+        json_path: Path to an existing metadata.json array
+        store: Destination store (anything with an insert_many method)
+
+    Returns:
+        Number of records imported
+    """
+    records = JsonMetadataStore(json_path).all()
+    records = [r for r in records if r.get("filename")]
+    store.insert_many(records)
+    return len(records)
+
+
+_store = None
+_store_lock = Lock()
+_change_listeners = []
+
+
+def get_store():
+    """Return the process-wide metadata store selected by METADATA_BACKEND"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if METADATA_BACKEND == "json":
+                    _store = JsonMetadataStore()
+                else:
+                    _store = SqliteMetadataStore()
+    return _store
+
+
+def load_metadata():
+    return get_store().all()
+
+
+def save_metadata(data):
+    get_store().replace_all(data)
+
+
+def add_change_listener(callback):
+    """Register callback(op, record), called after this process adds, updates or deletes a record"""
+    _change_listeners.append(callback)
+
+
+def _notify(op: str, record: Dict[str, Any]):
+    for callback in list(_change_listeners):
+        try:
+            callback(op, record)
+        except Exception as e:
+            print(f"[WARNING] Metadata change listener failed: {e}")
+
+
+def append_metadata(record: Dict[str, Any]):
+    """Add a single record without rewriting the rest of the catalogue"""
+    get_store().insert(record)
+    _notify("add", record)
+
+
+def append_many_metadata(records: List[Dict[str, Any]]):
+    """Add a batch of records in a single transaction"""
+    get_store().insert_many(records)
+    for record in records:
+        _notify("add", record)
+
+
+def update_metadata(filename: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Merge `fields` into an existing record; returns the updated record or None"""
+    record = get_store().update(filename, fields)
+    if record is not None:
+        _notify("update", record)
+    return record
+
+
+def delete_metadata(filename: str) -> Optional[Dict[str, Any]]:
+    """Remove the record for `filename`; returns the removed record or None"""
+    removed = get_store().delete(filename)
+    if removed is not None:
+        _notify("delete", removed)
+    return removed
+
+
+def delete_many_metadata(filenames: List[str]) -> List[Dict[str, Any]]:
+    """Remove the records for `filenames` in one write; returns the removed records"""
+    removed = get_store().delete_many(filenames)
+    for record in removed:
+        _notify("delete", record)
+    return removed
+
+
+class AsyncMetadataStore:
+    """
+    Awaitable front for the metadata store, used by the ASGI server.
+
+    Calls run on a small dedicated thread pool, so SQLite work (or the JSON
+    store's file lock) never blocks the event loop, and hundreds of waiting
+    requests share ASYNC_STORE_THREADS connections instead of opening one each.
+    Writes go through append/update/delete_metadata, so change listeners (the
+    SSE broadcaster) fire exactly as under the sync server.
+    """
+
+    def __init__(self, threads: int = ASYNC_STORE_THREADS):
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="metadata-store")
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, partial(func, *args))
+
+    async def version(self) -> int:
+        return await self._run(lambda: get_store().version())
+
+    async def get(self, filename: str) -> Optional[Dict[str, Any]]:
+        return await self._run(lambda: get_store().get(filename))
+
+    async def changes_since(self, version: int) -> Optional[List[Dict[str, Any]]]:
+        return await self._run(lambda: get_store().changes_since(version))
+
+    async def append(self, record: Dict[str, Any]):
+        await self._run(append_metadata, record)
+
+    async def update(self, filename: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return await self._run(update_metadata, filename, fields)
+
+    async def delete(self, filename: str) -> Optional[Dict[str, Any]]:
+        return await self._run(delete_metadata, filename)
+
+
+_async_store: Optional[AsyncMetadataStore] = None
+
+
+def get_async_store() -> AsyncMetadataStore:
+    global _async_store
+    if _async_store is None:
+        _async_store = AsyncMetadataStore()
+    return _async_store
+
+
+def main(argv=None):
+    """One-shot importer: python server/utils/metadata_utils.py [metadata.json] [metadata.db]"""
+    argv = sys.argv[1:] if argv is None else argv
+    json_path = argv[0] if len(argv) > 0 else METADATA_FILE
+    db_path = argv[1] if len(argv) > 1 else METADATA_DB
+    store = SqliteMetadataStore(db_path, import_from=None)
+    count = import_json_metadata(json_path, store)
+    print(f"[INFO] Imported {count} records from {json_path} into {db_path}")
+
+
+if __name__ == "__main__":
+    main()
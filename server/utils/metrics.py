@@ -0,0 +1,325 @@
+import os
+import json
+import time
+import glob
+import atexit
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, List, Tuple, Callable
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Each worker process writes its metric values here; /api/metrics sums every file
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(BASE_DIR, "cache", "metrics"))
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "1"))
+# Values of worker processes that have exited, merged by retire_dead_workers()
+RETIRED_FILE = "retired.json"
+# Key in RETIRED_FILE listing the worker files already folded into it
+FOLDED_KEY = "_folded"
+
+# Latency buckets in seconds, from a fast cache hit to a slow vision call
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class _Registry:
+    """
+    Metric values of this process, periodically written to METRICS_DIR/<pid>-<token>.json.
+
+    Counters and histograms are cumulative per process, so summing the files of
+    all workers (including ones that have exited) gives deployment-wide totals
+    that never go backwards. A daemon thread flushes dirty values at most
+    every METRICS_FLUSH_INTERVAL seconds; a fork gets a fresh file.
+    """
+
+    def __init__(self):
+        self.metrics: Dict[str, "_Metric"] = {}
+        self.gauges: Dict[str, Tuple[str, Callable[[], float]]] = {}
+        self._lock = threading.Lock()
+        self._pid = None
+        self._path = None
+        self._dirty = threading.Event()
+
+    def register(self, metric: "_Metric"):
+        self.metrics[metric.name] = metric
+
+    def touched(self):
+        if self._pid != os.getpid():
+            self._start()
+        self._dirty.set()
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Forked child: values inherited from the parent belong to the parent's file
+                for metric in self.metrics.values():
+                    metric.reset()
+            self._pid = os.getpid()
+            self._path = os.path.join(METRICS_DIR, f"{self._pid}-{os.urandom(4).hex()}.json")
+            threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True).start()
+
+    def _flush_loop(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            self._dirty.wait()
+            self._dirty.clear()
+            self.flush()
+            time.sleep(METRICS_FLUSH_INTERVAL)
+
+    def snapshot(self) -> Dict[str, List]:
+        return {name: metric.dump() for name, metric in self.metrics.items()}
+
+    def flush(self):
+        if self._path is None or self._pid != os.getpid():
+            return
+        try:
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            tmp = tempfile.NamedTemporaryFile("w", delete=False, dir=METRICS_DIR, suffix=".tmp")
+            json.dump(self.snapshot(), tmp)
+            tmp.close()
+            os.replace(tmp.name, self._path)
+        except OSError as e:
+            print(f"[WARNING] Could not write metrics: {e}")
+
+    def collect(self) -> Dict[str, Dict[LabelKey, Any]]:
+        """Values summed over every worker's file (this process's fresh values included)"""
+        self.flush()
+        totals: Dict[str, Dict[LabelKey, Any]] = {name: {} for name in self.metrics}
+        retired_path = os.path.join(METRICS_DIR, RETIRED_FILE)
+        paths = [path for path in glob.glob(os.path.join(METRICS_DIR, "*.json")) if path != retired_path]
+        # Before its first flush this process has no file yet
+        sources = {} if self._path in paths else {None: self.snapshot()}
+        for path in paths:
+            source = _read_values(path)
+            if source is not None:
+                sources[os.path.basename(path)] = source
+        # Read last: a worker file that retire_dead_workers() removed in the meantime is in it by
+        # now, and one it folded but has not removed yet is listed, so nothing is counted twice
+        retired = _read_values(retired_path)
+        if retired is not None:
+            for name in retired.get(FOLDED_KEY, []):
+                sources.pop(name, None)
+            sources[RETIRED_FILE] = retired
+        self._merge(totals, list(sources.values()))
+        return totals
+
+    def _merge(self, totals: Dict[str, Dict[LabelKey, Any]], sources: List[Dict[str, List]]):
+        for source in sources:
+            for name, entries in source.items():
+                metric = self.metrics.get(name)
+                if metric is None:
+                    continue
+                for labels, value in entries:
+                    key = tuple(tuple(pair) for pair in labels)
+                    totals.setdefault(name, {})[key] = metric.merge(totals.get(name, {}).get(key), value)
+
+    def retire_dead_workers(self, pid_alive: Callable[[int], bool]) -> int:
+        """
+        Fold the files of exited worker processes into one retired.json.
+
+        Their values still count towards the totals, so counters never go
+        backwards, but the number of files read per scrape stops growing with
+        every worker restart. The folded file names are recorded in retired.json
+        until the files are gone, so a scrape between the write and the removal
+        (or a file that could not be removed) is not counted twice. Returns how
+        many files were folded.
+        """
+        retired_path = os.path.join(METRICS_DIR, RETIRED_FILE)
+        previous = _read_values(retired_path) or {}
+        already_folded = set(previous.get(FOLDED_KEY, []))
+        dead, leftover = [], []
+        for path in glob.glob(os.path.join(METRICS_DIR, "*.json")):
+            name = os.path.basename(path)
+            pid = name.split("-", 1)[0]
+            if path == retired_path or not pid.isdigit() or pid_alive(int(pid)):
+                continue
+            (leftover if name in already_folded else dead).append(path)
+        for path in leftover:
+            _remove(path)
+        if not dead:
+            return 0
+        totals: Dict[str, Dict[LabelKey, Any]] = {}
+        sources = [previous] + [_read_values(path) for path in dead]
+        self._merge(totals, [source for source in sources if source is not None])
+        retired: Dict[str, Any] = {
+            name: [[list(key), value] for key, value in values.items()] for name, values in totals.items()
+        }
+        # Leftovers are still listed only if they could not be removed above
+        retired[FOLDED_KEY] = sorted(os.path.basename(path) for path in dead + [p for p in leftover if os.path.exists(p)])
+        tmp = tempfile.NamedTemporaryFile("w", delete=False, dir=METRICS_DIR, suffix=".tmp")
+        json.dump(retired, tmp)
+        tmp.close()
+        os.replace(tmp.name, retired_path)
+        for path in dead:
+            _remove(path)
+        return len(dead)
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _read_values(path: str):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+REGISTRY = _Registry()
+atexit.register(REGISTRY.flush)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[LabelKey, Any] = {}
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+    def dump(self) -> List:
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        REGISTRY.touched()
+
+    @staticmethod
+    def merge(total, value):
+        return (total or 0) + value
+
+    def render(self, values: Dict[LabelKey, Any]) -> List[str]:
+        return [f"{self.name}{_format_labels(key)} {_format_number(v)}" for key, v in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Per-bucket (non-cumulative) counts, then the +Inf overflow, sum and count
+                entry = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+                    break
+            else:
+                entry[len(self.buckets)] += 1
+            entry[-2] += value
+            entry[-1] += 1
+        REGISTRY.touched()
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    @staticmethod
+    def merge(total, value):
+        if total is None:
+            return list(value)
+        return [a + b for a, b in zip(total, value)]
+
+    def render(self, values: Dict[LabelKey, Any]) -> List[str]:
+        lines = []
+        for key, entry in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), entry):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_number(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', le),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_number(entry[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {entry[-1]}")
+        return lines
+
+
+def register_gauge(name: str, help: str, callback: Callable[[], float]):
+    """A gauge computed when metrics are scraped (e.g. catalogue size, which all workers share)"""
+    REGISTRY.gauges[name] = (help, callback)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in key) + "}"
+
+
+def _format_number(value: float) -> str:
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def render_metrics() -> str:
+    """All metrics, summed across worker processes, in the Prometheus text exposition format"""
+    totals = REGISTRY.collect()
+    lines = []
+    for name, metric in sorted(REGISTRY.metrics.items()):
+        lines.append(f"# HELP {name} {metric.help}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        lines.extend(metric.render(totals.get(name, {})))
+    for name, (help, callback) in sorted(REGISTRY.gauges.items()):
+        try:
+            value = callback()
+        except Exception as e:
+            print(f"[WARNING] Gauge {name} failed: {e}")
+            continue
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {_format_number(float(value))}")
+    return "\n".join(lines) + "\n"
+
+
+# Metrics shared by the detect and search paths
+DETECT_STAGE_SECONDS = Histogram(
+    "detect_stage_seconds",
+    "Time spent in each stage of /detector/detect",
+)
+DETECT_REQUESTS = Counter("detect_requests_total", "Detect requests by mode and outcome")
+DETECT_WARNINGS = Counter("detect_warnings_total", "Items saved with a warning (e.g. no description)")
+OPENAI_REQUEST_SECONDS = Histogram("openai_request_seconds", "Latency of OpenAI API attempts")
+OPENAI_REQUESTS = Counter("openai_requests_total", "OpenAI API attempts by result")
+DESCRIPTION_CACHE_LOOKUPS = Counter("description_cache_lookups_total", "Description cache lookups by result")
+CATALOGUE_CACHE_LOOKUPS = Counter("catalogue_cache_lookups_total", "Catalogue snapshot lookups by result")
+HTTP_REQUEST_SECONDS = Histogram("http_request_seconds", "Request latency by endpoint")
+HTTP_REQUESTS = Counter("http_requests_total", "Requests by endpoint and status")
+MAINTENANCE_REMOVED = Counter("maintenance_removed_total", "Items and files removed by maintenance passes, by task")
@@ -0,0 +1,369 @@
+import os
+import time
+import random
+import asyncio
+import weakref
+import threading
+from typing import Optional, Any, TYPE_CHECKING
+
+from utils.metrics import OPENAI_REQUEST_SECONDS, OPENAI_REQUESTS
+
+if TYPE_CHECKING:
+    # The SDK takes most of a second to import, so it is only loaded when a client is first needed
+    from openai import OpenAI, AsyncOpenAI
+
+
+# Per-process limits; with N gunicorn workers the deployment-wide limit is N times these
+OPENAI_RPM = float(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = float(os.getenv("OPENAI_TPM", "200000"))
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "4"))
+# Calls made from the ASGI event loop hold no thread while in flight, so they get a wider cap
+OPENAI_ASYNC_MAX_CONCURRENCY = int(os.getenv("OPENAI_ASYNC_MAX_CONCURRENCY", "64"))
+# Total time budget for one call, including queueing and retries
+OPENAI_DEADLINE = float(os.getenv("OPENAI_DEADLINE", "30"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+OPENAI_BREAKER_THRESHOLD = int(os.getenv("OPENAI_BREAKER_THRESHOLD", "5"))
+OPENAI_BREAKER_RESET = float(os.getenv("OPENAI_BREAKER_RESET", "30"))
+
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+# How often an async call waiting for a free concurrency slot checks again
+SLOT_POLL_INTERVAL = 0.05
+
+
+class UpstreamUnavailable(Exception):
+    """Raised when a call is refused locally (open circuit, rate limit or deadline) or keeps failing"""
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at `rate_per_minute`"""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, amount: float) -> float:
+        """Take `amount` tokens if available; returns 0, or the seconds until they will be"""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0.0
+            return (amount - self.tokens) / self.rate if self.rate else float("inf")
+
+    def acquire(self, amount: float, deadline: float) -> bool:
+        """Take `amount` tokens, waiting until `deadline` (monotonic time) at most"""
+        while True:
+            wait = self.try_acquire(amount)
+            if not wait:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(min(wait, 1.0))
+
+    async def acquire_async(self, amount: float, deadline: float) -> bool:
+        """acquire() for event-loop callers: waits with asyncio.sleep instead of blocking"""
+        while True:
+            wait = self.try_acquire(amount)
+            if not wait:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(min(wait, 1.0))
+
+
+class CircuitBreaker:
+    """
+    Fails fast after `threshold` consecutive upstream failures.
+
+    After `reset_timeout` seconds one trial call is let through (half-open); its
+    success closes the circuit and its failure opens it again.
+    """
+
+    def __init__(self, threshold: int = OPENAI_BREAKER_THRESHOLD, reset_timeout: float = OPENAI_BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def allow_retry(self) -> bool:
+        """Whether a call already in progress may retry (not once the circuit has opened)"""
+        with self._lock:
+            return self.opened_at is None
+
+    def release_trial(self):
+        """Give back a half-open trial slot without judging upstream health"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_flight or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+def _is_retryable(error: Exception) -> bool:
+    import openai
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class OpenAIGateway:
+    """
+    Process-wide access point for OpenAI chat completions.
+
+    One client (and HTTP connection pool) is shared by every call. Each call is
+    admitted through requests/minute and tokens/minute buckets and a concurrency
+    cap, runs under an overall deadline, is retried with jittered exponential
+    backoff on 429/5xx/connection errors, and is refused immediately while the
+    circuit breaker is open. Refusals raise UpstreamUnavailable so callers fall
+    back to saving items without a description.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        rpm: float = OPENAI_RPM,
+        tpm: float = OPENAI_TPM,
+        max_concurrency: int = OPENAI_MAX_CONCURRENCY,
+        async_max_concurrency: int = OPENAI_ASYNC_MAX_CONCURRENCY,
+        deadline: float = OPENAI_DEADLINE,
+        max_retries: int = OPENAI_MAX_RETRIES,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.async_slots = threading.BoundedSemaphore(async_max_concurrency)
+        self.breaker = breaker or CircuitBreaker()
+        self._client: Optional["OpenAI"] = None
+        self._client_lock = threading.Lock()
+        # Async clients are bound to the event loop they were created on
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    @property
+    def client(self) -> "OpenAI":
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from openai import OpenAI
+                    # Retries are done here so they share the deadline and the breaker
+                    self._client = OpenAI(
+                        api_key=self.api_key,
+                        base_url=self.base_url,
+                        max_retries=0,
+                        timeout=self.deadline,
+                    )
+        return self._client
+
+    def async_client(self) -> "AsyncOpenAI":
+        """The AsyncOpenAI client for the running event loop (one per ASGI worker process)"""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            from openai import AsyncOpenAI
+            client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0, timeout=self.deadline)
+            self._async_clients[loop] = client
+        return client
+
+    def chat_completion(self, estimated_tokens: int = 1000, deadline: Optional[float] = None, **kwargs) -> Any:
+        """
+        Create a chat completion through the limiter, deadline, retry and breaker.
+
+        Args:
+            estimated_tokens: Prompt plus completion tokens charged to the TPM bucket
+            deadline: Seconds this call may take in total (defaults to OPENAI_DEADLINE)
+            **kwargs: Passed to client.chat.completions.create
+
+        Returns:
+            The OpenAI ChatCompletion response
+        """
+        if not self.breaker.allow():
+            OPENAI_REQUESTS.inc(result="refused")
+            raise UpstreamUnavailable("OpenAI circuit breaker is open")
+        expires = time.monotonic() + (deadline if deadline is not None else self.deadline)
+        try:
+            if not self.requests.acquire(1, expires) or not self.tokens.acquire(estimated_tokens, expires):
+                raise UpstreamUnavailable("OpenAI rate limit budget exhausted for this deadline")
+            if not self.slots.acquire(timeout=max(0.0, expires - time.monotonic())):
+                raise UpstreamUnavailable("No free OpenAI request slot before the deadline")
+        except UpstreamUnavailable:
+            # Local refusals say nothing about upstream health; let the trial slot go
+            self.breaker.release_trial()
+            OPENAI_REQUESTS.inc(result="refused")
+            raise
+        try:
+            return self._call_with_retries(expires, kwargs)
+        finally:
+            self.slots.release()
+
+    def _call_with_retries(self, expires: float, kwargs) -> Any:
+        attempt = 0
+        while True:
+            remaining = self._remaining(expires)
+            started = time.perf_counter()
+            try:
+                response = self.client.with_options(timeout=remaining).chat.completions.create(**kwargs)
+            except Exception as e:
+                delay = self._failed_attempt(e, attempt, expires, started, kwargs)
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self._succeeded_attempt(started, kwargs)
+            return response
+
+    async def chat_completion_async(self, estimated_tokens: int = 1000, deadline: Optional[float] = None, **kwargs) -> Any:
+        """
+        chat_completion() for event-loop callers, on the AsyncOpenAI client.
+
+        Shares the limiter buckets and circuit breaker with synchronous calls
+        but has its own concurrency cap (OPENAI_ASYNC_MAX_CONCURRENCY), and
+        waits with asyncio.sleep, so a slow upstream holds no thread while the
+        call is in flight.
+        """
+        if not self.breaker.allow():
+            OPENAI_REQUESTS.inc(result="refused")
+            raise UpstreamUnavailable("OpenAI circuit breaker is open")
+        expires = time.monotonic() + (deadline if deadline is not None else self.deadline)
+        try:
+            if not await self.requests.acquire_async(1, expires) or not await self.tokens.acquire_async(estimated_tokens, expires):
+                raise UpstreamUnavailable("OpenAI rate limit budget exhausted for this deadline")
+            while not self.async_slots.acquire(blocking=False):
+                if time.monotonic() + SLOT_POLL_INTERVAL >= expires:
+                    raise UpstreamUnavailable("No free OpenAI request slot before the deadline")
+                await asyncio.sleep(SLOT_POLL_INTERVAL)
+        except UpstreamUnavailable:
+            self.breaker.release_trial()
+            OPENAI_REQUESTS.inc(result="refused")
+            raise
+        try:
+            attempt = 0
+            while True:
+                remaining = self._remaining(expires)
+                started = time.perf_counter()
+                try:
+                    response = await self.async_client().with_options(timeout=remaining).chat.completions.create(**kwargs)
+                except Exception as e:
+                    delay = self._failed_attempt(e, attempt, expires, started, kwargs)
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+                self._succeeded_attempt(started, kwargs)
+                return response
+        finally:
+            self.async_slots.release()
+
+    def _remaining(self, expires: float) -> float:
+        remaining = expires - time.monotonic()
+        if remaining <= 0:
+            self.breaker.record_failure()
+            raise UpstreamUnavailable("OpenAI call exceeded its deadline")
+        return remaining
+
+    def _succeeded_attempt(self, started: float, kwargs):
+        OPENAI_REQUEST_SECONDS.observe(time.perf_counter() - started, model=kwargs.get("model", ""))
+        OPENAI_REQUESTS.inc(result="success")
+        self.breaker.record_success()
+
+    def _failed_attempt(self, error: Exception, attempt: int, expires: float, started: float, kwargs) -> float:
+        """Record a failed attempt; returns the backoff before retrying, or raises if the call is over"""
+        OPENAI_REQUEST_SECONDS.observe(time.perf_counter() - started, model=kwargs.get("model", ""))
+        if not _is_retryable(error):
+            # Client errors (bad request, auth) are not upstream degradation
+            OPENAI_REQUESTS.inc(result="client_error")
+            self.breaker.release_trial()
+            raise error
+        OPENAI_REQUESTS.inc(result="retryable_error")
+        self.breaker.record_failure()
+        if attempt >= self.max_retries or not self.breaker.allow_retry():
+            raise UpstreamUnavailable(f"OpenAI call failed after {attempt + 1} attempt(s): {error}") from error
+        delay = _retry_after(error)
+        if delay is None:
+            delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt) * random.uniform(0.5, 1.5)
+        if time.monotonic() + delay >= expires:
+            raise UpstreamUnavailable(f"OpenAI call failed and no time is left to retry: {error}") from error
+        print(f"[WARNING] OpenAI call failed ({error}); retrying in {delay:.1f}s")
+        return delay
+
+_gateway: Optional[OpenAIGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> Optional[OpenAIGateway]:
+    """Return the shared gateway, or None if no API key is configured"""
+    global _gateway
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        return None
+    if _gateway is None or _gateway.api_key != api_key:
+        with _gateway_lock:
+            if _gateway is None or _gateway.api_key != api_key:
+                _gateway = OpenAIGateway(api_key=api_key, base_url=os.getenv("OPENAI_BASE_URL"))
+    return _gateway
+
+
+def warm_up() -> bool:
+    """
+    Import the OpenAI SDK and build the shared client ahead of the first description.
+
+    Returns:
+        True if a client was built (an API key is configured)
+    """
+    import openai  # noqa: F401 (loads the SDK even when no key is set)
+    gateway = get_gateway()
+    if gateway is None:
+        return False
+    gateway.client
+    return True
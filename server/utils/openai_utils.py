@@ -1,21 +1,50 @@
 import os
 import json
 import base64
-from openai import OpenAI
-from typing import Optional, Dict, Any
+import asyncio
+from typing import Optional, Dict, Any, List, TYPE_CHECKING
+from utils.openai_gateway import get_gateway, UpstreamUnavailable
+from utils.description_cache import get_description_cache, cache_key
+from utils.image_utils import vision_payload, VISION_DETAIL
+from utils.search_index import get_index, tokenize
+from utils.vector_index import semantic_search
+from utils.metrics import DETECT_STAGE_SECONDS
+
+if TYPE_CHECKING:
+    from openai import OpenAI
 
 
 itemFields = ["category", "label", "color", "condition", "distinctive_features"] 
 itemCategories = ["bottle", "book", "toy", "backpack", "bag", "cell_phone", "watch", "wallet", "key", "other"]
 
 
-# Initialize OpenAI client lazily (only when API key is available)
-def get_client() -> Optional[OpenAI]:
-    """Get OpenAI client if API key is available"""
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        return None
-    return OpenAI(api_key=api_key)
+VISION_MODEL = "gpt-4o-mini"
+# Bump whenever the description prompt changes so cached descriptions are not reused
+DESCRIPTION_PROMPT_VERSION = "1"
+
+# Rough token charge for the TPM limiter: prompt text, one low-detail image and the completion
+VISION_TOKEN_ESTIMATE = 600
+
+# Assisted search: candidates retrieved locally, then reranked by the LLM
+RERANK_MODEL = "gpt-4o-mini"
+RERANK_TOP_K = int(os.getenv("RERANK_TOP_K", "30"))
+RERANK_PROMPT_TOKEN_BUDGET = int(os.getenv("RERANK_PROMPT_TOKEN_BUDGET", "1500"))
+RERANK_PROMPT_OVERHEAD = 200
+RERANK_MAX_TOKENS = 300
+CANDIDATE_POOL_FACTOR = 4
+CANDIDATE_FEATURES_CHARS = 160
+CATEGORY_BOOST = 2.0
+COLOR_BOOST = 1.0
+COLOR_WORDS = {
+    "black", "white", "gray", "grey", "silver", "gold", "red", "pink", "orange", "yellow",
+    "green", "blue", "navy", "teal", "purple", "brown", "beige", "tan", "clear", "transparent",
+}
+
+
+def get_client() -> Optional["OpenAI"]:
+    """Get the shared, pooled OpenAI client if API key is available"""
+    gateway = get_gateway()
+    return gateway.client if gateway else None
 
 
 def encode_image(image_path: str) -> str:
@@ -24,6 +53,10 @@ def encode_image(image_path: str) -> str:
         return base64.b64encode(image_file.read()).decode('utf-8')
 
 
+def description_cache_key(image_bytes: bytes) -> str:
+    return cache_key(image_bytes, VISION_MODEL, DESCRIPTION_PROMPT_VERSION)
+
+
 def parse_openai_json_response(content: str) -> Optional[Dict[str, Any]]:
     """
     Parse OpenAI API response content, handling markdown code blocks and JSON parsing.
@@ -58,69 +91,106 @@ def parse_openai_json_response(content: str) -> Optional[Dict[str, Any]]:
         return None
 
 
+def lookup_description(image_path: str):
+    """Returns (cache key, cached description or None) for an image file"""
+    with open(image_path, "rb") as image_file:
+        image_bytes = image_file.read()
+    key = description_cache_key(image_bytes)
+    cached = get_description_cache().get(key)
+    if cached:
+        print(f"[DEBUG] Description cache hit: {key[:12]}")
+    return key, cached
+
+
+def vision_request(image_path: str) -> Dict[str, Any]:
+    """Chat completion arguments asking the vision model to describe the item in `image_path`"""
+    # Send a downscaled variant; the stored image stays at full preprocessed size
+    with DETECT_STAGE_SECONDS.time(stage="vision_encode"):
+        vision_bytes, vision_mimetype = vision_payload(image_path)
+        base64_image = base64.b64encode(vision_bytes).decode('utf-8')
+    return {
+        "model": VISION_MODEL,
+        "messages": [
+            {
+                "role": "system",
+                "content": (
+                    "You are a helpful assistant that describes lost and found items. "
+                    "Provide a concise, detailed description focusing on color, brand (if visible), "
+                    "condition and distinctive features. Keep it short and concise. Do not include anything about the person "
+                    "holding the item or the hand holding it. Ignore any other items that are not in the focus. "
+                    "Always return a valid JSON object with the following fields: " + ", ".join(itemFields) + ". "
+                    "Always use a generic item name for the label, if brand is know put it next to the label in parentheses."
+                    "The category should be one of the following: " + ", ".join(itemCategories) + ". "
+                    "If the item is not detected, set category to 'other' and provide what you can see."
+                )
+            },
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": (
+                            "Provide a detailed description "
+                            "of this item that would help someone identify it if they lost it. "
+                            "Keep it short and concise."
+                        )
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:{vision_mimetype};base64,{base64_image}",
+                            "detail": VISION_DETAIL
+                        }
+                    }
+                ]
+            }
+        ],
+        "response_format": {"type": "json_object"},
+        "max_tokens": 200,
+    }
+
+
+def store_description(response, key: str) -> Optional[Dict[str, Any]]:
+    """Parse a vision response and cache the description under `key`"""
+    content = response.choices[0].message.content
+    with DETECT_STAGE_SECONDS.time(stage="parse"):
+        result = parse_openai_json_response(content)
+    if result:
+        print(f"[DEBUG] OpenAI returned: {result}")
+        get_description_cache().put(key, result)
+    return result
+
+
 def generate_item_description(image_path: str) -> Optional[Dict[str, Any]]:
     """
     Generate a detailed description of a found item using OpenAI Vision API
+
+    Descriptions are cached by image content, model and prompt version, so a
+    re-photographed or retried identical image is answered without a new call.
     
     Args:
         image_path: Path to the image file
         
     Returns:
         Dictionary with item description fields (category, color, condition, distinctive_features) or None if API call fails
+
+    Raises:
+        UpstreamUnavailable: The gateway refused or gave up on the call (open circuit, rate limit, deadline)
     """
     try:
-        client = get_client()
-        if not client:
+        key, cached = lookup_description(image_path)
+        if cached:
+            return cached
+
+        gateway = get_gateway()
+        if not gateway:
             print("[INFO] OpenAI API key not configured, skipping description generation")
             return None
-            
-        base64_image = encode_image(image_path)
-        
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "You are a helpful assistant that describes lost and found items. "
-                        "Provide a concise, detailed description focusing on color, brand (if visible), "
-                        "condition and distinctive features. Keep it short and concise. Do not include anything about the person "
-                        "holding the item or the hand holding it. Ignore any other items that are not in the focus. "
-                        "Always return a valid JSON object with the following fields: " + ", ".join(itemFields) + ". "
-                        "Always use a generic item name for the label, if brand is know put it next to the label in parentheses."
-                        "The category should be one of the following: " + ", ".join(itemCategories) + ". "
-                        "If the item is not detected, set category to 'other' and provide what you can see."
-                    )
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": (
-                                "Provide a detailed description "
-                                "of this item that would help someone identify it if they lost it. "
-                                "Keep it short and concise."
-                            )
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            response_format={"type": "json_object"},
-            max_tokens=200
-        )
-        
-        content = response.choices[0].message.content
-        result = parse_openai_json_response(content)
-        if result:
-            print(f"[DEBUG] OpenAI returned: {result}")
-        return result
+
+        response = gateway.chat_completion(estimated_tokens=VISION_TOKEN_ESTIMATE, **vision_request(image_path))
+        return store_description(response, key)
+    except UpstreamUnavailable:
+        raise
     except Exception as e:
         print(f"[ERROR] OpenAI description generation failed: {e}")
         import traceback
@@ -128,40 +198,147 @@ def generate_item_description(image_path: str) -> Optional[Dict[str, Any]]:
         return None
 
 
-def search_items_with_llm(query: str, metadata: list) -> Dict[str, Any]:
+async def generate_item_description_async(image_path: str) -> Optional[Dict[str, Any]]:
     """
-    Use LLM to help search through lost items metadata using natural language
-    
+    generate_item_description() for the ASGI server.
+
+    The vision call goes through the AsyncOpenAI client, so waiting on it holds
+    no thread; file reads, image encoding and cache writes run in the default
+    thread pool.
+    """
+    try:
+        key, cached = await asyncio.to_thread(lookup_description, image_path)
+        if cached:
+            return cached
+
+        gateway = get_gateway()
+        if not gateway:
+            print("[INFO] OpenAI API key not configured, skipping description generation")
+            return None
+
+        request = await asyncio.to_thread(vision_request, image_path)
+        response = await gateway.chat_completion_async(estimated_tokens=VISION_TOKEN_ESTIMATE, **request)
+        return await asyncio.to_thread(store_description, response, key)
+    except UpstreamUnavailable:
+        raise
+    except Exception as e:
+        print(f"[ERROR] OpenAI description generation failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+
+def _estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def query_hints(query: str) -> Dict[str, set]:
+    """Categories and colors named in a free-text query ("my blue phone" -> cell_phone, blue)"""
+    terms = set(tokenize(query))
+    categories = {
+        category for category in itemCategories
+        if category != "other" and terms & set(tokenize(category))
+    }
+    return {"categories": categories, "colors": terms & COLOR_WORDS}
+
+
+def retrieve_candidates(
+    query: str,
+    k: int = RERANK_TOP_K,
+    category: Optional[str] = None,
+    color: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Stage one of assisted search: cheap local retrieval over the whole catalogue.
+
+    Any query term may match (BM25 over label, category, color, condition and
+    distinctive features, typo tolerant), and records whose category or color is
+    named in the query are boosted. If no keyword matches, the nearest records
+    from the vector index are used, and failing that the newest records
+    (within the explicit filters), so the reranker still has something to
+    look at.
+
+    Returns:
+        Up to `k` records, best first, each with a local `score`
+    """
+    index = get_index()
+    hits = index.search(
+        query, category=category, color=color,
+        limit=max(k * CANDIDATE_POOL_FACTOR, k), match_all=False,
+    )["results"]
+    if not hits and not category and not color:
+        hits = semantic_search(query, k) or []
+    if not hits:
+        return index.search("", category=category, color=color, limit=k)["results"]
+
+    hints = query_hints(query)
+    for record in hits:
+        if (record.get("category") or "").lower() in hints["categories"]:
+            record["score"] += CATEGORY_BOOST
+        if hints["colors"] & set(tokenize(record.get("color"))):
+            record["score"] += COLOR_BOOST
+        record["score"] = round(record["score"], 4)
+    # Stable sort keeps the index's newest-first order among equal scores
+    hits.sort(key=lambda record: -record["score"])
+    return hits[:k]
+
+
+def format_candidate(record: Dict[str, Any]) -> str:
+    """One compact prompt line per candidate, keyed by its filename"""
+    fields = [record.get("label") or "unknown item", record.get("category")]
+    for name in ("color", "condition"):
+        if record.get(name):
+            fields.append(f"{name}: {record[name]}")
+    features = record.get("distinctive_features")
+    if features:
+        if not isinstance(features, str):
+            features = ", ".join(str(f) for f in features)
+        fields.append(f"features: {features[:CANDIDATE_FEATURES_CHARS]}")
+    if record.get("timestamp"):
+        fields.append(f"found {record['timestamp']}")
+    return f"- {record.get('filename')}: " + "; ".join(str(f) for f in fields if f)
+
+
+def search_items_with_llm(
+    query: str,
+    candidates: List[Dict[str, Any]],
+    token_budget: int = RERANK_PROMPT_TOKEN_BUDGET,
+) -> Optional[Dict[str, Any]]:
+    """
+    Stage two of assisted search: let the LLM rerank and filter local candidates.
+
+    Candidates are added to the prompt best first until `token_budget` is
+    spent, and the model answers with filenames, which are checked against the
+    candidates it was shown.
+
     Args:
         query: Natural language search query
-        metadata: List of item metadata records
-        
+        candidates: Records from `retrieve_candidates`, best first
+        token_budget: Approximate prompt tokens available for the candidate list
+
     Returns:
-        Dictionary with matched items and LLM reasoning
+        Dictionary with `reasoning`, `matched_filenames` (best first) and `suggestions`,
+        or None if the LLM is not configured, unavailable or answered unusably
     """
+    gateway = get_gateway()
+    if not gateway or not candidates:
+        return None
+
+    lines, shown, used = [], set(), 0
+    for record in candidates:
+        line = format_candidate(record)
+        cost = _estimate_tokens(line)
+        if lines and used + cost > token_budget:
+            break
+        lines.append(line)
+        shown.add(record.get("filename"))
+        used += cost
+    items_context = "\n".join(lines)
+
     try:
-        client = get_client()
-        if not client:
-            return {
-                "reasoning": "OpenAI API key not configured",
-                "matched_indices": [],
-                "suggestions": [
-                    "Please set OPENAI_API_KEY environment variable to enable LLM search"
-                ]
-            }
-        
-        # Format metadata for context
-        items_context = "\n".join([
-            (
-                f"- {item.get('label', 'unknown')} found at "
-                f"{item.get('timestamp', 'unknown time')}: "
-                f"{item.get('image_url', 'no image')}"
-            )
-            for item in metadata[-20:]  # Last 20 items for context
-        ])
-        
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
+        response = gateway.chat_completion(
+            estimated_tokens=RERANK_PROMPT_OVERHEAD + used + _estimate_tokens(query) + RERANK_MAX_TOKENS,
+            model=RERANK_MODEL,
             messages=[
                 {
                     "role": "system",
@@ -176,31 +353,72 @@ def search_items_with_llm(query: str, metadata: list) -> Dict[str, Any]:
                     "role": "user",
                     "content": (
                         f"User query: '{query}'\n\n"
-                        f"Available items:\n{items_context}\n\n"
-                        "Which items match the user's query? Provide a JSON response with: "
-                        "'reasoning' (explanation), 'matched_indices' (list of indices), "
+                        f"Candidate items (filename: description):\n{items_context}\n\n"
+                        "Which items plausibly match the user's query? Provide a JSON response with: "
+                        "'reasoning' (short explanation), 'matched_filenames' (filenames exactly as "
+                        "listed, best match first, empty if none match), "
                         "and 'suggestions' (helpful tips)."
                     )
                 }
             ],
             response_format={"type": "json_object"},
-            max_tokens=300
+            max_tokens=RERANK_MAX_TOKENS
         )
-        
-        content = response.choices[0].message.content
-        result = parse_openai_json_response(content)
-        if result:
-            return result
-        else:
-            return {
-                "reasoning": "Failed to parse OpenAI response",
-                "matched_indices": [],
-                "suggestions": []
-            }
+        result = parse_openai_json_response(response.choices[0].message.content)
     except Exception as e:
-        print(f"[ERROR] OpenAI search failed: {e}")
-        return {
-            "reasoning": "Search service temporarily unavailable",
-            "matched_indices": [],
-            "suggestions": []
-        }
+        print(f"[ERROR] OpenAI search rerank failed: {e}")
+        return None
+    if not isinstance(result, dict) or not isinstance(result.get("matched_filenames"), list):
+        return None
+
+    matched = []
+    for filename in result["matched_filenames"]:
+        if filename in shown and filename not in matched:
+            matched.append(filename)
+    suggestions = result.get("suggestions") or []
+    return {
+        "reasoning": str(result.get("reasoning") or ""),
+        "matched_filenames": matched,
+        "suggestions": suggestions if isinstance(suggestions, list) else [str(suggestions)],
+    }
+
+
+def assisted_search(
+    query: str,
+    k: int = RERANK_TOP_K,
+    category: Optional[str] = None,
+    color: Optional[str] = None,
+    rerank: bool = True,
+) -> Dict[str, Any]:
+    """
+    Natural language search over the whole catalogue: local retrieval, then an optional LLM rerank.
+
+    Without an API key, with `rerank` off, or when the rerank fails, the local
+    ranking is returned as is (`reranked` is False).
+
+    Returns:
+        Dictionary with `results` (records), `reranked`, `reasoning`, `suggestions`
+        and `candidates` (how many records stage one produced)
+    """
+    candidates = retrieve_candidates(query, k=k, category=category, color=color)
+    response = {
+        "results": candidates,
+        "reranked": False,
+        "reasoning": None,
+        "suggestions": [],
+        "candidates": len(candidates),
+    }
+    if not rerank or not query.strip():
+        return response
+
+    ranking = search_items_with_llm(query, candidates)
+    if ranking is None:
+        return response
+    by_filename = {record["filename"]: record for record in candidates}
+    response.update(
+        results=[by_filename[f] for f in ranking["matched_filenames"]],
+        reranked=True,
+        reasoning=ranking["reasoning"],
+        suggestions=ranking["suggestions"],
+    )
+    return response
@@ -0,0 +1,80 @@
+import os
+import io
+import time
+import random
+import pstats
+import cProfile
+import threading
+from typing import Optional
+
+from flask import g, request
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Fraction of requests profiled (0 disables profiling); e.g. 0.01 profiles 1%
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(BASE_DIR, "cache", "profiles"))
+# Functions listed in the text summary written next to each .prof file
+PROFILE_REPORT_LINES = 40
+
+# cProfile allows one active profiler per interpreter on newer Pythons, so one request at a time
+_profiling = threading.Lock()
+
+
+def _start_profile():
+    if PROFILE_SAMPLE_RATE <= 0 or random.random() >= PROFILE_SAMPLE_RATE:
+        return
+    if not _profiling.acquire(blocking=False):
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        _profiling.release()
+        return
+    g._profiler = profiler
+    g._profile_started = time.perf_counter()
+
+
+def _record_status(response):
+    if "_profiler" in g:
+        g._profile_status = response.status_code
+    return response
+
+
+def _finish_profile(exc=None):
+    # Teardown runs even when the view raised, so the profiler is always released
+    profiler: Optional[cProfile.Profile] = g.pop("_profiler", None)
+    if profiler is None:
+        return
+    try:
+        profiler.disable()
+        elapsed_ms = (time.perf_counter() - g.pop("_profile_started")) * 1000
+        status = g.pop("_profile_status", 500)
+        name = f"{time.strftime('%Y%m%d_%H%M%S')}_{request.endpoint or 'unknown'}_{os.getpid()}_{elapsed_ms:.0f}ms"
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base = os.path.join(PROFILE_DIR, name.replace("/", "_"))
+        profiler.dump_stats(base + ".prof")
+        report = io.StringIO()
+        report.write(f"{request.method} {request.full_path} -> {status} in {elapsed_ms:.1f} ms\n\n")
+        pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(PROFILE_REPORT_LINES)
+        with open(base + ".txt", "w") as f:
+            f.write(report.getvalue())
+    except Exception as e:
+        print(f"[WARNING] Could not write request profile: {e}")
+    finally:
+        _profiling.release()
+
+
+def install_profiler(app):
+    """
+    Profile a random PROFILE_SAMPLE_RATE share of requests with cProfile.
+
+    Each sampled request leaves <time>_<endpoint>_<pid>_<ms>.prof (load with
+    pstats or snakeviz) and a .txt summary sorted by cumulative time in
+    PROFILE_DIR. Streaming responses are profiled until their headers are sent.
+    """
+    if PROFILE_SAMPLE_RATE <= 0:
+        return
+    app.before_request(_start_profile)
+    app.after_request(_record_status)
+    app.teardown_request(_finish_profile)
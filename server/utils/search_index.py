@@ -0,0 +1,322 @@
+import re
+import math
+import json
+import base64
+import bisect
+from threading import RLock
+from collections import defaultdict
+from typing import Optional, Dict, Any, List, Tuple
+
+from utils.metadata_utils import get_store
+
+
+# Searchable record fields and their weight in the term frequency
+SEARCH_FIELDS = {
+    "label": 3.0,
+    "category": 2.0,
+    "color": 1.5,
+    "condition": 1.0,
+    "distinctive_features": 1.0,
+}
+STOPWORDS = {"a", "an", "and", "the", "of", "on", "in", "with", "to", "is", "it", "has", "its", "at", "for", "or"}
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Score multipliers for expanded query terms
+PREFIX_WEIGHT = 0.8
+FUZZY_WEIGHT = 0.6
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Lowercase and split text into index terms, dropping stopwords"""
+    if not text:
+        return []
+    return [t for t in _TOKEN_RE.findall(str(text).lower()) if t not in STOPWORDS]
+
+
+def _deletes(term: str) -> List[str]:
+    """All strings at deletion distance 1 from term (SymSpell-style neighbourhood)"""
+    return [term[:i] + term[i + 1:] for i in range(len(term))]
+
+
+def _edit_distance_at_most_one(a: str, b: str) -> bool:
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) == len(b):
+        diffs = [i for i in range(len(a)) if a[i] != b[i]]
+        # One substitution, or one adjacent transposition
+        return len(diffs) == 1 or (
+            len(diffs) == 2 and diffs[1] == diffs[0] + 1
+            and a[diffs[0]] == b[diffs[1]] and a[diffs[1]] == b[diffs[0]]
+        )
+    if len(a) > len(b):
+        a, b = b, a
+    for i in range(len(b)):
+        if b[:i] + b[i + 1:] == a:
+            return True
+    return False
+
+
+def encode_cursor(score: float, filename: str) -> str:
+    raw = json.dumps([round(score, 6), filename]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Optional[Tuple[float, str]]:
+    try:
+        score, filename = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return float(score), str(filename)
+    except Exception:
+        return None
+
+
+class SearchIndex:
+    """
+    In-process inverted index over the searchable item fields.
+
+    Records are keyed by filename. Postings hold a field-weighted term frequency
+    per document, which feeds a BM25 score. Query terms are expanded to indexed
+    terms by exact match, prefix match and (for terms of 4+ characters) a single
+    edit, so "bott" and "botle" both find "bottle".
+    """
+
+    def __init__(self):
+        self._lock = RLock()
+        self.records: Dict[str, Dict[str, Any]] = {}
+        self.postings: Dict[str, Dict[str, float]] = defaultdict(dict)
+        self.doc_terms: Dict[str, Dict[str, float]] = {}
+        self.doc_lengths: Dict[str, float] = {}
+        self.total_length = 0.0
+        self._vocab: List[str] = []
+        self._vocab_dirty = False
+        self._delete_map: Dict[str, set] = defaultdict(set)
+        # Catalogue version the index reflects
+        self.version = 0
+
+    def __len__(self):
+        return len(self.records)
+
+    def add(self, record: Dict[str, Any]):
+        filename = record.get("filename")
+        if not filename:
+            return
+        with self._lock:
+            if filename in self.records:
+                self.remove(filename)
+            terms: Dict[str, float] = defaultdict(float)
+            for field, weight in SEARCH_FIELDS.items():
+                for term in tokenize(record.get(field)):
+                    terms[term] += weight
+            self.records[filename] = record
+            self.doc_terms[filename] = dict(terms)
+            length = sum(terms.values())
+            self.doc_lengths[filename] = length
+            self.total_length += length
+            for term, tf in terms.items():
+                if term not in self.postings:
+                    self._add_term(term)
+                self.postings[term][filename] = tf
+
+    def remove(self, filename: str):
+        with self._lock:
+            if filename not in self.records:
+                return
+            for term in self.doc_terms.pop(filename):
+                docs = self.postings.get(term)
+                if docs is None:
+                    continue
+                docs.pop(filename, None)
+                if not docs:
+                    del self.postings[term]
+                    self._remove_term(term)
+            self.total_length -= self.doc_lengths.pop(filename)
+            del self.records[filename]
+
+    def _add_term(self, term: str):
+        self._vocab_dirty = True
+        self._vocab.append(term)
+        for deleted in _deletes(term):
+            self._delete_map[deleted].add(term)
+
+    def _remove_term(self, term: str):
+        self._vocab_dirty = True
+        self._vocab.remove(term)
+        for deleted in _deletes(term):
+            bucket = self._delete_map.get(deleted)
+            if bucket is not None:
+                bucket.discard(term)
+                if not bucket:
+                    del self._delete_map[deleted]
+
+    def _sorted_vocab(self) -> List[str]:
+        if self._vocab_dirty:
+            self._vocab.sort()
+            self._vocab_dirty = False
+        return self._vocab
+
+    def expand(self, query_term: str) -> Dict[str, float]:
+        """Map a query term to indexed terms with a match-quality weight"""
+        matches: Dict[str, float] = {}
+        if query_term in self.postings:
+            matches[query_term] = 1.0
+        vocab = self._sorted_vocab()
+        start = bisect.bisect_left(vocab, query_term)
+        for term in vocab[start:]:
+            if not term.startswith(query_term):
+                break
+            matches.setdefault(term, PREFIX_WEIGHT)
+        if len(query_term) >= 4:
+            candidates = set(self._delete_map.get(query_term, ()))
+            for deleted in _deletes(query_term):
+                if deleted in self.postings:
+                    candidates.add(deleted)
+                candidates.update(self._delete_map.get(deleted, ()))
+            for term in candidates:
+                if _edit_distance_at_most_one(query_term, term):
+                    matches.setdefault(term, FUZZY_WEIGHT)
+        return matches
+
+    def _bm25(self, term: str, filename: str, tf: float) -> float:
+        n = len(self.records)
+        df = len(self.postings[term])
+        idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+        avgdl = self.total_length / n if n else 1.0
+        dl = self.doc_lengths[filename]
+        return idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * dl / (avgdl or 1.0)))
+
+    def search(
+        self,
+        query: str,
+        category: Optional[str] = None,
+        color: Optional[str] = None,
+        limit: int = 20,
+        cursor: Optional[str] = None,
+        match_all: bool = True,
+    ) -> Dict[str, Any]:
+        """
+        Rank records against `query`; every query term must match (after expansion).
+
+        Args:
+            query: Free-text query; may be empty when only filtering
+            category: Exact category filter
+            color: Color filter, matched against the color field's terms
+            limit: Page size
+            cursor: Opaque cursor returned as `next_cursor` by the previous page
+            match_all: If False, a record matching any query term is a hit (scores add up),
+                which suits conversational queries full of words no record contains
+
+        Returns:
+            Dictionary with `results` (records with a `score`), `total` and `next_cursor`
+        """
+        with self._lock:
+            scores: Optional[Dict[str, float]] = None
+            for query_term in tokenize(query):
+                term_scores: Dict[str, float] = defaultdict(float)
+                for term, weight in self.expand(query_term).items():
+                    for filename, tf in self.postings[term].items():
+                        score = weight * self._bm25(term, filename, tf)
+                        if score > term_scores[filename]:
+                            term_scores[filename] = score
+                if scores is None:
+                    scores = dict(term_scores)
+                elif match_all:
+                    scores = {f: s + term_scores[f] for f, s in scores.items() if f in term_scores}
+                else:
+                    for f, s in term_scores.items():
+                        scores[f] = scores.get(f, 0.0) + s
+                if match_all and not scores:
+                    break
+            if scores is None:
+                scores = {filename: 0.0 for filename in self.records}
+
+            category = category.lower() if category else None
+            color_terms = tokenize(color)
+            hits = []
+            for filename, score in scores.items():
+                record = self.records[filename]
+                if category and (record.get("category") or "").lower() != category:
+                    continue
+                if color_terms and not set(color_terms) <= set(tokenize(record.get("color"))):
+                    continue
+                # Ties (and filter-only queries) fall back to newest first
+                hits.append((-score, _reverse_key(record.get("timestamp")), filename))
+            hits.sort()
+
+            start = 0
+            position = decode_cursor(cursor) if cursor else None
+            if position:
+                after_score, after_filename = position
+                for start, (neg_score, _, filename) in enumerate(hits):
+                    if filename == after_filename:
+                        start += 1
+                        break
+                    if round(-neg_score, 6) < after_score:
+                        break
+                else:
+                    start = len(hits)
+
+            page = hits[start:start + limit]
+            results = [dict(self.records[f], score=round(-s, 4)) for s, _, f in page]
+            next_cursor = None
+            if start + limit < len(hits) and page:
+                last_score, _, last_filename = page[-1]
+                next_cursor = encode_cursor(-last_score, last_filename)
+            return {"results": results, "total": len(hits), "next_cursor": next_cursor}
+
+
+def _reverse_key(timestamp: Optional[str]) -> Tuple[int, ...]:
+    """Sort key that orders timestamps newest first"""
+    return tuple(-ord(ch) for ch in (timestamp or ""))
+
+
+_index: Optional[SearchIndex] = None
+_index_lock = RLock()
+
+
+def _build_index() -> SearchIndex:
+    store = get_store()
+    index = SearchIndex()
+    # Read the version first so changes landing during the load are replayed
+    index.version = store.version()
+    for record in store.all():
+        index.add(record)
+    return index
+
+
+def get_index() -> SearchIndex:
+    """
+    Return the process-wide search index, kept current from the store's change feed.
+
+    The index is built once; afterwards each call replays only the changes made
+    since the version it last saw (including those written by other worker
+    processes), and rebuilds only if that history is no longer available.
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = _build_index()
+            return _index
+        store = get_store()
+        if store.version() != _index.version:
+            changes = store.changes_since(_index.version)
+            if changes is None:
+                _index = _build_index()
+            else:
+                apply_changes(_index, changes)
+        return _index
+
+
+def apply_changes(index: SearchIndex, changes: List[Dict[str, Any]]):
+    with index._lock:
+        for change in changes:
+            if change["op"] == "delete":
+                index.remove(change["filename"])
+            else:
+                index.add(change["item"])
+            index.version = change["version"]
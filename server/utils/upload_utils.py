@@ -0,0 +1,211 @@
+import os
+import re
+import fcntl
+import base64
+import asyncio
+import binascii
+from contextlib import contextmanager
+from typing import Optional
+
+# Largest decoded image accepted by /detector/detect
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(15 * 1024 * 1024)))
+CHUNK_SIZE = 64 * 1024
+
+_BASE64_JUNK = re.compile(r"[^A-Za-z0-9+/=]")
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds its byte cap"""
+
+
+def max_request_bytes(max_upload_bytes: int = MAX_UPLOAD_BYTES) -> int:
+    """Request body cap: base64 input is 4/3 the image size, plus room for form overhead"""
+    return max_upload_bytes * 4 // 3 + 64 * 1024
+
+
+def _write_capped(chunks, path: str, max_bytes: int) -> int:
+    written = 0
+    try:
+        with open(path, "wb") as f:
+            for chunk in chunks:
+                written += len(chunk)
+                if written > max_bytes:
+                    raise UploadTooLarge(f"Image exceeds the {max_bytes} byte upload limit")
+                f.write(chunk)
+        if written == 0:
+            raise ValueError("Uploaded image is empty")
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return written
+
+
+def stream_to_file(stream, path: str, max_bytes: int = MAX_UPLOAD_BYTES, chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    Copy a binary stream to `path` in chunks, never holding more than one chunk.
+
+    Returns:
+        Number of bytes written
+
+    Raises:
+        UploadTooLarge: The stream is longer than `max_bytes` (the partial file is removed)
+    """
+    return _write_capped(iter(lambda: stream.read(chunk_size), b""), path, max_bytes)
+
+
+def _discard(f, path: str):
+    f.close()
+    if os.path.exists(path):
+        os.remove(path)
+
+
+async def stream_to_file_async(chunks, path: str, max_bytes: int = MAX_UPLOAD_BYTES, chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    stream_to_file() for an async iterator of byte chunks, e.g. an ASGI request body.
+
+    Chunks are batched to `chunk_size` and written from the default thread
+    pool, so a slow disk never stalls the event loop.
+
+    Returns:
+        Number of bytes written
+
+    Raises:
+        UploadTooLarge: The body is longer than `max_bytes` (the partial file is removed)
+    """
+    f = await asyncio.to_thread(open, path, "wb")
+    written = 0
+    pending = bytearray()
+    try:
+        async for chunk in chunks:
+            written += len(chunk)
+            if written > max_bytes:
+                raise UploadTooLarge(f"Image exceeds the {max_bytes} byte upload limit")
+            pending += chunk
+            if len(pending) >= chunk_size:
+                await asyncio.to_thread(f.write, bytes(pending))
+                pending.clear()
+        if pending:
+            await asyncio.to_thread(f.write, bytes(pending))
+        await asyncio.to_thread(f.close)
+        if written == 0:
+            raise ValueError("Uploaded image is empty")
+    except BaseException:
+        await asyncio.to_thread(_discard, f, path)
+        raise
+    return written
+
+
+class Base64StreamDecoder:
+    """
+    Incremental decoder for base64 text, optionally prefixed with a data URL header.
+
+    Text may arrive in arbitrary pieces; each call to `feed` decodes every
+    complete 4-character group seen so far and keeps the remainder for the next
+    call, so memory use is bounded by the piece size rather than the image size.
+    """
+
+    def __init__(self):
+        self._pending = ""
+        self._header_done = False
+        self._header = ""
+
+    def feed(self, text: str) -> bytes:
+        if not self._header_done:
+            self._header += text
+            if "," in self._header:
+                _, text = self._header.split(",", 1)
+            elif self._header.startswith("data:") and len(self._header) < 256:
+                return b""  # still inside the data URL header
+            else:
+                text = self._header
+            self._header = ""
+            self._header_done = True
+        data = self._pending + _BASE64_JUNK.sub("", text)
+        usable = len(data) - len(data) % 4
+        self._pending = data[usable:]
+        return self._decode(data[:usable])
+
+    def finish(self) -> bytes:
+        if not self._header_done:
+            self._header_done = True
+            return self.feed("")
+        data, self._pending = self._pending, ""
+        if not data:
+            return b""
+        return self._decode(data + "=" * (-len(data) % 4))
+
+    @staticmethod
+    def _decode(data: str) -> bytes:
+        try:
+            return base64.b64decode(data, validate=True)
+        except binascii.Error as e:
+            raise ValueError(f"Invalid base64 image data: {e}")
+
+
+def decode_base64_to_file(source, path: str, max_bytes: int = MAX_UPLOAD_BYTES, chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    Decode base64 image data (str, or a text/binary stream) into `path` incrementally.
+
+    Returns:
+        Number of decoded bytes written
+    """
+    decoder = Base64StreamDecoder()
+
+    def pieces():
+        if isinstance(source, str):
+            for start in range(0, len(source), chunk_size):
+                yield source[start:start + chunk_size]
+        else:
+            for piece in iter(lambda: source.read(chunk_size), b""):
+                if not piece:
+                    break
+                yield piece.decode("ascii", "ignore") if isinstance(piece, bytes) else piece
+
+    def chunks():
+        for piece in pieces():
+            decoded = decoder.feed(piece)
+            if decoded:
+                yield decoded
+        tail = decoder.finish()
+        if tail:
+            yield tail
+
+    return _write_capped(chunks(), path, max_bytes)
+
+
+def is_raw_image_request(mimetype: Optional[str]) -> bool:
+    """Whether the request body itself is the image (e.g. a Blob posted with fetch)"""
+    return bool(mimetype) and (mimetype.startswith("image/") or mimetype == "application/octet-stream")
+
+
+@contextmanager
+def working_in(directory: str):
+    """
+    Mark a staging directory as in use for the duration of the block.
+
+    Holds a shared flock on the directory itself, which the process releases
+    even if it dies; temp-file sweeps check it with dir_in_use() before
+    removing anything, however old the directory looks.
+    """
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH)
+        yield directory
+    finally:
+        os.close(fd)
+
+
+def dir_in_use(directory: str) -> bool:
+    """Whether some process is inside working_in(directory)"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return False
+    except BlockingIOError:
+        return True
+    finally:
+        os.close(fd)
@@ -0,0 +1,380 @@
+import os
+import json
+import zlib
+import fcntl
+import tempfile
+import threading
+from contextlib import contextmanager
+from collections import defaultdict
+from typing import Optional, Dict, Any, List, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; without it semantic search falls back to keyword search
+    np = None
+
+from utils.metadata_utils import get_store, BASE_DIR
+from utils.search_index import SEARCH_FIELDS, tokenize
+
+
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", os.path.join(BASE_DIR, "cache", "vectors"))
+VECTOR_EMBEDDER = os.getenv("VECTOR_EMBEDDER", "hashed-ngram")
+VECTOR_DIM = int(os.getenv("VECTOR_DIM", "512"))
+# Hash collisions give unrelated texts small similarities; hits below this are dropped
+VECTOR_MIN_SCORE = float(os.getenv("VECTOR_MIN_SCORE", "0.1"))
+
+# Rows scored per matrix product, bounding the temporary score matrix
+BLOCK_ROWS = 65536
+MIN_CAPACITY = 1024
+EMBED_BATCH = 1024
+
+# Feature weights of the hashed n-gram embedder
+WORD_WEIGHT = 1.0
+BIGRAM_WEIGHT = 0.7
+CHAR_WEIGHT = 1.0
+
+
+class HashedNgramEmbedder:
+    """
+    Offline text embedder using the hashing trick.
+
+    Words, word bigrams and character trigrams (per word, with boundary marks)
+    are hashed into `dim` signed buckets and the vector is L2-normalized. The
+    trigrams let different inflections and spellings ("sticker", "stickers",
+    "stickered") land close together without a model or a network call. CRC32
+    keeps vectors identical across processes and restarts.
+    """
+
+    name = "hashed-ngram"
+
+    def __init__(self, dim: int = VECTOR_DIM):
+        self.dim = dim
+
+    @property
+    def signature(self) -> str:
+        return f"{self.name}:{self.dim}"
+
+    def features(self, text: str) -> Dict[str, float]:
+        words = tokenize(text)
+        features: Dict[str, float] = defaultdict(float)
+        for word in words:
+            features["w:" + word] += WORD_WEIGHT
+            padded = f"<{word}>"
+            trigrams = [padded[i:i + 3] for i in range(len(padded) - 2)]
+            for trigram in trigrams:
+                # Spread each word's character weight over its trigrams so long words don't dominate
+                features["c:" + trigram] += CHAR_WEIGHT / len(trigrams)
+        for first, second in zip(words, words[1:]):
+            features[f"b:{first} {second}"] += BIGRAM_WEIGHT
+        return features
+
+    def embed(self, texts: List[str]):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, weight in self.features(text).items():
+                h = zlib.crc32(feature.encode("utf-8"))
+                vectors[row, h % self.dim] += weight if h & 0x80000000 else -weight
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+
+
+# Embedder name -> factory; anything with `signature`, `dim` and `embed(texts)` can be registered
+EMBEDDERS = {"hashed-ngram": HashedNgramEmbedder}
+
+
+def register_embedder(name: str, factory):
+    EMBEDDERS[name] = factory
+
+
+def get_embedder(name: str = VECTOR_EMBEDDER):
+    if name not in EMBEDDERS:
+        raise ValueError(f"Unknown embedder: {name}")
+    return EMBEDDERS[name]()
+
+
+def record_text(record: Dict[str, Any]) -> str:
+    """The text of a record that is embedded: the same fields keyword search indexes"""
+    parts = []
+    for field in SEARCH_FIELDS:
+        value = record.get(field)
+        if isinstance(value, (list, tuple)):
+            value = " ".join(str(v) for v in value)
+        if value:
+            parts.append(str(value))
+    return " ".join(parts)
+
+
+class VectorIndex:
+    """
+    Matrix of normalized record embeddings, memory-mapped from disk and shared by workers.
+
+    Row i of the float32 matrix file holds the embedding of `rows[i]`; deleted
+    rows are zeroed and reused. `index.json` records the row assignment, the
+    catalogue version the matrix reflects and the current matrix file. Writers
+    take an flock on the directory, so whichever worker syncs first applies
+    new catalogue changes and the others only re-read the row table. Growing
+    the matrix writes a new file, so readers still mapping the old one are
+    unaffected.
+    """
+
+    def __init__(self, directory: str = VECTOR_INDEX_DIR, embedder=None, source: str = ""):
+        self.directory = directory
+        self.embedder = embedder or get_embedder()
+        # Identifies the catalogue the vectors came from, so a different store forces a rebuild
+        self.source = source
+        self.meta_path = os.path.join(directory, "index.json")
+        self._lock = threading.RLock()
+        self.version = -1
+        self.rows: List[Optional[str]] = []
+        self.slots: Dict[str, int] = {}
+        self._free: List[int] = []
+        self.matrix = None
+        self.capacity = 0
+        self._file: Optional[str] = None
+        self._generation = 0
+
+    def __len__(self):
+        return len(self.slots)
+
+    @contextmanager
+    def _flock(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load_meta(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.meta_path, "r") as f:
+                meta = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if meta.get("embedder") != self.embedder.signature or meta.get("source") != self.source:
+            return None
+        if not os.path.exists(os.path.join(self.directory, meta.get("file", ""))):
+            return None
+        return meta
+
+    def _save_meta(self):
+        if self.matrix is not None:
+            self.matrix.flush()
+        meta = {
+            "embedder": self.embedder.signature,
+            "source": self.source,
+            "version": self.version,
+            "file": self._file,
+            "generation": self._generation,
+            "capacity": self.capacity,
+            "rows": self.rows,
+        }
+        tmp = tempfile.NamedTemporaryFile("w", delete=False, dir=self.directory, suffix=".tmp")
+        json.dump(meta, tmp)
+        tmp.close()
+        os.replace(tmp.name, self.meta_path)
+
+    def _adopt(self, meta: Dict[str, Any]):
+        """Take over the row table (and, if it changed, the matrix file) another process wrote"""
+        if meta["file"] != self._file or meta["capacity"] != self.capacity:
+            self.matrix = np.memmap(
+                os.path.join(self.directory, meta["file"]), dtype=np.float32, mode="r+",
+                shape=(meta["capacity"], self.embedder.dim),
+            )
+            self._file = meta["file"]
+            self.capacity = meta["capacity"]
+        self._generation = meta["generation"]
+        self.version = meta["version"]
+        self.rows = meta["rows"]
+        self.slots = {filename: i for i, filename in enumerate(self.rows) if filename is not None}
+        self._free = [i for i, filename in enumerate(self.rows) if filename is None]
+
+    def _allocate(self, capacity: int, keep_rows: int):
+        """Switch to a new, larger matrix file, copying the first `keep_rows` rows"""
+        self._generation += 1
+        name = f"vectors.{self._generation}.f32"
+        matrix = np.memmap(
+            os.path.join(self.directory, name), dtype=np.float32, mode="w+",
+            shape=(capacity, self.embedder.dim),
+        )
+        if self.matrix is not None and keep_rows:
+            matrix[:keep_rows] = self.matrix[:keep_rows]
+        old_file = self._file
+        self.matrix, self._file, self.capacity = matrix, name, capacity
+        if old_file and old_file != name:
+            try:
+                os.remove(os.path.join(self.directory, old_file))
+            except OSError:
+                pass
+
+    def _slot(self, filename: str) -> int:
+        slot = self.slots.get(filename)
+        if slot is not None:
+            return slot
+        if self._free:
+            slot = self._free.pop()
+            self.rows[slot] = filename
+        else:
+            if len(self.rows) >= self.capacity:
+                self._allocate(max(MIN_CAPACITY, self.capacity * 2), len(self.rows))
+            slot = len(self.rows)
+            self.rows.append(filename)
+        self.slots[filename] = slot
+        return slot
+
+    def upsert_many(self, records: List[Dict[str, Any]]):
+        records = [r for r in records if r.get("filename")]
+        with self._lock:
+            for start in range(0, len(records), EMBED_BATCH):
+                batch = records[start:start + EMBED_BATCH]
+                vectors = self.embedder.embed([record_text(r) for r in batch])
+                for record, vector in zip(batch, vectors):
+                    self.matrix[self._slot(record["filename"])] = vector
+
+    def remove(self, filename: str):
+        with self._lock:
+            slot = self.slots.pop(filename, None)
+            if slot is None:
+                return
+            self.matrix[slot] = 0.0
+            self.rows[slot] = None
+            self._free.append(slot)
+
+    def rebuild(self, records: List[Dict[str, Any]], version: int):
+        with self._lock:
+            self.rows, self.slots, self._free = [], {}, []
+            self._allocate(max(MIN_CAPACITY, len(records) * 5 // 4), 0)
+            self.upsert_many(records)
+            self.version = version
+
+    def apply_changes(self, changes: List[Dict[str, Any]]):
+        with self._lock:
+            latest: Dict[str, Dict[str, Any]] = {}
+            for change in changes:
+                latest[change["filename"]] = change
+            for filename, change in latest.items():
+                if change["op"] == "delete":
+                    self.remove(filename)
+            self.upsert_many([c["item"] for c in latest.values() if c["op"] != "delete"])
+            if changes:
+                self.version = changes[-1]["version"]
+
+    def sync(self, store) -> "VectorIndex":
+        """Bring the index up to the store's catalogue version, replaying only new changes"""
+        target = store.version()
+        if target == self.version:
+            return self
+        with self._lock, self._flock():
+            meta = self._load_meta()
+            if meta is not None and meta["version"] != self.version:
+                self._adopt(meta)
+            if meta is None:
+                # Read the version first so changes landing during the load are replayed later
+                version = store.version()
+                self.rebuild(store.all(), version)
+            elif self.version != target:
+                changes = store.changes_since(self.version)
+                if changes is None:
+                    version = store.version()
+                    self.rebuild(store.all(), version)
+                else:
+                    self.apply_changes(changes)
+            else:
+                return self
+            self._save_meta()
+        return self
+
+    def search_many(
+        self, queries: List[str], k: int = 10, min_score: float = VECTOR_MIN_SCORE,
+    ) -> List[List[Tuple[str, float]]]:
+        """
+        Cosine top-k for a batch of queries.
+
+        The matrix is scored in blocks of BLOCK_ROWS with one matrix product per
+        block for all queries, keeping a running top-k per query.
+
+        Returns:
+            For each query, up to `k` (filename, score) pairs scoring at least `min_score`, best first
+        """
+        query_vectors = self.embedder.embed(queries)
+        with self._lock:
+            rows = list(self.rows)
+            matrix = self.matrix
+        n = len(rows)
+        if not queries or matrix is None or n == 0 or k <= 0:
+            return [[] for _ in queries]
+
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        for start in range(0, n, BLOCK_ROWS):
+            block = np.asarray(matrix[start:min(n, start + BLOCK_ROWS)])
+            scores = query_vectors @ block.T
+            scores = np.concatenate([best_scores, scores], axis=1)
+            indices = np.concatenate(
+                [best_rows, np.broadcast_to(np.arange(start, start + block.shape[0]), (len(queries), block.shape[0]))],
+                axis=1,
+            )
+            if scores.shape[1] > k:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, top, axis=1)
+                indices = np.take_along_axis(indices, top, axis=1)
+            best_scores, best_rows = scores, indices
+
+        results = []
+        for scores, indices in zip(best_scores, best_rows):
+            order = np.argsort(-scores)
+            hits = []
+            for i in order:
+                filename = rows[indices[i]]
+                if filename is not None and scores[i] >= min_score and scores[i] > 0:
+                    hits.append((filename, round(float(scores[i]), 4)))
+            results.append(hits)
+        return results
+
+    def search(self, query: str, k: int = 10, min_score: float = VECTOR_MIN_SCORE) -> List[Tuple[str, float]]:
+        return self.search_many([query], k, min_score)[0]
+
+
+_vector_index: Optional[VectorIndex] = None
+_vector_index_lock = threading.RLock()
+
+
+def vector_search_available() -> bool:
+    return np is not None
+
+
+def get_vector_index() -> Optional[VectorIndex]:
+    """
+    Return the process-wide vector index, synced with the catalogue's change feed.
+
+    Returns None if NumPy is not installed.
+    """
+    global _vector_index
+    if np is None:
+        return None
+    store = get_store()
+    with _vector_index_lock:
+        if _vector_index is None:
+            _vector_index = VectorIndex(source=getattr(store, "path", ""))
+        return _vector_index.sync(store)
+
+
+def semantic_search(query: str, k: int = 10) -> Optional[List[Dict[str, Any]]]:
+    """
+    Records most similar to `query`, each with a cosine `score`.
+
+    Returns:
+        Up to `k` records, best first, or None if vector search is unavailable
+    """
+    index = get_vector_index()
+    if index is None:
+        return None
+    store = get_store()
+    results = []
+    for filename, score in index.search(query, k):
+        record = store.get(filename)
+        if record is not None:
+            results.append(dict(record, score=score))
+    return results
@@ -0,0 +1,173 @@
+"""Facet counters and the change feed of both metadata stores, through every write path."""
+import sqlite3
+
+import pytest
+
+from utils.metadata_utils import (
+    JsonMetadataStore, SqliteMetadataStore, FACET_DIMENSIONS, _count_facets, _split_statements
+)
+
+RECORDS = [
+    {"filename": "bag_1.jpg", "timestamp": "20260301_090000", "category": "bag", "color": "black"},
+    {"filename": "bag_2.jpg", "timestamp": "20260301_170000", "category": "bag", "color": "red"},
+    {"filename": "phone_1.jpg", "timestamp": "20260302_120000", "category": "phone", "color": "black"},
+    {"filename": "item_1.jpg", "timestamp": "20260303_080000", "category": "item"},
+]
+
+
+@pytest.fixture(params=["sqlite", "json"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        return SqliteMetadataStore(str(tmp_path / "metadata.db"), import_from=str(tmp_path / "missing.json"))
+    return JsonMetadataStore(str(tmp_path / "metadata.json"))
+
+
+def assert_facets(store, expected):
+    assert store.facets() == expected
+    # The counters always agree with a recount of the records themselves
+    assert store.facets() == _count_facets(store.all())
+
+
+def test_facets_start_empty(store):
+    assert store.facets() == {dimension: {} for dimension in FACET_DIMENSIONS}
+
+
+def test_facets_after_insert_many(store):
+    store.insert_many(RECORDS)
+    assert_facets(store, {
+        "category": {"bag": 2, "phone": 1, "item": 1},
+        "color": {"black": 2, "red": 1, "": 1},
+        "day": {"20260301": 2, "20260302": 1, "20260303": 1},
+    })
+
+
+def test_facets_after_update_changing_category(store):
+    store.insert_many(RECORDS)
+    store.update("phone_1.jpg", {"category": "bag", "color": "blue"})
+    assert_facets(store, {
+        "category": {"bag": 3, "item": 1},
+        "color": {"black": 1, "red": 1, "blue": 1, "": 1},
+        "day": {"20260301": 2, "20260302": 1, "20260303": 1},
+    })
+
+
+def test_facets_after_delete_many(store):
+    store.insert_many(RECORDS)
+    removed = store.delete_many(["bag_1.jpg", "item_1.jpg", "not_there.jpg"])
+    assert sorted(r["filename"] for r in removed) == ["bag_1.jpg", "item_1.jpg"]
+    assert_facets(store, {
+        "category": {"bag": 1, "phone": 1},
+        "color": {"black": 1, "red": 1},
+        "day": {"20260301": 1, "20260302": 1},
+    })
+
+
+def test_facets_after_replace_all(store):
+    store.insert_many(RECORDS)
+    store.replace_all([{"filename": "keys_1.jpg", "timestamp": "20260310_100000", "category": "keys", "color": "silver"}])
+    assert_facets(store, {
+        "category": {"keys": 1},
+        "color": {"silver": 1},
+        "day": {"20260310": 1},
+    })
+
+
+def test_rebuild_facets_matches_counters(store):
+    store.insert_many(RECORDS)
+    store.update("bag_2.jpg", {"category": "phone"})
+    store.delete_many(["item_1.jpg"])
+    before = store.facets()
+    assert store.rebuild_facets() == before
+    assert_facets(store, before)
+
+
+def test_rebuild_facets_repairs_drift(tmp_path):
+    store = SqliteMetadataStore(str(tmp_path / "metadata.db"), import_from=str(tmp_path / "missing.json"))
+    store.insert_many(RECORDS)
+    with sqlite3.connect(store.path) as conn:
+        conn.execute("UPDATE facets SET count = 99 WHERE dimension = 'category' AND value = 'bag'")
+    assert store.facets()["category"]["bag"] == 99
+    assert store.rebuild_facets() == _count_facets(store.all())
+
+
+def test_facets_migration_counts_existing_records(tmp_path):
+    path = str(tmp_path / "metadata.db")
+    store = SqliteMetadataStore(path, import_from=str(tmp_path / "missing.json"))
+    store.insert_many(RECORDS)
+    facets_step = next(i for i, script in enumerate(SqliteMetadataStore.MIGRATIONS) if "CREATE TABLE IF NOT EXISTS facets" in script)
+    # Roll the database back to the schema before the facets migration
+    with sqlite3.connect(path) as conn:
+        for (trigger,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall():
+            conn.execute(f"DROP TRIGGER {trigger}")
+        conn.execute("DROP TABLE facets")
+        conn.execute(f"PRAGMA user_version = {facets_step}")
+
+    upgraded = SqliteMetadataStore(path, import_from=str(tmp_path / "missing.json"))
+    assert upgraded.facets() == _count_facets(RECORDS)
+    # The triggers are back, so later writes keep the counters exact
+    upgraded.delete_many(["bag_1.jpg"])
+    assert_facets(upgraded, _count_facets(RECORDS[1:]))
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == len(SqliteMetadataStore.MIGRATIONS)
+
+
+def test_split_statements_keeps_trigger_bodies_whole():
+    script = """
+        CREATE TABLE t (a INTEGER);
+        CREATE TRIGGER t_after_insert AFTER INSERT ON t BEGIN
+            UPDATE t SET a = a + 1 WHERE a = NEW.a;
+            DELETE FROM t WHERE a < 0;
+        END;
+        ;
+    """
+    statements = _split_statements(script)
+    assert len(statements) == 2
+    assert statements[1].startswith("CREATE TRIGGER") and statements[1].endswith("END;")
+
+
+def test_changes_since_replays_adds_updates_and_deletes(store):
+    start = store.version()
+    store.insert_many(RECORDS[:2])
+    after_insert = store.version()
+    store.update("bag_1.jpg", {"color": "green"})
+    store.delete_many(["bag_2.jpg"])
+
+    changes = store.changes_since(start)
+    assert [(c["op"], c["filename"]) for c in changes] == [
+        ("add", "bag_1.jpg"),
+        ("update", "bag_1.jpg"),
+        ("delete", "bag_2.jpg"),
+    ]
+    # Additions and updates carry the record as it is now; an item deleted since is only a tombstone
+    assert changes[0]["item"]["color"] == "green"
+    assert changes[1]["item"]["color"] == "green"
+    assert changes[2]["deleted"] is True
+    assert [c["version"] for c in changes] == sorted(c["version"] for c in changes)
+    assert changes[-1]["version"] == store.version()
+
+    assert [(c["op"], c["filename"]) for c in store.changes_since(after_insert)] == [
+        ("update", "bag_1.jpg"),
+        ("delete", "bag_2.jpg"),
+    ]
+
+
+def test_changes_since_current_version_is_empty(store):
+    store.insert_many(RECORDS)
+    assert store.changes_since(store.version()) == []
+
+
+def test_changes_since_needs_reset(store):
+    store.insert_many(RECORDS)
+    before_reset = store.version()
+    store.replace_all(RECORDS[:1])
+    # History before a replace_all cannot be replayed
+    assert store.changes_since(before_reset) is None
+    # Nor can a version the store has never reached
+    assert store.changes_since(store.version() + 5) is None
+
+
+def test_changes_since_over_limit_needs_reset(store):
+    start = store.version()
+    store.insert_many(RECORDS)
+    assert store.changes_since(start, limit=2) is None
+    assert len(store.changes_since(start, limit=len(RECORDS))) == len(RECORDS)